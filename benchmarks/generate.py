@@ -0,0 +1,178 @@
+import datetime
+import json
+import random
+from typing import Any, Iterator
+
+PROJECT_STATUSES = ["identification", "preparation", "implementation", "completion"]
+PROJECT_TYPES = ["construction", "rehabilitation", "replacement", "expansion"]
+PROJECT_SECTORS = [
+    ["transport", "transport.road"],
+    ["transport", "transport.rail"],
+    ["water"],
+    ["energy"],
+    ["education"],
+    ["health"],
+]
+CONTRACTING_PROCESS_STATUSES = ["pre-award", "active", "closed"]
+CONTRACT_NATURES = ["design", "construction", "supervision"]
+WORDS = (
+    "road bridge school hospital water pipeline rehabilitation construction "
+    "district regional national phase lot upgrade network station supply "
+    "maintenance expansion rural urban works design supervision"
+).split()
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def _date(rng: random.Random, start_year: int, end_year: int) -> str:
+    start = datetime.datetime(start_year, 1, 1, tzinfo=datetime.UTC)
+    days = (datetime.datetime(end_year, 1, 1, tzinfo=datetime.UTC) - start).days
+    date = start + datetime.timedelta(days=rng.randrange(days))
+    return date.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _organization(rng: random.Random, index: int, roles: list[str]) -> dict[str, Any]:
+    return {
+        "id": f"org-{index}",
+        "name": f"{_text(rng, 2)} Authority {index}",
+        "roles": roles,
+        "address": {
+            "streetAddress": f"{rng.randrange(1, 999)} {_text(rng, 1)} Street",
+            "locality": _text(rng, 1),
+            "region": _text(rng, 1),
+            "postalCode": str(rng.randrange(10000, 99999)),
+            "countryName": "Benchmarkland",
+        },
+        "contactPoint": {
+            "name": _text(rng, 2),
+            "email": f"contact{index}@example.com",
+            "telephone": f"+1 555 {rng.randrange(1000000, 9999999)}",
+        },
+    }
+
+
+def _contracting_process(
+    rng: random.Random, project_index: int, index: int, supplier: dict[str, Any]
+) -> dict[str, Any]:
+    value = round(rng.uniform(10_000, 5_000_000), 2)
+    return {
+        "id": f"{project_index}-{index}",
+        "summary": {
+            "ocid": f"ocds-bench-{project_index}-{index}",
+            "title": _text(rng, 4),
+            "description": _text(rng, 12),
+            "status": rng.choice(CONTRACTING_PROCESS_STATUSES),
+            "nature": [rng.choice(CONTRACT_NATURES)],
+            "tender": {
+                "procurementMethod": "open",
+                "costEstimate": {"amount": value, "currency": "USD"},
+                "numberOfTenderers": rng.randrange(1, 12),
+                "tenderers": [{"id": supplier["id"], "name": supplier["name"]}],
+            },
+            "suppliers": [{"id": supplier["id"], "name": supplier["name"]}],
+            "contractValue": {"amount": value, "currency": "USD"},
+            "contractPeriod": {
+                "startDate": _date(rng, 2018, 2022),
+                "endDate": _date(rng, 2023, 2030),
+            },
+        },
+    }
+
+
+def generate_project(rng: random.Random, index: int) -> dict[str, Any]:
+    """
+    Returns a project with the nesting typical of published OC4IDS data: parties
+    with addresses and contact points, located geometries, contracting processes
+    with tender and contract summaries, and documents.
+    """
+    public_authority = _organization(rng, index * 10, ["publicAuthority"])
+    funder = _organization(rng, index * 10 + 1, ["funder"])
+    suppliers = [
+        _organization(rng, index * 10 + 2 + i, ["supplier"])
+        for i in range(rng.randrange(1, 4))
+    ]
+    budget = round(rng.uniform(100_000, 50_000_000), 2)
+    return {
+        "id": f"oc4ids-bench-{index}",
+        "updated": _date(rng, 2024, 2026),
+        "title": _text(rng, 5),
+        "description": _text(rng, 30),
+        "status": rng.choice(PROJECT_STATUSES),
+        "type": rng.choice(PROJECT_TYPES),
+        "sector": rng.choice(PROJECT_SECTORS),
+        "purpose": _text(rng, 15),
+        "period": {
+            "startDate": _date(rng, 2018, 2022),
+            "endDate": _date(rng, 2023, 2030),
+        },
+        "budget": {"amount": {"amount": budget, "currency": "USD"}},
+        "locations": [
+            {
+                "id": str(i),
+                "description": _text(rng, 4),
+                "geometry": {
+                    "type": "Point",
+                    "coordinates": [
+                        round(rng.uniform(-180, 180), 6),
+                        round(rng.uniform(-90, 90), 6),
+                    ],
+                },
+            }
+            for i in range(rng.randrange(1, 4))
+        ],
+        "publicAuthority": {
+            "id": public_authority["id"],
+            "name": public_authority["name"],
+        },
+        "parties": [public_authority, funder, *suppliers],
+        "contractingProcesses": [
+            _contracting_process(rng, index, i, supplier)
+            for i, supplier in enumerate(suppliers)
+        ],
+        "documents": [
+            {
+                "id": str(i),
+                "title": _text(rng, 3),
+                "description": _text(rng, 10),
+                "url": f"https://example.com/projects/{index}/documents/{i}.pdf",
+                "format": "application/pdf",
+                "datePublished": _date(rng, 2018, 2026),
+            }
+            for i in range(rng.randrange(0, 4))
+        ],
+    }
+
+
+def generate_projects(count: int, seed: int = 0) -> Iterator[dict[str, Any]]:
+    rng = random.Random(seed)
+    for index in range(count):
+        yield generate_project(rng, index)
+
+
+def package_metadata() -> dict[str, Any]:
+    return {
+        "uri": "https://example.com/benchmark.json",
+        "publishedDate": "2026-01-01T00:00:00Z",
+        "version": "0.9",
+        "publisher": {"name": "Benchmark publisher"},
+        "license": "https://creativecommons.org/licenses/by/4.0/",
+    }
+
+
+def write_package(path: str, count: int, seed: int = 0) -> int:
+    """
+    Writes a project package with `count` projects to `path`, one project at a time,
+    so packages larger than memory can be generated. Returns the size of the file.
+    The same seed always gives the same file.
+    """
+    metadata = json.dumps(package_metadata())
+    with open(path, "w") as file:
+        file.write(metadata[:-1] + ', "projects": [')
+        for index, project in enumerate(generate_projects(count, seed)):
+            if index:
+                file.write(", ")
+            file.write(json.dumps(project))
+        file.write("]}")
+        return file.tell()
@@ -0,0 +1,384 @@
+"""
+Times each stage of processing a dataset on generated OC4IDS packages, and reports
+throughput and peak memory as JSON.
+
+    python -m benchmarks.run --projects 100 1000 10000 --output results.json
+
+Each stage runs in a fresh process, so its peak memory is not inflated by earlier
+stages. Downloads are served by a local HTTP server, uploads go to a local stand-in
+for the bucket, and metadata is saved to SQLite unless `--database-url` is given.
+"""
+
+import argparse
+import contextlib
+import datetime
+import functools
+import hashlib
+import http.server
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Iterator, Optional
+
+from benchmarks.generate import package_metadata, write_package
+
+STAGES = ["download", "validate", "write", "transform", "upload", "save_metadata"]
+
+
+class LocalBucket:
+    """
+    Stands in for the S3 client used by `storage`, storing objects in a directory.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self._parts: dict[str, dict[int, bytes]] = {}
+
+    def _path(self, key: str) -> str:
+        path = os.path.join(self.directory, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def head_object(self, Bucket: Any, Key: str) -> dict[str, Any]:
+        raise KeyError(Key)
+
+    def upload_file(self, Filename: str, Bucket: Any, Key: str, **kwargs: Any) -> None:
+        shutil.copyfile(Filename, self._path(Key))
+
+    def put_object(self, Body: bytes, Bucket: Any, Key: str, **kwargs: Any) -> None:
+        with open(self._path(Key), "wb") as file:
+            file.write(Body)
+
+    def create_multipart_upload(
+        self, Bucket: Any, Key: str, **kwargs: Any
+    ) -> dict[str, Any]:
+        upload_id = uuid.uuid4().hex
+        self._parts[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(
+        self, Bucket: Any, Key: str, UploadId: str, PartNumber: int, Body: bytes
+    ) -> dict[str, Any]:
+        self._parts[UploadId][PartNumber] = Body
+        return {"ETag": hashlib.md5(Body, usedforsecurity=False).hexdigest()}
+
+    def complete_multipart_upload(
+        self, Bucket: Any, Key: str, UploadId: str, MultipartUpload: Any
+    ) -> None:
+        parts = self._parts.pop(UploadId)
+        with open(self._path(Key), "wb") as file:
+            for part in MultipartUpload["Parts"]:
+                file.write(parts[part["PartNumber"]])
+
+    def abort_multipart_upload(self, Bucket: Any, Key: str, UploadId: str) -> None:
+        self._parts.pop(UploadId, None)
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+@contextlib.contextmanager
+def _serve(directory: str) -> Iterator[str]:
+    handler = functools.partial(_QuietHandler, directory=directory)
+    with http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler) as server:
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            yield f"http://127.0.0.1:{server.server_port}"
+        finally:
+            server.shutdown()
+
+
+def _max_rss(who: int) -> int:
+    max_rss = resource.getrusage(who).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def _get_size(*paths: Optional[str]) -> int:
+    size = 0
+    for path in paths:
+        if path and os.path.isdir(path):
+            for directory, _, file_names in os.walk(path):
+                size += sum(
+                    os.path.getsize(os.path.join(directory, file_name))
+                    for file_name in file_names
+                )
+        elif path and os.path.exists(path):
+            size += os.path.getsize(path)
+    return size
+
+
+def _load_json(path: str) -> Any:
+    with open(path) as file:
+        return json.load(file)
+
+
+def _prepare_artifacts(package_path: str, work_dir: str) -> str:
+    """
+    Returns the path of the JSON file in the working directory, transforming it if
+    the CSV and Excel files are missing.
+    """
+    from oc4ids_datastore_pipeline.pipeline import transform_to_csv_and_xlsx
+
+    json_path = os.path.join(work_dir, "benchmark.json")
+    if not os.path.exists(json_path):
+        shutil.copyfile(package_path, json_path)
+    if not os.path.exists(os.path.join(work_dir, "benchmark.xlsx")):
+        transform_to_csv_and_xlsx(json_path)
+    return json_path
+
+
+def _run_stage(
+    stage: str,
+    package_path: str,
+    work_dir: str,
+    projects: int,
+    database_url: str,
+    metadata_rows: int,
+) -> dict[str, Any]:
+    """
+    Runs the stage once in this process, returning the time taken, the work done
+    and the memory used. Setup, such as loading the package, is not timed.
+    """
+    from oc4ids_datastore_pipeline import pipeline, registry, storage
+    from oc4ids_datastore_pipeline.database import Base, get_engine
+
+    logging.getLogger().setLevel(logging.WARNING)
+    package_size = os.path.getsize(package_path)
+    items, item_unit, size = projects, "projects", package_size
+    run: Callable[[], Any]
+
+    with contextlib.ExitStack() as stack:
+        if stage == "download":
+            base_url = stack.enter_context(_serve(os.path.dirname(package_path)))
+            url = f"{base_url}/{os.path.basename(package_path)}"
+
+            def run() -> None:
+                downloaded = pipeline.download_json("benchmark", url)
+                if downloaded and downloaded.source_path:
+                    os.remove(downloaded.source_path)
+
+        elif stage == "validate":
+            json_data = _load_json(package_path)
+
+            def run() -> None:
+                pipeline.validate_json("benchmark", json_data)
+
+        elif stage == "write":
+            json_data = _load_json(package_path)
+            output_path = os.path.join(work_dir, "benchmark.json")
+
+            def run() -> None:
+                pipeline.write_json_to_file(output_path, json_data)
+
+        elif stage == "transform":
+            json_path = os.path.join(work_dir, "benchmark.json")
+            shutil.copyfile(package_path, json_path)
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(work_dir, "benchmark.xlsx"))
+            shutil.rmtree(os.path.join(work_dir, "benchmark"), ignore_errors=True)
+
+            def run() -> None:
+                pipeline.transform_to_csv_and_xlsx(json_path)
+
+        elif stage == "upload":
+            json_path = _prepare_artifacts(package_path, work_dir)
+            csv_path = os.path.join(work_dir, "benchmark")
+            xlsx_path = os.path.join(work_dir, "benchmark.xlsx")
+            size = _get_size(json_path, csv_path, xlsx_path)
+            bucket_dir = os.path.join(work_dir, "bucket")
+            shutil.rmtree(bucket_dir, ignore_errors=True)
+            os.environ["ENABLE_UPLOAD"] = "1"
+            os.environ["UPLOAD_SKIP_UNCHANGED"] = "0"
+            storage._client = LocalBucket(bucket_dir)
+
+            def run() -> None:
+                urls = storage.upload_files(
+                    "benchmark",
+                    json_path=json_path,
+                    csv_path=csv_path,
+                    xlsx_path=xlsx_path,
+                )
+                if None in urls:
+                    raise Exception(f"Upload failed: {urls}")
+
+        elif stage == "save_metadata":
+            os.environ["DATABASE_URL"] = database_url
+            Base.metadata.create_all(get_engine())
+            registry._license_mappings = {}
+            json_data = package_metadata()
+            items, item_unit, size = metadata_rows, "datasets", 0
+
+            def run() -> None:
+                for index in range(metadata_rows):
+                    pipeline.save_dataset_metadata(
+                        dataset_id=f"benchmark-{index}",
+                        source_url=f"https://example.com/benchmark-{index}.json",
+                        publisher_country="XX",
+                        json_data=json_data,
+                        json_url=None,
+                        csv_url=None,
+                        xlsx_url=None,
+                        portal_title=None,
+                        portal_url=None,
+                    )
+
+        else:
+            raise ValueError(f"Unknown stage {stage}")
+
+        baseline_rss = _max_rss(resource.RUSAGE_SELF)
+        start = time.perf_counter()
+        run()
+        seconds = time.perf_counter() - start
+        return {
+            "seconds": seconds,
+            "items": items,
+            "item_unit": item_unit,
+            "bytes": size,
+            "items_per_second": items / seconds if seconds else None,
+            "bytes_per_second": size / seconds if seconds and size else None,
+            "baseline_rss_bytes": baseline_rss,
+            "peak_rss_bytes": _max_rss(resource.RUSAGE_SELF),
+            "children_peak_rss_bytes": _max_rss(resource.RUSAGE_CHILDREN),
+        }
+
+
+def _get_environment(seed: int) -> dict[str, Any]:
+    try:
+        commit: Optional[str] = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        commit = None
+    return {
+        "started_at": datetime.datetime.now(datetime.UTC).isoformat(),
+        "git_commit": commit,
+        "python_version": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": seed,
+    }
+
+
+def run_benchmarks(
+    projects: list[int],
+    stages: list[str],
+    seed: int,
+    repeat: int,
+    work_dir: str,
+    database_url: Optional[str],
+    metadata_rows: int,
+) -> dict[str, Any]:
+    database_url = database_url or f"sqlite:///{os.path.join(work_dir, 'bench.db')}"
+    results = []
+    with ProcessPoolExecutor(
+        max_workers=1,
+        mp_context=multiprocessing.get_context("spawn"),
+        max_tasks_per_child=1,
+    ) as executor:
+        for count in projects:
+            size_dir = os.path.join(work_dir, str(count))
+            os.makedirs(size_dir, exist_ok=True)
+            package_path = os.path.join(size_dir, "package.json")
+            start = time.perf_counter()
+            package_size = write_package(package_path, count, seed)
+            print(
+                f"Generated {count} projects ({package_size} bytes) in "
+                f"{time.perf_counter() - start:.2f}s",
+                file=sys.stderr,
+            )
+            for stage in stages:
+                for index in range(repeat):
+                    result: dict[str, Any] = {
+                        "stage": stage,
+                        "projects": count,
+                        "package_bytes": package_size,
+                        "repeat": index,
+                    }
+                    try:
+                        result |= executor.submit(
+                            _run_stage,
+                            stage,
+                            package_path,
+                            size_dir,
+                            count,
+                            database_url,
+                            metadata_rows,
+                        ).result()
+                        print(
+                            f"{stage} {count} projects: {result['seconds']:.3f}s, "
+                            f"peak {result['peak_rss_bytes'] / 2**20:.0f} MiB",
+                            file=sys.stderr,
+                        )
+                    except Exception as e:
+                        result["error"] = str(e)
+                        print(f"{stage} {count} projects: failed: {e}", file=sys.stderr)
+                    results.append(result)
+    return {"environment": _get_environment(seed), "results": results}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--projects",
+        type=int,
+        nargs="+",
+        default=[100, 1000, 10000],
+        help="Number of projects in each generated package (default: 100 1000 10000)",
+    )
+    parser.add_argument(
+        "--stages", nargs="+", choices=STAGES, default=STAGES, help="Stages to time"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1, help="Runs of each stage")
+    parser.add_argument(
+        "--output", default="benchmark-results.json", help="JSON file for results"
+    )
+    parser.add_argument(
+        "--work-dir", help="Directory for generated files (default: a temporary one)"
+    )
+    parser.add_argument(
+        "--database-url", help="Database for save_metadata (default: SQLite)"
+    )
+    parser.add_argument(
+        "--metadata-rows",
+        type=int,
+        default=100,
+        help="Datasets saved by save_metadata (default: 100)",
+    )
+    args = parser.parse_args()
+
+    with contextlib.ExitStack() as stack:
+        work_dir = args.work_dir or stack.enter_context(
+            tempfile.TemporaryDirectory(prefix="oc4ids-benchmark-")
+        )
+        report = run_benchmarks(
+            projects=args.projects,
+            stages=args.stages,
+            seed=args.seed,
+            repeat=args.repeat,
+            work_dir=work_dir,
+            database_url=args.database_url,
+            metadata_rows=args.metadata_rows,
+        )
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Wrote results to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
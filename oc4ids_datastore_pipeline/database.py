@@ -1,16 +1,24 @@
 import datetime
 import logging
 import os
-from typing import Optional
+import threading
+from typing import Any, Collection, Optional, Sequence
 
 from sqlalchemy import (
+    JSON,
+    BigInteger,
     DateTime,
     Engine,
+    Float,
+    ForeignKey,
+    Integer,
     String,
     create_engine,
     delete,
+    inspect,
     select,
 )
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import DeclarativeBase, Mapped, Session, mapped_column
 
 logger = logging.getLogger(__name__)
@@ -38,6 +46,70 @@ class Dataset(Base):
     updated_at: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=True))
     portal_url: Mapped[Optional[str]] = mapped_column(String, nullable=True)
     portal_title: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    http_etag: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    http_last_modified: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    content_hash: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    download_url: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    last_checked_at: Mapped[Optional[datetime.datetime]] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+
+
+class ValidationResult(Base):
+    __tablename__ = "validation_result"
+
+    content_hash: Mapped[str] = mapped_column(String, primary_key=True)
+    validator_version: Mapped[str] = mapped_column(String, primary_key=True)
+    errors_count: Mapped[int] = mapped_column(Integer)
+    errors: Mapped[list[Any]] = mapped_column(JSON)
+    created_at: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=True))
+
+
+class PipelineRun(Base):
+    __tablename__ = "pipeline_run"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    started_at: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=True))
+    finished_at: Mapped[Optional[datetime.datetime]] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+    dataset_count: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    error_count: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+
+
+class PipelineRunDataset(Base):
+    __tablename__ = "pipeline_run_dataset"
+
+    run_id: Mapped[int] = mapped_column(
+        ForeignKey("pipeline_run.id", ondelete="CASCADE"), primary_key=True
+    )
+    dataset_id: Mapped[str] = mapped_column(String, primary_key=True)
+    started_at: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=True))
+    finished_at: Mapped[Optional[datetime.datetime]] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+    outcome: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    error_message: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    download_seconds: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    validate_seconds: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    write_seconds: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    transform_seconds: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    upload_seconds: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    save_metadata_seconds: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    downloaded_bytes: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    project_count: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    json_bytes: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    csv_bytes: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    xlsx_bytes: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+
+
+class RegistryResponse(Base):
+    __tablename__ = "registry_response"
+
+    url: Mapped[str] = mapped_column(String, primary_key=True)
+    http_etag: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    http_last_modified: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    content: Mapped[Any] = mapped_column(JSON)
 
 
 def get_engine() -> Engine:
@@ -53,14 +125,188 @@ def save_dataset(dataset: Dataset) -> None:
         session.commit()
 
 
+def _get_insert(dialect_name: str) -> Any:
+    if dialect_name == "postgresql":
+        return postgresql.insert
+    if dialect_name == "sqlite":
+        return sqlite.insert
+    return None
+
+
+def upsert_datasets(datasets: Sequence[Dataset]) -> None:
+    """
+    Saves the datasets with one INSERT ... ON CONFLICT (dataset_id) DO UPDATE per set
+    of assigned columns, in one transaction. Like merge, only the columns assigned on
+    each dataset are updated.
+    """
+    engine = get_engine()
+    insert = _get_insert(engine.dialect.name)
+    with Session(engine) as session:
+        if insert is None:
+            for dataset in datasets:
+                session.merge(dataset)
+            session.commit()
+            return
+        rows_by_columns: dict[tuple[str, ...], list[dict[str, Any]]] = {}
+        for dataset in datasets:
+            state = inspect(dataset)
+            row = {
+                column.key: state.dict[column.key]
+                for column in Dataset.__table__.columns
+                if column.key in state.dict
+            }
+            rows_by_columns.setdefault(tuple(row), []).append(row)
+        for columns, rows in rows_by_columns.items():
+            statement = insert(Dataset).values(rows)
+            statement = statement.on_conflict_do_update(
+                index_elements=[Dataset.dataset_id],
+                set_={
+                    column: statement.excluded[column]
+                    for column in columns
+                    if column != "dataset_id"
+                },
+            )
+            session.execute(statement)
+        session.commit()
+
+
+class DatasetBatchWriter:
+    """
+    Collects datasets saved during a run and upserts them in batches of up to
+    `batch_size`, so each batch costs one statement and one commit. Safe to share
+    between threads.
+
+    If a batch fails, its datasets are saved one by one, and the ids of those that
+    still fail are recorded in `errors` with the error message.
+    """
+
+    def __init__(self, batch_size: int) -> None:
+        self.batch_size = batch_size
+        self.errors: dict[str, str] = {}
+        self._datasets: dict[str, Dataset] = {}
+        self._lock = threading.Lock()
+
+    def add(self, dataset: Dataset) -> None:
+        with self._lock:
+            self._datasets[dataset.dataset_id] = dataset
+            if len(self._datasets) < self.batch_size:
+                return
+            datasets = list(self._datasets.values())
+            self._datasets.clear()
+        self._write(datasets)
+
+    def flush(self) -> None:
+        with self._lock:
+            datasets = list(self._datasets.values())
+            self._datasets.clear()
+        if datasets:
+            self._write(datasets)
+
+    def _write(self, datasets: list[Dataset]) -> None:
+        logger.info(f"Saving metadata for {len(datasets)} datasets")
+        try:
+            upsert_datasets(datasets)
+            return
+        except Exception as e:
+            logger.warning(f"Failed to save batch of datasets with error {e}")
+        for dataset in datasets:
+            try:
+                save_dataset(dataset)
+            except Exception as e:
+                with self._lock:
+                    self.errors[dataset.dataset_id] = str(e)
+
+
+def get_dataset(dataset_id: str) -> Optional[Dataset]:
+    with Session(get_engine()) as session:
+        return session.get(Dataset, dataset_id)
+
+
 def delete_dataset(dataset_id: str) -> None:
     with Session(get_engine()) as session:
         session.execute(delete(Dataset).where(Dataset.dataset_id == dataset_id))
         session.commit()
 
 
+def delete_datasets(dataset_ids: Collection[str]) -> None:
+    with Session(get_engine()) as session:
+        session.execute(delete(Dataset).where(Dataset.dataset_id.in_(dataset_ids)))
+        session.commit()
+
+
 def get_dataset_ids() -> list[str]:
     with Session(get_engine()) as session:
         return [
             dataset_id for dataset_id in session.scalars(select(Dataset.dataset_id))
         ]
+
+
+def get_validation_result(
+    content_hash: str, validator_version: str
+) -> Optional[ValidationResult]:
+    with Session(get_engine()) as session:
+        return session.get(ValidationResult, (content_hash, validator_version))
+
+
+def save_validation_result(validation_result: ValidationResult) -> None:
+    with Session(get_engine()) as session:
+        session.merge(validation_result)
+        session.commit()
+
+
+def prune_validation_results(created_before: datetime.datetime) -> int:
+    """
+    Deletes validation results created before the given time, unless they are for
+    the content of a stored dataset. Returns the number of results deleted.
+    """
+    with Session(get_engine()) as session:
+        result = session.execute(
+            delete(ValidationResult).where(
+                ValidationResult.created_at < created_before,
+                ValidationResult.content_hash.not_in(
+                    select(Dataset.content_hash).where(
+                        Dataset.content_hash.is_not(None)
+                    )
+                ),
+            )
+        )
+        session.commit()
+        return int(result.rowcount)
+
+
+def get_registry_responses() -> list[RegistryResponse]:
+    with Session(get_engine()) as session:
+        return list(session.scalars(select(RegistryResponse)))
+
+
+def save_registry_responses(registry_responses: Sequence[RegistryResponse]) -> None:
+    """
+    Replaces the saved registry responses with the given ones, in one transaction.
+    """
+    with Session(get_engine()) as session:
+        session.execute(delete(RegistryResponse))
+        session.add_all(registry_responses)
+        session.commit()
+
+
+def start_pipeline_run(started_at: datetime.datetime) -> int:
+    with Session(get_engine()) as session:
+        pipeline_run = PipelineRun(started_at=started_at)
+        session.add(pipeline_run)
+        session.commit()
+        return pipeline_run.id
+
+
+def finish_pipeline_run(
+    run_id: int,
+    finished_at: datetime.datetime,
+    error_count: int,
+    run_datasets: Sequence[PipelineRunDataset],
+) -> None:
+    with Session(get_engine()) as session:
+        pipeline_run = session.get_one(PipelineRun, run_id)
+        pipeline_run.finished_at = finished_at
+        pipeline_run.dataset_count = len(run_datasets)
+        pipeline_run.error_count = error_count
+        session.add_all(run_datasets)
+        session.commit()
@@ -0,0 +1,141 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+_host_limiters: dict[str, "_HostLimiter"] = {}
+_host_limiters_lock = threading.Lock()
+
+
+class _HostLimiter:
+    """
+    Limits the number of requests to a host that are in progress at the same time,
+    and optionally how many are started each second.
+    """
+
+    def __init__(self, max_concurrency: int, max_requests_per_second: float):
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._interval = 1 / max_requests_per_second if max_requests_per_second else 0
+        self._next_start = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        self._semaphore.acquire()
+        if not self._interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self._interval
+        if start > now:
+            time.sleep(start - now)
+
+    def release(self) -> None:
+        self._semaphore.release()
+
+
+def _get_max_connections_per_host() -> int:
+    return int(os.environ.get("HTTP_MAX_CONNECTIONS_PER_HOST", "10"))
+
+
+def get_session() -> requests.Session:
+    """
+    Returns a session shared by the whole process, so connections to each host are
+    kept alive and reused. Requests that fail with a connection error, or with a
+    status code in RETRY_STATUS_CODES, are retried with exponential backoff.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(
+                total=int(os.environ.get("HTTP_RETRIES", "3")),
+                backoff_factor=float(os.environ.get("HTTP_BACKOFF_FACTOR", "0.5")),
+                status_forcelist=RETRY_STATUS_CODES,
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(
+                pool_maxsize=_get_max_connections_per_host(), max_retries=retry
+            )
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+
+def _get_host_limiter(url: str) -> _HostLimiter:
+    host = urlsplit(url).netloc
+    with _host_limiters_lock:
+        if host not in _host_limiters:
+            _host_limiters[host] = _HostLimiter(
+                _get_max_connections_per_host(),
+                float(os.environ.get("HTTP_MAX_REQUESTS_PER_SECOND_PER_HOST", "0")),
+            )
+        return _host_limiters[host]
+
+
+def _get_timeout() -> tuple[float, float]:
+    return (
+        float(os.environ.get("HTTP_CONNECT_TIMEOUT", "10")),
+        float(os.environ.get("HTTP_READ_TIMEOUT", "60")),
+    )
+
+
+def http_request(method: str, url: str, **kwargs: Any) -> requests.Response:
+    """
+    Sends the request with the shared session, waiting for a free slot for the host.
+    The connect and read timeouts from the environment are used unless `timeout` is
+    given.
+
+    For streamed responses, the slot is held until the response is closed, so the
+    caller must close it, e.g. with `with response:`.
+    """
+    kwargs.setdefault("timeout", _get_timeout())
+    limiter = _get_host_limiter(url)
+    limiter.acquire()
+    try:
+        response = get_session().request(method, url, **kwargs)
+    except Exception:
+        limiter.release()
+        raise
+    if not kwargs.get("stream"):
+        limiter.release()
+        return response
+    close = response.close
+    released = False
+
+    def close_and_release() -> None:
+        nonlocal released
+        try:
+            close()
+        finally:
+            if not released:
+                released = True
+                limiter.release()
+
+    response.close = close_and_release  # type: ignore[method-assign]
+    return response
+
+
+def http_get(url: str, **kwargs: Any) -> requests.Response:
+    return http_request("GET", url, **kwargs)
+
+
+def http_head(url: str, **kwargs: Any) -> requests.Response:
+    return http_request("HEAD", url, **kwargs)
+
+
+def http_post(url: str, **kwargs: Any) -> requests.Response:
+    return http_request("POST", url, **kwargs)
@@ -0,0 +1,161 @@
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from multiprocessing.connection import Connection
+from typing import Any, Callable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+_T = TypeVar("_T")
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+class IsolatedProcessError(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+
+
+class ResourceLimitExceeded(IsolatedProcessError):
+    pass
+
+
+def _get_descendant_pids(pid: int) -> list[int]:
+    """
+    Returns the IDs of all processes descended from the process, found by scanning
+    `/proc` for their parent process IDs.
+    """
+    children: dict[int, list[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as file:
+                stat = file.read()
+        except OSError:
+            continue
+        # The command name in the second field can contain spaces and parentheses
+        parent_pid = int(stat.rsplit(")", 1)[1].split()[1])
+        children.setdefault(parent_pid, []).append(int(entry))
+    descendants = []
+    pending = list(children.get(pid, []))
+    while pending:
+        child_pid = pending.pop()
+        descendants.append(child_pid)
+        pending.extend(children.get(child_pid, []))
+    return descendants
+
+
+def _get_rss(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/statm") as file:
+            return int(file.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+def get_tree_rss(pid: int) -> Optional[int]:
+    """
+    Returns the resident memory in bytes of the process and its descendants, or None
+    if it cannot be read because `/proc` is not available.
+    """
+    if not os.path.isdir("/proc"):
+        return None
+    return sum(_get_rss(p) for p in [pid, *_get_descendant_pids(pid)])
+
+
+def _kill(process: multiprocessing.process.BaseProcess, grace_seconds: float) -> None:
+    """
+    Kills the descendants of the process, then asks the process to stop, killing it
+    if it has not stopped after the grace period.
+    """
+    assert process.pid is not None
+    descendant_pids = (
+        _get_descendant_pids(process.pid) if os.path.isdir("/proc") else []
+    )
+    for pid in descendant_pids:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    process.terminate()
+    process.join(grace_seconds)
+    if process.is_alive():
+        process.kill()
+        process.join()
+
+
+def _run_child(
+    connection: Connection, func: Callable[..., Any], args: tuple[Any, ...]
+) -> None:
+    try:
+        result = ("result", func(*args))
+    except Exception as e:
+        result = ("error", str(e))
+    connection.send(result)
+    connection.close()
+
+
+def run_isolated(
+    func: Callable[..., _T],
+    *args: Any,
+    max_rss_bytes: Optional[int] = None,
+    timeout: Optional[float] = None,
+    poll_interval: float = 0.5,
+    grace_seconds: float = 5.0,
+) -> _T:
+    """
+    Calls `func(*args)` in a new process and returns its result. The function and its
+    arguments and result must be picklable.
+
+    If the resident memory of the process and its descendants exceeds `max_rss_bytes`,
+    or it runs for longer than `timeout` seconds, the processes are killed and
+    ResourceLimitExceeded is raised. If the function raises an exception, or the
+    process dies, IsolatedProcessError is raised.
+    """
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    # Not daemonic, so that the function can start processes of its own
+    process = context.Process(
+        target=_run_child, args=(sender, func, args), daemon=False
+    )
+    process.start()
+    sender.close()
+    assert process.pid is not None
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    try:
+        while not receiver.poll(poll_interval):
+            if not process.is_alive():
+                process.join()
+                raise IsolatedProcessError(
+                    f"Process exited with code {process.exitcode} without a result"
+                )
+            if deadline is not None and time.monotonic() > deadline:
+                _kill(process, grace_seconds)
+                raise ResourceLimitExceeded(f"Exceeded time limit of {timeout}s")
+            if max_rss_bytes is not None:
+                rss = get_tree_rss(process.pid)
+                if rss is not None and rss > max_rss_bytes:
+                    _kill(process, grace_seconds)
+                    raise ResourceLimitExceeded(
+                        f"Exceeded memory limit of {max_rss_bytes} bytes "
+                        f"with {rss} bytes resident"
+                    )
+        try:
+            status, value = receiver.recv()
+        except EOFError:
+            process.join()
+            raise IsolatedProcessError(
+                f"Process exited with code {process.exitcode} without a result"
+            )
+        process.join(grace_seconds)
+    finally:
+        receiver.close()
+        if process.is_alive():
+            _kill(process, grace_seconds)
+    if status == "error":
+        raise IsolatedProcessError(value)
+    result: _T = value
+    return result
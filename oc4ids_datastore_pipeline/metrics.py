@@ -0,0 +1,141 @@
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+_measurements: dict[tuple[str, str], "StageMeasurement"] = {}
+_measurements_lock = threading.Lock()
+
+
+@dataclass
+class StageMeasurement:
+    dataset_id: str
+    stage: str
+    seconds: float = 0.0
+    bytes: Optional[int] = None
+    succeeded: bool = False
+
+
+@contextmanager
+def measure_stage(dataset_id: str, stage: str) -> Iterator[StageMeasurement]:
+    """
+    Times the stage of processing the dataset. The stage can set `bytes` on the
+    yielded measurement to record how much data it handled.
+    """
+    measurement = StageMeasurement(dataset_id=dataset_id, stage=stage)
+    start = time.perf_counter()
+    try:
+        yield measurement
+        measurement.succeeded = True
+    finally:
+        measurement.seconds = time.perf_counter() - start
+        logger.info(
+            f"Stage {stage} for dataset {dataset_id} took {measurement.seconds:.3f}s"
+        )
+        with _measurements_lock:
+            _measurements[(dataset_id, stage)] = measurement
+
+
+def get_measurements(dataset_id: Optional[str] = None) -> list[StageMeasurement]:
+    with _measurements_lock:
+        return [
+            measurement
+            for measurement in _measurements.values()
+            if dataset_id is None or measurement.dataset_id == dataset_id
+        ]
+
+
+def record_measurements(measurements: list[StageMeasurement]) -> None:
+    """
+    Records measurements taken in another process.
+    """
+    with _measurements_lock:
+        for measurement in measurements:
+            _measurements[(measurement.dataset_id, measurement.stage)] = measurement
+
+
+def reset_measurements() -> None:
+    with _measurements_lock:
+        _measurements.clear()
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_sample(name: str, measurement: StageMeasurement, value: float) -> str:
+    return (
+        f'{name}{{dataset_id="{_escape_label_value(measurement.dataset_id)}",'
+        f'stage="{_escape_label_value(measurement.stage)}"}} {value}'
+    )
+
+
+def format_prometheus_metrics(
+    measurements: list[StageMeasurement],
+    run_seconds: float,
+    run_errors: int,
+    run_finished_at: float,
+) -> str:
+    """
+    Returns the measurements and run totals in the Prometheus text exposition format.
+    """
+    measurements = sorted(measurements, key=lambda m: (m.dataset_id, m.stage))
+    lines = [
+        "# HELP oc4ids_pipeline_stage_duration_seconds Time taken by the stage.",
+        "# TYPE oc4ids_pipeline_stage_duration_seconds gauge",
+        *(
+            _format_sample("oc4ids_pipeline_stage_duration_seconds", m, m.seconds)
+            for m in measurements
+        ),
+        "# HELP oc4ids_pipeline_stage_bytes Bytes handled by the stage.",
+        "# TYPE oc4ids_pipeline_stage_bytes gauge",
+        *(
+            _format_sample("oc4ids_pipeline_stage_bytes", m, m.bytes)
+            for m in measurements
+            if m.bytes is not None
+        ),
+        "# HELP oc4ids_pipeline_stage_success Whether the stage succeeded.",
+        "# TYPE oc4ids_pipeline_stage_success gauge",
+        *(
+            _format_sample("oc4ids_pipeline_stage_success", m, int(m.succeeded))
+            for m in measurements
+        ),
+        "# HELP oc4ids_pipeline_run_duration_seconds Time taken by the run.",
+        "# TYPE oc4ids_pipeline_run_duration_seconds gauge",
+        f"oc4ids_pipeline_run_duration_seconds {run_seconds}",
+        "# HELP oc4ids_pipeline_run_errors Number of datasets that failed in the run.",
+        "# TYPE oc4ids_pipeline_run_errors gauge",
+        f"oc4ids_pipeline_run_errors {run_errors}",
+        "# HELP oc4ids_pipeline_run_finished_timestamp_seconds When the run finished.",
+        "# TYPE oc4ids_pipeline_run_finished_timestamp_seconds gauge",
+        f"oc4ids_pipeline_run_finished_timestamp_seconds {run_finished_at}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus_textfile(path: str, run_seconds: float, run_errors: int) -> None:
+    """
+    Writes the measurements of the run to a file for the node exporter's textfile
+    collector. The file is replaced atomically, so it is never read half-written.
+    """
+    content = format_prometheus_metrics(
+        get_measurements(), run_seconds, run_errors, time.time()
+    )
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as file:
+            file.write(content)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+    logger.info(f"Wrote metrics to {path}")
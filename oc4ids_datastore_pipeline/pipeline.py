@@ -1,32 +1,88 @@
 import datetime
-import io
+import hashlib
+import importlib.metadata
+import itertools
 import json
 import logging
+import multiprocessing
 import os
+import re
+import shutil
+import tempfile
+import time
 import zipfile
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Optional
+from typing import IO, Any, Callable, Iterator, Optional, TypeVar
 
 import flattentool
+import ijson
 import requests
 from libcoveoc4ids.api import oc4ids_json_output
 from oc4idskit.combine import combine_project_packages
 
 from oc4ids_datastore_pipeline.database import (
     Dataset,
-    delete_dataset,
+    DatasetBatchWriter,
+    PipelineRunDataset,
+    ValidationResult,
+    delete_datasets,
+    finish_pipeline_run,
+    get_dataset,
     get_dataset_ids,
+    get_validation_result,
+    prune_validation_results,
     save_dataset,
+    save_validation_result,
+    start_pipeline_run,
+)
+from oc4ids_datastore_pipeline.http_client import http_get, http_head, http_post
+from oc4ids_datastore_pipeline.isolation import IsolatedProcessError, run_isolated
+from oc4ids_datastore_pipeline.metrics import (
+    StageMeasurement,
+    get_measurements,
+    measure_stage,
+    record_measurements,
+    reset_measurements,
+    write_prometheus_textfile,
 )
 from oc4ids_datastore_pipeline.notifications import send_notification
+from oc4ids_datastore_pipeline.profiling import (
+    InlineExecutor,
+    is_profiling,
+    profile_stage,
+)
 from oc4ids_datastore_pipeline.registry import (
     fetch_registered_datasets,
     get_license_title_from_url,
 )
-from oc4ids_datastore_pipeline.storage import delete_files_for_dataset, upload_files
+from oc4ids_datastore_pipeline.storage import (
+    delete_files_for_datasets,
+    upload_files,
+)
+from oc4ids_datastore_pipeline.transform import flatten_in_batches
 
 logger = logging.getLogger(__name__)
 
+_T = TypeVar("_T")
+
+_process_pool: Optional[Executor] = None
+_dataset_writer: Optional[DatasetBatchWriter] = None
+_run_id: Optional[int] = None
+_run_datasets: dict[str, PipelineRunDataset] = {}
+
+# Fields of the run's record of a dataset that are set while processing it
+_RUN_DATASET_RESULT_FIELDS = (
+    "outcome",
+    "downloaded_bytes",
+    "project_count",
+    "json_bytes",
+    "csv_bytes",
+    "xlsx_bytes",
+)
+
 
 class ProcessDatasetError(Exception):
     def __init__(self, message: str):
@@ -39,67 +95,186 @@ class ValidationError(ProcessDatasetError):
         super().__init__(message)
 
 
-def download_ecuador_packages(base_url: str) -> Any:
-    packages = []
-    start_year = 2020
-    current_year = datetime.datetime.now().year
-    years = list(range(start_year, current_year + 1))
+@dataclass
+class DownloadedJson:
+    json_data: Any
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_hash: Optional[str] = None
+    source_path: Optional[str] = None
+    size: Optional[int] = None
+    url: Optional[str] = None
 
-    for year in years:
-        url = f"{base_url}{year}.zip"
-        try:
-            response = requests.get(url, verify=False, stream=True)
+
+def _run_cpu_bound(func: Callable[..., _T], *args: Any, **kwargs: Any) -> _T:
+    """
+    Runs a CPU-bound function in the process pool when datasets are being processed
+    concurrently, otherwise, or when profiling, runs it in the current process.
+    """
+    if _process_pool is None or is_profiling():
+        return func(*args, **kwargs)
+    return _process_pool.submit(func, *args, **kwargs).result()
+
+
+@contextmanager
+def _cpu_executor(workers: int) -> Iterator[Executor]:
+    """
+    Yields the shared process pool when datasets are being processed concurrently,
+    otherwise a new pool of the given number of processes. When profiling, work is
+    run in the current thread instead, so the profiler sees it.
+    """
+    if is_profiling():
+        yield InlineExecutor()
+        return
+    if _process_pool is not None:
+        yield _process_pool
+        return
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        yield executor
+
+
+def _download_ecuador_archive(url: str) -> Optional[tuple[IO[bytes], str]]:
+    """
+    Spools the zip archive at the URL to a temporary file, returning the file and the
+    SHA-256 digest of its contents.
+    """
+    try:
+        response = http_get(url, verify=False, stream=True)
+        with response:
             if response.status_code != 200:
                 logger.warning(
                     f"Could not download {url}: Status {response.status_code}"
                 )
-                continue
-            zip_data = io.BytesIO(response.content)
-            with zipfile.ZipFile(zip_data, "r") as zip_ref:
-                for filename in zip_ref.namelist():
-                    if filename.endswith(".json"):
-                        with zip_ref.open(filename) as f:
-                            package = json.load(f)
-                            packages.append(package)
-        except (zipfile.BadZipFile, requests.RequestException) as e:
-            logger.error(f"Error processing {url}: {e}")
-            continue
+                return None
+            content_hash = hashlib.sha256()
+            archive = tempfile.TemporaryFile()
+            for chunk in response.iter_content(chunk_size=1024 * 1024):
+                archive.write(chunk)
+                content_hash.update(chunk)
+        archive.seek(0)
+        return archive, content_hash.hexdigest()
+    except requests.RequestException as e:
+        logger.error(f"Error processing {url}: {e}")
+        return None
 
-    if not packages:
-        raise ProcessDatasetError(f"No valid packages found at {base_url}")
 
-    # Arguments to combine packages
-    combine_args = {}
+def _load_zipped_packages(
+    zip_ref: zipfile.ZipFile, executor: ThreadPoolExecutor
+) -> list[Any]:
+    def load(filename: str) -> Any:
+        with zip_ref.open(filename) as f:
+            return json.load(f)
 
-    if packages[-1].get("uri"):
-        combine_args["uri"] = packages[-1].get("uri")
+    filenames = [name for name in zip_ref.namelist() if name.endswith(".json")]
+    return list(executor.map(load, filenames))
 
-    versions = {
-        package.get("version") for package in packages if package.get("version")
-    }
+
+def download_ecuador_packages(base_url: str) -> DownloadedJson:
+    """
+    Downloads the yearly zip archives concurrently, then combines the packages one
+    archive at a time so only one year's packages are held in memory alongside the
+    combined package.
+    """
+    start_year = 2020
+    current_year = datetime.datetime.now().year
+    years = list(range(start_year, current_year + 1))
+    urls = [f"{base_url}{year}.zip" for year in years]
+    concurrency = int(os.environ.get("ECUADOR_DOWNLOAD_CONCURRENCY", "4"))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        archives = [
+            (url, archive)
+            for url, archive in zip(urls, executor.map(_download_ecuador_archive, urls))
+            if archive is not None
+        ]
+
+    content_hash = hashlib.sha256()
+    for _, (_, archive_hash) in archives:
+        content_hash.update(archive_hash.encode())
+
+    uri: Optional[str] = None
+    versions: set[str] = set()
+    published_dates: set[str] = set()
+    packages_count = 0
+
+    def iter_packages() -> Iterator[Any]:
+        nonlocal uri, packages_count
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for url, (archive, _) in archives:
+                try:
+                    with archive, zipfile.ZipFile(archive, "r") as zip_ref:
+                        packages = _load_zipped_packages(zip_ref, executor)
+                except zipfile.BadZipFile as e:
+                    logger.error(f"Error processing {url}: {e}")
+                    continue
+                for package in packages:
+                    uri = package.get("uri")
+                    if package.get("version"):
+                        versions.add(package["version"])
+                    if package.get("publishedDate"):
+                        published_dates.add(package["publishedDate"])
+                    packages_count += 1
+                    yield package
+
+    try:
+        combined_package = combine_project_packages(
+            iter_packages()
+        )  # type: ignore[no-untyped-call]
+    finally:
+        for _, (archive, _) in archives:
+            archive.close()
+
+    if not packages_count:
+        raise ProcessDatasetError(f"No valid packages found at {base_url}")
+    logger.info(f"Combined {packages_count} packages for Ecuador")
+
+    if uri:
+        combined_package["uri"] = uri
     if len(versions) > 1:
         logger.warning(f"Packages declare more than one version: {versions}")
     if versions:
-        combine_args["version"] = list(versions)[0]
-
-    published_dates = {
-        package.get("publishedDate")
-        for package in packages
-        if package.get("publishedDate")
-    }
+        combined_package["version"] = list(versions)[0]
     if published_dates:
-        combine_args["published_date"] = max(published_dates)
+        combined_package["publishedDate"] = max(published_dates)
 
-    logger.info(f"Combining {len(packages)} packages for Ecuador")
-    return combine_project_packages(
-        packages, **combine_args
-    )  # type: ignore[no-untyped-call]
+    return DownloadedJson(
+        json_data=combined_package, content_hash=content_hash.hexdigest()
+    )
 
 
-def build_costa_rica_url(base_url: str) -> str:
+def _probe_costa_rica_urls(urls: list[str]) -> Optional[str]:
+    """
+    Sends a HEAD request to each URL concurrently, returning the first URL in the
+    list that exists.
+    """
+    timeout = float(os.environ.get("COSTA_RICA_PROBE_TIMEOUT", "10"))
+
+    def exists(url: str) -> bool:
+        try:
+            response = http_head(url, timeout=timeout)
+            return response.status_code == 200
+        except Exception as e:
+            logger.warning(f"Costa Rica: Connection error at {url}: {e}")
+            return False
+
+    if not urls:
+        return None
+    with ThreadPoolExecutor(max_workers=len(urls)) as executor:
+        for url, url_exists in zip(urls, executor.map(exists, urls)):
+            if url_exists:
+                return url
+    return None
+
+
+def build_costa_rica_url(base_url: str, last_known_url: Optional[str] = None) -> str:
     """
     Builds the Costa Rica URL by looking back up to the last known dataset
     to find the most recent available upload.
+
+    If the URL found by the previous run is given, only the months since then are
+    checked first, so in the common case this takes a single round-trip.
     """
     filename = "OC4IDSJSONCFIA.json"
 
@@ -107,60 +282,154 @@ def build_costa_rica_url(base_url: str) -> str:
     today = datetime.datetime.today()
     date_to_try = today.replace(day=1)
 
+    urls = []
     while date_to_try >= start_date:
-        url = f"{base_url}{date_to_try.year}/{date_to_try.month:02d}/{filename}"
-        try:
-            response = requests.head(url)
-            if response.status_code == 200:
-                logger.info(f"Costa Rica: Located latest data at {url}")
-                return url
-        except Exception as e:
-            logger.warning(f"Costa Rica: Connection error at {url}: {e}")
-
+        urls.append(f"{base_url}{date_to_try.year}/{date_to_try.month:02d}/{filename}")
         date_to_try = (date_to_try - datetime.timedelta(days=1)).replace(day=1)
 
+    if last_known_url in urls:
+        split_index = urls.index(last_known_url) + 1
+        url = _probe_costa_rica_urls(urls[:split_index])
+        if url:
+            logger.info(f"Costa Rica: Located latest data at {url}")
+            return url
+        urls = urls[split_index:]
+
+    url = _probe_costa_rica_urls(urls)
+    if url:
+        logger.info(f"Costa Rica: Located latest data at {url}")
+        return url
+
     raise ProcessDatasetError(
         f"Costa Rica: Could not find a dataset URL at {base_url} "
         f"between now and {start_date.strftime('%Y-%m')}."
     )
 
 
-def download_json(dataset_id: str, url: str) -> Any:
+def _stream_response_to_file(
+    dataset_id: str, r: requests.Response
+) -> tuple[str, int, str]:
+    """
+    Writes the response body to a temporary file in chunks, returning the path to
+    the file, its size and its SHA-256 digest.
+    """
+    chunk_size = int(os.environ.get("DOWNLOAD_CHUNK_SIZE", str(1024 * 1024)))
+    content_hash = hashlib.sha256()
+    size = 0
+    fd, path = tempfile.mkstemp(prefix=f"{dataset_id}_", suffix=".json")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            for chunk in r.iter_content(chunk_size=chunk_size):
+                file.write(chunk)
+                content_hash.update(chunk)
+                size += len(chunk)
+    except Exception:
+        os.remove(path)
+        raise
+    return path, size, content_hash.hexdigest()
+
+
+def _load_json_file(path: str, size: int) -> Any:
+    """
+    Parses the JSON file, using an incremental parser for files bigger than
+    JSON_STREAM_PARSE_THRESHOLD so the whole file is never held in memory as text.
+    """
+    threshold = int(os.environ.get("JSON_STREAM_PARSE_THRESHOLD", "100000000"))
+    with open(path, "rb") as file:
+        if size > threshold:
+            logger.info(f"Parsing {path} incrementally ({size} bytes)")
+            return next(ijson.items(file, "", use_float=True))
+        return json.load(file)
+
+
+def download_json(
+    dataset_id: str,
+    url: str,
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None,
+    previous_download_url: Optional[str] = None,
+    previous_content_hash: Optional[str] = None,
+) -> Optional[DownloadedJson]:
+    """
+    Downloads the dataset, sending `If-None-Match`/`If-Modified-Since` when the
+    validators from a previous download are given. For sources whose URL changes
+    over time, the URL downloaded from by the previous run is used as a starting
+    point to find the latest one.
+
+    Returns None if the server reports that the dataset has not been modified. If
+    the downloaded content has the previous content hash, it is not parsed, and
+    `json_data` is None.
+    """
     logger.info(f"Downloading json from {url}")
     try:
+        conditional_headers = {}
+        if etag:
+            conditional_headers["If-None-Match"] = etag
+        if last_modified:
+            conditional_headers["If-Modified-Since"] = last_modified
         if dataset_id == "malawi_cost_malawi":
             payload = {
                 "start_date": "2010-01-01",
                 "end_date": datetime.datetime.today().strftime("%Y-%m-%d"),
             }
-            r = requests.post(url, json=payload)
+            r = http_post(url, json=payload, stream=True)
         elif dataset_id == "indonesia_cost_west_lombok":
-            r = requests.get(url, verify=False)
+            r = http_get(url, headers=conditional_headers, verify=False, stream=True)
         elif dataset_id == "ecuador_cost_ecuador":
             return download_ecuador_packages(url)
         elif dataset_id == "costa_rica_cfia":
             headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"  # noqa: E501
+                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",  # noqa: E501
+                **conditional_headers,
             }
-            url = build_costa_rica_url(url)
-            r = requests.get(url, headers=headers)
+            url = build_costa_rica_url(url, last_known_url=previous_download_url)
+            r = http_get(url, headers=headers, stream=True)
         else:
-            r = requests.get(url)
-        r.raise_for_status()
-        response_size = len(r.content)
+            r = http_get(url, headers=conditional_headers, stream=True)
+        with r:
+            if r.status_code == 304 and conditional_headers:
+                logger.info(f"{url} has not been modified since the last download")
+                return None
+            r.raise_for_status()
+            source_path, response_size, content_hash = _stream_response_to_file(
+                dataset_id, r
+            )
         logger.info(f"Downloaded {url} ({response_size} bytes)")
+        if previous_content_hash is not None and content_hash == previous_content_hash:
+            logger.info(f"{url} has the same content as the last download")
+            os.remove(source_path)
+            return DownloadedJson(
+                json_data=None,
+                etag=r.headers.get("ETag"),
+                last_modified=r.headers.get("Last-Modified"),
+                content_hash=content_hash,
+                size=response_size,
+                url=url,
+            )
         try:
-            return r.json()
+            json_data = _load_json_file(source_path, response_size)
         except Exception as parse_err:
+            with open(source_path, "rb") as file:
+                snippet = file.read(1000).decode("utf-8", errors="replace")
+            os.remove(source_path)
             error_details = (
                 f"JSON DECODE FAILED FOR: {dataset_id}\n"
                 f"Status: {r.status_code}\n"
                 f"Content-Type: {r.headers.get('Content-Type')}\n"
                 f"--- Response snippet ---\n"
-                f"{r.text[:1000]}\n"
+                f"{snippet}\n"
             )
             logger.error(error_details)
             raise ProcessDatasetError(error_details) from parse_err
+        return DownloadedJson(
+            json_data=json_data,
+            etag=r.headers.get("ETag"),
+            last_modified=r.headers.get("Last-Modified"),
+            content_hash=content_hash,
+            source_path=source_path,
+            size=response_size,
+            url=url,
+        )
     except Exception as e:
         if not isinstance(e, ProcessDatasetError):
             raise ProcessDatasetError(f"Download failed: {str(e)}")
@@ -168,12 +437,147 @@ def download_json(dataset_id: str, url: str) -> Any:
             raise e
 
 
-def validate_json(dataset_id: str, json_data: dict[str, Any]) -> None:
+def _get_validation_chunk_size(json_data: dict[str, Any]) -> int:
+    """
+    Returns the number of projects in each batch the dataset is validated in, or 0 if
+    it is validated whole.
+    """
+    chunk_size = int(os.environ.get("VALIDATION_CHUNK_SIZE", "0"))
+    projects = json_data.get("projects")
+    if chunk_size > 0 and isinstance(projects, list) and len(projects) > chunk_size:
+        return chunk_size
+    return 0
+
+
+def _get_validator_version(chunk_size: int) -> str:
+    """
+    Returns the version of the validator, including the chunk size, as validating
+    in chunks skips checks across chunks, so its results can't stand in for the
+    results of validating the whole dataset.
+    """
+    version = f"libcoveoc4ids=={importlib.metadata.version('libcoveoc4ids')}"
+    return f"{version};chunk_size={chunk_size}" if chunk_size else version
+
+
+def _get_cached_validation_result(
+    content_hash: str, chunk_size: int
+) -> Optional[ValidationResult]:
+    try:
+        return get_validation_result(content_hash, _get_validator_version(chunk_size))
+    except Exception as e:
+        logger.warning(f"Failed to read cached validation result with error {e}")
+        return None
+
+
+def _cache_validation_result(
+    content_hash: str, chunk_size: int, errors_count: int, errors: list[Any]
+) -> None:
+    max_errors = int(os.environ.get("VALIDATION_CACHE_MAX_ERRORS", "100"))
+    try:
+        save_validation_result(
+            ValidationResult(
+                content_hash=content_hash,
+                validator_version=_get_validator_version(chunk_size),
+                errors_count=errors_count,
+                errors=[
+                    [error[0], error[1][:max_errors]] for error in errors[:max_errors]
+                ],
+                created_at=datetime.datetime.now(datetime.UTC),
+            )
+        )
+    except Exception as e:
+        logger.warning(f"Failed to cache validation result with error {e}")
+
+
+def _offset_error_path(instance: Any, offset: int) -> Any:
+    if isinstance(instance, dict) and isinstance(instance.get("path"), str):
+        path = re.sub(
+            r"^projects/(\d+)",
+            lambda match: f"projects/{int(match.group(1)) + offset}",
+            instance["path"],
+        )
+        return {**instance, "path": path}
+    return instance
+
+
+def _validate_in_chunks(
+    json_data: dict[str, Any], chunk_size: int, executor: Executor
+) -> tuple[int, list[Any]]:
+    """
+    Validates batches of projects wrapped in the package envelope in parallel, then
+    merges the errors, with paths relative to the whole package.
+
+    Checks that span batches, such as the uniqueness of project IDs, only apply
+    within each batch.
+    """
+    envelope = {key: value for key, value in json_data.items() if key != "projects"}
+    offsets = range(0, len(json_data["projects"]), chunk_size)
+    futures = [
+        executor.submit(
+            oc4ids_json_output, json_data={**envelope, "projects": list(projects)}
+        )
+        for projects in itertools.batched(json_data["projects"], chunk_size)
+    ]
+    errors_count = 0
+    errors: dict[str, list[Any]] = {}
+    for offset, future in zip(offsets, futures):
+        result = future.result()
+        errors_count += result["validation_errors_count"]
+        for message, instances in result["validation_errors"]:
+            errors.setdefault(message, []).extend(
+                _offset_error_path(instance, offset) for instance in instances
+            )
+    return errors_count, [[message, instances] for message, instances in errors.items()]
+
+
+def _run_validation(
+    json_data: dict[str, Any], chunk_size: int
+) -> tuple[int, list[Any]]:
+    if chunk_size:
+        logger.info(
+            f"Validating {len(json_data['projects'])} projects "
+            f"in chunks of {chunk_size}"
+        )
+        workers = int(os.environ.get("VALIDATION_WORKERS", str(os.cpu_count() or 1)))
+        with _cpu_executor(workers) as executor:
+            return _validate_in_chunks(json_data, chunk_size, executor)
+    validation_result = _run_cpu_bound(oc4ids_json_output, json_data=json_data)
+    return (
+        validation_result["validation_errors_count"],
+        validation_result["validation_errors"],
+    )
+
+
+def validate_json(
+    dataset_id: str, json_data: dict[str, Any], content_hash: Optional[str] = None
+) -> None:
+    """
+    Validates the dataset. When the content hash is given, the outcome is cached
+    against it and the libcoveoc4ids version, so the same data is only validated
+    again when the validator changes.
+    """
     logger.info(f"Validating dataset {dataset_id}")
     try:
-        validation_result = oc4ids_json_output(json_data=json_data)
-        validation_errors_count = validation_result["validation_errors_count"]
-        validation_errors = validation_result["validation_errors"]
+        if not bool(int(os.environ.get("VALIDATION_CACHE_ENABLED", "1"))):
+            content_hash = None
+        chunk_size = _get_validation_chunk_size(json_data)
+        cached_result = (
+            _get_cached_validation_result(content_hash, chunk_size)
+            if content_hash
+            else None
+        )
+        if cached_result is not None:
+            logger.info(f"Using cached validation result for dataset {dataset_id}")
+            validation_errors_count = cached_result.errors_count
+            validation_errors = cached_result.errors
+        else:
+            validation_errors_count, validation_errors = _run_validation(
+                json_data, chunk_size
+            )
+            if content_hash:
+                _cache_validation_result(
+                    content_hash, chunk_size, validation_errors_count, validation_errors
+                )
         if validation_errors_count > 0:
             raise ValidationError(
                 errors_count=validation_errors_count,
@@ -184,23 +588,62 @@ def validate_json(dataset_id: str, json_data: dict[str, Any]) -> None:
         raise ProcessDatasetError(f"Validation failed: {str(e)}")
 
 
-def write_json_to_file(file_name: str, json_data: dict[str, Any]) -> str:
+def write_json_to_file(
+    file_name: str, json_data: dict[str, Any], source_path: Optional[str] = None
+) -> str:
+    """
+    Writes the dataset through a temporary file that is renamed into place, so a
+    failure never leaves a truncated file behind.
+
+    JSON_OUTPUT_FORMAT selects "indent" (the default), "compact", or "source" to copy
+    the downloaded bytes at `source_path` verbatim, falling back to "compact" when
+    there are no downloaded bytes, e.g. for combined packages.
+    """
+    output_format = os.environ.get("JSON_OUTPUT_FORMAT", "indent")
     logger.info(f"Writing dataset to file {file_name}")
     try:
-        os.makedirs(os.path.dirname(file_name), exist_ok=True)
-        with open(file_name, "w") as file:
-            json.dump(json_data, file, indent=4)
+        directory = os.path.dirname(file_name)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            if output_format == "source" and source_path:
+                with os.fdopen(fd, "wb") as file, open(source_path, "rb") as source:
+                    shutil.copyfileobj(source, file)
+            else:
+                with os.fdopen(fd, "w") as file:
+                    if output_format == "indent":
+                        json.dump(json_data, file, indent=4)
+                    else:
+                        json.dump(json_data, file, separators=(",", ":"))
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, file_name)
+        except Exception:
+            os.remove(temp_path)
+            raise
         logger.info(f"Finished writing to {file_name}")
         return file_name
     except Exception as e:
         raise ProcessDatasetError(f"Error writing dataset to file: {e}")
 
 
+def _is_transform_skipped(json_path: str) -> bool:
+    """
+    Returns whether the JSON file is too big to be transformed to CSV and Excel.
+    """
+    max_file_size = int(os.environ.get("TRANSFORM_MAX_FILE_SIZE", "400000"))
+    batch_size = int(os.environ.get("TRANSFORM_BATCH_SIZE", "1000"))
+    return os.path.getsize(json_path) > max_file_size and batch_size <= 0
+
+
 def transform_to_csv_and_xlsx(json_path: str) -> tuple[Optional[str], Optional[str]]:
+    path = Path(json_path)
+    csv_path = str(path.parent / path.stem)
+    xlsx_path = f"{path.parent / path.stem}.xlsx"
     # File size check
     file_size: int = os.path.getsize(json_path)
     max_file_size: int = int(os.environ.get("TRANSFORM_MAX_FILE_SIZE", "400000"))
-    if file_size > max_file_size:
+    batch_size = int(os.environ.get("TRANSFORM_BATCH_SIZE", "1000"))
+    if _is_transform_skipped(json_path):
         logger.info(
             (
                 "File {} has size {}, bigger than max allowed size of {}"
@@ -211,15 +654,29 @@ def transform_to_csv_and_xlsx(json_path: str) -> tuple[Optional[str], Optional[s
     # Ok, go
     logger.info(f"Transforming {json_path}")
     try:
-        path = Path(json_path)
-        flattentool.flatten(
-            json_path,
-            output_name=str(path.parent / path.stem),
-            root_list_path="projects",
-            main_sheet_name="projects",
-        )  # type: ignore[no-untyped-call]
-        csv_path = str(path.parent / path.stem)
-        xlsx_path = f"{path.parent / path.stem}.xlsx"
+        if file_size > max_file_size:
+            logger.info(
+                f"File {json_path} has size {file_size}, bigger than {max_file_size}"
+                f", so transforming in batches of {batch_size} projects"
+            )
+            workers = int(os.environ.get("TRANSFORM_WORKERS", str(os.cpu_count() or 1)))
+            with _cpu_executor(workers) as executor:
+                flatten_in_batches(
+                    json_path,
+                    csv_path=csv_path,
+                    xlsx_path=xlsx_path,
+                    batch_size=batch_size,
+                    executor=executor,
+                    max_pending_batches=2 * workers,
+                )
+        else:
+            _run_cpu_bound(
+                flattentool.flatten,
+                json_path,
+                output_name=csv_path,
+                root_list_path="projects",
+                main_sheet_name="projects",
+            )
         logger.info(f"Transformed to CSV at {csv_path}")
         logger.info(f"Transformed to XLSX at {xlsx_path}")
         return csv_path, xlsx_path
@@ -228,6 +685,13 @@ def transform_to_csv_and_xlsx(json_path: str) -> tuple[Optional[str], Optional[s
         return None, None
 
 
+def _save_dataset(dataset: Dataset) -> None:
+    if _dataset_writer is not None:
+        _dataset_writer.add(dataset)
+    else:
+        save_dataset(dataset)
+
+
 def save_dataset_metadata(
     dataset_id: str,
     source_url: str,
@@ -238,6 +702,10 @@ def save_dataset_metadata(
     xlsx_url: Optional[str],
     portal_title: Optional[str],
     portal_url: Optional[str],
+    http_etag: Optional[str] = None,
+    http_last_modified: Optional[str] = None,
+    content_hash: Optional[str] = None,
+    download_url: Optional[str] = None,
 ) -> None:
     logger.info(f"Saving metadata for dataset {dataset_id}")
     try:
@@ -246,6 +714,7 @@ def save_dataset_metadata(
         license_title, license_title_short = (
             get_license_title_from_url(license_url) if license_url else (None, None)
         )
+        now = datetime.datetime.now(datetime.UTC)
         dataset = Dataset(
             dataset_id=dataset_id,
             source_url=source_url,
@@ -259,70 +728,419 @@ def save_dataset_metadata(
             json_url=json_url,
             csv_url=csv_url,
             xlsx_url=xlsx_url,
-            updated_at=datetime.datetime.now(datetime.UTC),
+            http_etag=http_etag,
+            http_last_modified=http_last_modified,
+            content_hash=content_hash,
+            download_url=download_url,
+            updated_at=now,
+            last_checked_at=now,
         )
-        save_dataset(dataset)
+        _save_dataset(dataset)
     except Exception as e:
         raise ProcessDatasetError(f"Failed to update metadata for dataset: {e}")
 
 
-def process_dataset(dataset_id: str, registry_metadata: dict[str, str]) -> None:
-    logger.info(f"Processing dataset {dataset_id}")
-    json_data = download_json(dataset_id, registry_metadata["source_url"])
-    validate_json(dataset_id, json_data)
-    json_path = write_json_to_file(
-        file_name=f"data/{dataset_id}/{dataset_id}.json",
-        json_data=json_data,
+def _get_previous_dataset(dataset_id: str, source_url: str) -> Optional[Dataset]:
+    if not bool(int(os.environ.get("INCREMENTAL_UPDATES", "1"))):
+        return None
+    previous_dataset = get_dataset(dataset_id)
+    if previous_dataset is None or previous_dataset.source_url != source_url:
+        return None
+    return previous_dataset
+
+
+def _is_unchanged(previous_dataset: Dataset, downloaded: DownloadedJson) -> bool:
+    return (
+        downloaded.content_hash is not None
+        and downloaded.content_hash == previous_dataset.content_hash
     )
-    csv_path, xlsx_path = transform_to_csv_and_xlsx(json_path)
-    json_public_url, csv_public_url, xlsx_public_url = upload_files(
-        dataset_id, json_path=json_path, csv_path=csv_path, xlsx_path=xlsx_path
+
+
+def _save_unchanged_dataset_metadata(
+    dataset: Dataset,
+    registry_metadata: dict[str, str],
+    downloaded: Optional[DownloadedJson],
+) -> None:
+    logger.info(f"Dataset {dataset.dataset_id} is unchanged, skipping processing")
+    try:
+        if downloaded is not None:
+            dataset.http_etag = downloaded.etag
+            dataset.http_last_modified = downloaded.last_modified
+            dataset.download_url = downloaded.url
+        dataset.last_checked_at = datetime.datetime.now(datetime.UTC)
+        dataset.publisher_country = registry_metadata["country"]
+        dataset.portal_title = registry_metadata["portal_title"]
+        dataset.portal_url = registry_metadata["portal_url"]
+        _save_dataset(dataset)
+    except Exception as e:
+        raise ProcessDatasetError(f"Failed to update metadata for dataset: {e}")
+
+
+@contextmanager
+def _stage(dataset_id: str, stage: str) -> Iterator[StageMeasurement]:
+    with (
+        profile_stage(dataset_id, stage),
+        measure_stage(dataset_id, stage) as measurement,
+    ):
+        yield measurement
+
+
+def _are_files_published(
+    json_path: str,
+    csv_path: Optional[str],
+    xlsx_path: Optional[str],
+    json_url: Optional[str],
+    csv_url: Optional[str],
+    xlsx_url: Optional[str],
+) -> bool:
+    """
+    Returns whether every file that should have been produced for the dataset was
+    produced and uploaded. When uploads are disabled nothing is published, so a
+    later run with uploads enabled does not skip the dataset as unchanged.
+    """
+    if csv_path is None and xlsx_path is None and not _is_transform_skipped(json_path):
+        return False
+    return (
+        json_url is not None
+        and (csv_path is None or csv_url is not None)
+        and (xlsx_path is None or xlsx_url is not None)
     )
-    save_dataset_metadata(
-        dataset_id=dataset_id,
-        source_url=registry_metadata["source_url"],
-        publisher_country=registry_metadata["country"],
-        json_data=json_data,
-        json_url=json_public_url,
-        csv_url=csv_public_url,
-        xlsx_url=xlsx_public_url,
-        portal_title=registry_metadata["portal_title"],
-        portal_url=registry_metadata["portal_url"],
+
+
+def _get_size(*paths: Optional[str]) -> int:
+    """
+    Returns the total size of the files, and of the files in the directories.
+    """
+    size = 0
+    for path in paths:
+        if not path or not os.path.exists(path):
+            continue
+        if os.path.isdir(path):
+            size += sum(p.stat().st_size for p in Path(path).rglob("*") if p.is_file())
+        else:
+            size += os.path.getsize(path)
+    return size
+
+
+def process_dataset(
+    dataset_id: str,
+    registry_metadata: dict[str, str],
+    run_dataset: Optional[PipelineRunDataset] = None,
+) -> None:
+    """
+    Processes the dataset. If `run_dataset` is given, the outcome, sizes and project
+    count are recorded on it as processing progresses.
+    """
+    if run_dataset is None:
+        run_dataset = PipelineRunDataset()
+    logger.info(f"Processing dataset {dataset_id}")
+    previous_dataset = _get_previous_dataset(
+        dataset_id, registry_metadata["source_url"]
     )
+    with _stage(dataset_id, "download") as measurement:
+        downloaded = download_json(
+            dataset_id,
+            registry_metadata["source_url"],
+            etag=previous_dataset.http_etag if previous_dataset else None,
+            last_modified=(
+                previous_dataset.http_last_modified if previous_dataset else None
+            ),
+            previous_download_url=(
+                previous_dataset.download_url if previous_dataset else None
+            ),
+            previous_content_hash=(
+                previous_dataset.content_hash if previous_dataset else None
+            ),
+        )
+        measurement.bytes = downloaded.size if downloaded else 0
+    run_dataset.downloaded_bytes = measurement.bytes
+    if downloaded is None:
+        run_dataset.outcome = "not_modified"
+        if previous_dataset is not None:
+            with _stage(dataset_id, "save_metadata"):
+                _save_unchanged_dataset_metadata(
+                    previous_dataset, registry_metadata, None
+                )
+        return
+    try:
+        if previous_dataset is not None and _is_unchanged(previous_dataset, downloaded):
+            run_dataset.outcome = "unchanged"
+            with _stage(dataset_id, "save_metadata"):
+                _save_unchanged_dataset_metadata(
+                    previous_dataset, registry_metadata, downloaded
+                )
+            return
+        json_data = downloaded.json_data
+        if isinstance(json_data, dict):
+            run_dataset.project_count = len(json_data.get("projects", []))
+        with _stage(dataset_id, "validate") as measurement:
+            validate_json(dataset_id, json_data, content_hash=downloaded.content_hash)
+            measurement.bytes = downloaded.size
+        with _stage(dataset_id, "write") as measurement:
+            json_path = write_json_to_file(
+                file_name=f"data/{dataset_id}/{dataset_id}.json",
+                json_data=json_data,
+                source_path=downloaded.source_path,
+            )
+            measurement.bytes = run_dataset.json_bytes = _get_size(json_path)
+        with _stage(dataset_id, "transform") as measurement:
+            csv_path, xlsx_path = transform_to_csv_and_xlsx(json_path)
+            run_dataset.csv_bytes = _get_size(csv_path) if csv_path else None
+            run_dataset.xlsx_bytes = _get_size(xlsx_path) if xlsx_path else None
+            measurement.bytes = _get_size(csv_path, xlsx_path)
+        with _stage(dataset_id, "upload") as measurement:
+            json_public_url, csv_public_url, xlsx_public_url = upload_files(
+                dataset_id, json_path=json_path, csv_path=csv_path, xlsx_path=xlsx_path
+            )
+            measurement.bytes = _get_size(json_path, csv_path, xlsx_path)
+        # Don't keep the validators or hash if any file failed, so it is retried
+        files_published = _are_files_published(
+            json_path,
+            csv_path,
+            xlsx_path,
+            json_public_url,
+            csv_public_url,
+            xlsx_public_url,
+        )
+        with _stage(dataset_id, "save_metadata"):
+            save_dataset_metadata(
+                dataset_id=dataset_id,
+                source_url=registry_metadata["source_url"],
+                publisher_country=registry_metadata["country"],
+                json_data=json_data,
+                json_url=json_public_url,
+                csv_url=csv_public_url,
+                xlsx_url=xlsx_public_url,
+                portal_title=registry_metadata["portal_title"],
+                portal_url=registry_metadata["portal_url"],
+                http_etag=downloaded.etag if files_published else None,
+                http_last_modified=(
+                    downloaded.last_modified if files_published else None
+                ),
+                content_hash=downloaded.content_hash if files_published else None,
+                download_url=downloaded.url,
+            )
+        run_dataset.outcome = "processed"
+    finally:
+        if downloaded.source_path:
+            os.remove(downloaded.source_path)
     logger.info(f"Processed dataset {dataset_id}")
 
 
 def process_deleted_datasets(registered_datasets: dict[str, dict[str, str]]) -> None:
     stored_datasets = get_dataset_ids()
-    deleted_datasets = stored_datasets - registered_datasets.keys()
+    deleted_datasets = sorted(stored_datasets - registered_datasets.keys())
+    if not deleted_datasets:
+        return
     for dataset_id in deleted_datasets:
         logger.info(f"Dataset {dataset_id} is no longer in the registry, deleting")
-        delete_dataset(dataset_id)
-        delete_files_for_dataset(dataset_id)
+    delete_datasets(deleted_datasets)
+    delete_files_for_datasets(deleted_datasets)
 
 
-def process_registry() -> None:
-    registered_datasets = fetch_registered_datasets()
-    process_deleted_datasets(registered_datasets)
-    errors: list[dict[str, Any]] = []
+def _process_dataset_in_child(
+    dataset_id: str, registry_metadata: dict[str, str]
+) -> tuple[dict[str, Any], list[StageMeasurement]]:
+    run_dataset = PipelineRunDataset()
+    process_dataset(dataset_id, registry_metadata, run_dataset=run_dataset)
+    return (
+        {field: getattr(run_dataset, field) for field in _RUN_DATASET_RESULT_FIELDS},
+        get_measurements(dataset_id),
+    )
+
+
+def _process_dataset_in_subprocess(
+    dataset_id: str,
+    registry_metadata: dict[str, str],
+    run_dataset: PipelineRunDataset,
+) -> None:
+    """
+    Processes the dataset in a new process, which is killed if its resident memory,
+    including that of any processes it starts, exceeds DATASET_MAX_RSS_BYTES, or if it
+    runs for longer than DATASET_TIMEOUT_SECONDS.
+    """
+    max_rss_bytes = int(os.environ.get("DATASET_MAX_RSS_BYTES", "0")) or None
+    timeout = float(os.environ.get("DATASET_TIMEOUT_SECONDS", "0")) or None
+    try:
+        fields, measurements = run_isolated(
+            _process_dataset_in_child,
+            dataset_id,
+            registry_metadata,
+            max_rss_bytes=max_rss_bytes,
+            timeout=timeout,
+        )
+    except IsolatedProcessError as e:
+        raise ProcessDatasetError(str(e))
+    record_measurements(measurements)
+    for field, value in fields.items():
+        setattr(run_dataset, field, value)
+
+
+def _process_dataset_and_catch_errors(
+    dataset_id: str, registry_metadata: dict[str, str]
+) -> Optional[dict[str, Any]]:
+    run_dataset = PipelineRunDataset(
+        dataset_id=dataset_id, started_at=datetime.datetime.now(datetime.UTC)
+    )
+    try:
+        if bool(int(os.environ.get("DATASET_ISOLATION", "0"))):
+            _process_dataset_in_subprocess(dataset_id, registry_metadata, run_dataset)
+        else:
+            process_dataset(dataset_id, registry_metadata, run_dataset=run_dataset)
+        return None
+    except Exception as e:
+        logger.warning(f"Failed to process dataset {dataset_id} with error {e}")
+        run_dataset.outcome = "failed"
+        run_dataset.error_message = str(e)
+        return {
+            "dataset_id": dataset_id,
+            "source_url": registry_metadata["source_url"],
+            "message": str(e),
+        }
+    finally:
+        if _run_id is not None:
+            run_dataset.run_id = _run_id
+            run_dataset.finished_at = datetime.datetime.now(datetime.UTC)
+            for measurement in get_measurements(dataset_id):
+                setattr(
+                    run_dataset, f"{measurement.stage}_seconds", measurement.seconds
+                )
+            _run_datasets[dataset_id] = run_dataset
+
+
+def _prune_validation_results() -> None:
+    max_age_days = int(os.environ.get("VALIDATION_CACHE_MAX_AGE_DAYS", "30"))
+    try:
+        deleted_count = prune_validation_results(
+            datetime.datetime.now(datetime.UTC) - datetime.timedelta(days=max_age_days)
+        )
+        logger.info(f"Deleted {deleted_count} old cached validation results")
+    except Exception as e:
+        logger.warning(f"Failed to delete old validation results with error {e}")
+
+
+def _start_pipeline_run() -> Optional[int]:
+    if not bool(int(os.environ.get("PIPELINE_RUN_HISTORY", "1"))):
+        return None
+    try:
+        return start_pipeline_run(datetime.datetime.now(datetime.UTC))
+    except Exception as e:
+        logger.warning(f"Failed to record pipeline run with error {e}")
+        return None
 
-    for dataset_id, registry_metadata in registered_datasets.items():
+
+def _finish_pipeline_run(run_id: int, errors: list[dict[str, Any]]) -> None:
+    try:
+        finish_pipeline_run(
+            run_id,
+            datetime.datetime.now(datetime.UTC),
+            len(errors),
+            list(_run_datasets.values()),
+        )
+    except Exception as e:
+        logger.warning(f"Failed to record pipeline run {run_id} with error {e}")
+
+
+def _process_datasets_concurrently(
+    registered_datasets: dict[str, dict[str, str]], workers: int
+) -> list[dict[str, Any]]:
+    """
+    Processes datasets in a pool of threads, which handle the I/O-bound stages, while
+    the CPU-bound stages are sent to a shared pool of processes.
+    """
+    global _process_pool
+    cpu_workers = int(
+        os.environ.get("PIPELINE_CPU_WORKERS", str(min(workers, os.cpu_count() or 1)))
+    )
+    logger.info(
+        f"Processing datasets with {workers} threads and {cpu_workers} processes"
+    )
+    with (
+        ProcessPoolExecutor(
+            max_workers=cpu_workers, mp_context=multiprocessing.get_context("spawn")
+        ) as process_pool,
+        ThreadPoolExecutor(max_workers=workers) as thread_pool,
+    ):
+        _process_pool = process_pool
         try:
-            process_dataset(dataset_id, registry_metadata)
-        except Exception as e:
-            logger.warning(f"Failed to process dataset {dataset_id} with error {e}")
+            results = list(
+                thread_pool.map(
+                    _process_dataset_and_catch_errors,
+                    registered_datasets.keys(),
+                    registered_datasets.values(),
+                )
+            )
+        finally:
+            _process_pool = None
+    return [error for error in results if error]
+
+
+def _process_registered_datasets(
+    registered_datasets: dict[str, dict[str, str]],
+) -> list[dict[str, Any]]:
+    global _dataset_writer
+    errors: list[dict[str, Any]] = []
+    workers = int(os.environ.get("PIPELINE_WORKERS", "1"))
+    batch_size = int(os.environ.get("DATASET_WRITE_BATCH_SIZE", "50"))
+    dataset_writer = DatasetBatchWriter(batch_size) if batch_size > 1 else None
+    _dataset_writer = dataset_writer
+    try:
+        if workers > 1:
+            errors = _process_datasets_concurrently(registered_datasets, workers)
+        else:
+            for dataset_id, registry_metadata in registered_datasets.items():
+                error = _process_dataset_and_catch_errors(dataset_id, registry_metadata)
+                if error:
+                    errors.append(error)
+    finally:
+        _dataset_writer = None
+        if dataset_writer is not None:
+            dataset_writer.flush()
+    if dataset_writer is not None:
+        for dataset_id, message in dataset_writer.errors.items():
+            if dataset_id in _run_datasets:
+                _run_datasets[dataset_id].outcome = "failed"
+                _run_datasets[dataset_id].error_message = message
             errors.append(
                 {
                     "dataset_id": dataset_id,
-                    "source_url": registry_metadata["source_url"],
-                    "message": str(e),
+                    "source_url": registered_datasets[dataset_id]["source_url"],
+                    "message": f"Failed to update metadata for dataset: {message}",
                 }
             )
-    if errors:
-        logger.error(
-            f"Errors while processing registry: {json.dumps(errors, indent=4)}"
-        )
-        send_notification(errors)
+    return errors
+
+
+def process_registry() -> None:
+    global _run_id
+    run_start = time.perf_counter()
+    reset_measurements()
+    _run_datasets.clear()
+    registered_datasets = fetch_registered_datasets()
+    _run_id = _start_pipeline_run()
+    errors: list[dict[str, Any]] = []
+    try:
+        process_deleted_datasets(registered_datasets)
+        errors = _process_registered_datasets(registered_datasets)
+        if errors:
+            logger.error(
+                f"Errors while processing registry: {json.dumps(errors, indent=4)}"
+            )
+            send_notification(errors)
+        _prune_validation_results()
+    finally:
+        # Record the end of the run even if it failed part way through
+        if _run_id is not None:
+            _finish_pipeline_run(_run_id, errors)
+            _run_id = None
+    metrics_path = os.environ.get("METRICS_TEXTFILE_PATH")
+    if metrics_path:
+        try:
+            write_prometheus_textfile(
+                metrics_path, time.perf_counter() - run_start, len(errors)
+            )
+        except Exception as e:
+            logger.warning(f"Failed to write metrics with error {e}")
     logger.info("Finished processing all datasets")
 
 
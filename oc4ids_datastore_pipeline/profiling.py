@@ -0,0 +1,155 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import threading
+import tracemalloc
+from concurrent.futures import Executor, Future
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+_T = TypeVar("_T")
+
+_state = threading.local()
+_profiler_lock = threading.Lock()
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+
+
+class InlineExecutor(Executor):
+    """
+    Runs submitted functions immediately in the calling thread, so that they are seen
+    by the profiler.
+    """
+
+    def submit(self, fn: Callable[..., _T], /, *args: Any, **kwargs: Any) -> Future[_T]:
+        future: Future[_T] = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+
+def _get_profiled_dataset_ids() -> Optional[set[str]]:
+    value = os.environ.get("PROFILE_DATASETS", "").strip()
+    if not value:
+        return None
+    return {dataset_id.strip() for dataset_id in value.split(",")}
+
+
+def is_profiled(dataset_id: str) -> bool:
+    dataset_ids = _get_profiled_dataset_ids()
+    return dataset_ids is not None and ("*" in dataset_ids or dataset_id in dataset_ids)
+
+
+def is_profiling() -> bool:
+    """
+    Returns whether a stage is being profiled in the current thread, in which case
+    CPU-bound work should run in this thread rather than in other processes.
+    """
+    return bool(getattr(_state, "profiling", False))
+
+
+def _start_tracemalloc() -> None:
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(int(os.environ.get("PROFILE_TRACEMALLOC_FRAMES", "10")))
+        _tracemalloc_users += 1
+
+
+def _stop_tracemalloc() -> None:
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0:
+            tracemalloc.stop()
+
+
+def _start_profiler() -> Optional[cProfile.Profile]:
+    """
+    Starts a cProfile profiler, or returns None if another stage is being profiled,
+    as only one profiler can be active in a process at a time.
+    """
+    if not _profiler_lock.acquire(blocking=False):
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiling tool, such as a debugger, is already active
+        _profiler_lock.release()
+        return None
+    return profiler
+
+
+def _stop_profiler(profiler: cProfile.Profile) -> None:
+    try:
+        profiler.disable()
+    finally:
+        _profiler_lock.release()
+
+
+def _write_profile(
+    profile_dir: str,
+    stage: str,
+    profiler: Optional[cProfile.Profile],
+    snapshot: tracemalloc.Snapshot,
+    peak_traced: int,
+) -> None:
+    top_n = int(os.environ.get("PROFILE_TOP_N", "25"))
+    os.makedirs(profile_dir, exist_ok=True)
+    with open(os.path.join(profile_dir, f"{stage}.txt"), "w") as file:
+        if profiler is not None:
+            profiler.dump_stats(os.path.join(profile_dir, f"{stage}.prof"))
+            cpu_stats = io.StringIO()
+            stats = pstats.Stats(profiler, stream=cpu_stats)
+            stats.sort_stats("cumulative").print_stats(top_n)
+            file.write(f"# CPU: top {top_n} functions by cumulative time\n")
+            file.write(cpu_stats.getvalue())
+        else:
+            file.write("# CPU: not profiled, another stage was being profiled\n")
+        file.write(f"\n# Memory: peak traced {peak_traced} bytes\n")
+        file.write(f"# Memory: top {top_n} lines by size allocated and not freed\n")
+        for statistic in snapshot.statistics("lineno")[:top_n]:
+            file.write(f"{statistic}\n")
+
+
+@contextmanager
+def profile_stage(dataset_id: str, stage: str) -> Iterator[None]:
+    """
+    Profiles the stage if the dataset is in PROFILE_DATASETS, writing cProfile stats
+    and the top allocations from tracemalloc to `data/{dataset_id}/profile/`.
+
+    tracemalloc traces the whole process, so allocations from other datasets being
+    processed at the same time are included. Only one stage can be profiled with
+    cProfile at a time, so stages that overlap with it only have their memory
+    profiled.
+    """
+    if not is_profiled(dataset_id):
+        yield
+        return
+    profiler = None
+    _start_tracemalloc()
+    try:
+        tracemalloc.reset_peak()
+        profiler = _start_profiler()
+        _state.profiling = True
+        yield
+    finally:
+        if profiler is not None:
+            _stop_profiler(profiler)
+        _state.profiling = False
+        snapshot = tracemalloc.take_snapshot()
+        _, peak_traced = tracemalloc.get_traced_memory()
+        _stop_tracemalloc()
+        profile_dir = os.path.join("data", dataset_id, "profile")
+        try:
+            _write_profile(profile_dir, stage, profiler, snapshot, peak_traced)
+            logger.info(f"Wrote {stage} profile for dataset {dataset_id}")
+        except Exception as e:
+            logger.warning(f"Failed to write profile for {dataset_id} with error {e}")
@@ -1,36 +1,173 @@
 import logging
-from typing import Optional
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
 
-import requests
+from oc4ids_datastore_pipeline.database import (
+    RegistryResponse,
+    get_registry_responses,
+    save_registry_responses,
+)
+from oc4ids_datastore_pipeline.http_client import http_get
 
 logger = logging.getLogger(__name__)
 
+DATASETS_LIST_URL = "https://opendataservices.github.io/oc4ids-registry/datatig/type/dataset/records_api.json"  # noqa: E501
+
 
 _license_mappings = None
 
 
+def _get_conditional_headers(cached: dict[str, Any]) -> dict[str, str]:
+    headers = {}
+    if cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+    if cached.get("last_modified"):
+        headers["If-Modified-Since"] = cached["last_modified"]
+    return headers
+
+
+def _fetch_registered_dataset(
+    api_url: str, cached: Optional[dict[str, Any]] = None
+) -> dict[str, Any]:
+    """
+    Fetches the registry record, conditionally with the validators of the cached
+    response if given, which is returned as it is if the record has not changed.
+    """
+    conditional_headers = _get_conditional_headers(cached) if cached else {}
+    r = http_get(api_url, headers=conditional_headers)
+    if cached and conditional_headers and r.status_code == 304:
+        return cached
+    r.raise_for_status()
+    r_data_json = r.json()
+    return {
+        "etag": r.headers.get("ETag"),
+        "last_modified": r.headers.get("Last-Modified"),
+        "content": {
+            "source_url": r_data_json["fields"]["url"]["value"],
+            "country": r_data_json["fields"]["country"]["value"],
+            "portal_title": r_data_json["fields"]["portal_title"]["value"],
+            "portal_url": r_data_json["fields"]["portal_url"]["value"],
+        },
+    }
+
+
+def _is_snapshot_enabled() -> bool:
+    return bool(int(os.environ.get("REGISTRY_SNAPSHOT_ENABLED", "1")))
+
+
+def _load_snapshot() -> dict[str, dict[str, Any]]:
+    """
+    Returns the registry responses saved in the database by the last run, by URL.
+    """
+    try:
+        return {
+            registry_response.url: {
+                "etag": registry_response.http_etag,
+                "last_modified": registry_response.http_last_modified,
+                "content": registry_response.content,
+            }
+            for registry_response in get_registry_responses()
+        }
+    except Exception as e:
+        logger.warning(f"Failed to load registry snapshot with error {e}")
+        return {}
+
+
+def _save_snapshot(snapshot: dict[str, dict[str, Any]]) -> None:
+    try:
+        save_registry_responses(
+            [
+                RegistryResponse(
+                    url=url,
+                    http_etag=response["etag"],
+                    http_last_modified=response["last_modified"],
+                    content=response["content"],
+                )
+                for url, response in snapshot.items()
+            ]
+        )
+    except Exception as e:
+        logger.warning(f"Failed to save registry snapshot with error {e}")
+
+
+def _get_snapshot_datasets(
+    snapshot: dict[str, dict[str, Any]],
+) -> dict[str, dict[str, str]]:
+    api_urls: dict[str, str] = snapshot.get(DATASETS_LIST_URL, {}).get("content", {})
+    return {
+        dataset_id: snapshot[api_url]["content"]
+        for dataset_id, api_url in api_urls.items()
+        if api_url in snapshot
+    }
+
+
 def fetch_registered_datasets() -> dict[str, dict[str, str]]:
+    """
+    Fetches the registered datasets. Unless REGISTRY_SNAPSHOT_ENABLED is 0, the
+    datasets list and each dataset's record are fetched conditionally with the
+    validators saved in the database by the last run, and records that have not
+    changed are taken from the database. If the registry cannot be reached, the
+    datasets saved by the last run are returned.
+    """
     logger.info("Fetching registered datasets list from registry")
+    snapshot = _load_snapshot() if _is_snapshot_enabled() else {}
     try:
-        url = "https://opendataservices.github.io/oc4ids-registry/datatig/type/dataset/records_api.json"  # noqa: E501
-        r = requests.get(url)
-        r.raise_for_status()
-        json_data = r.json()
-        registered_datasets = {}
-        for key, value in json_data["records"].items():
-            r_data = requests.get(value["api_url"])
-            r_data.raise_for_status()
-            r_data_json = r_data.json()
-            registered_datasets[key] = {
-                "source_url": r_data_json["fields"]["url"]["value"],
-                "country": r_data_json["fields"]["country"]["value"],
-                "portal_title": r_data_json["fields"]["portal_title"]["value"],
-                "portal_url": r_data_json["fields"]["portal_url"]["value"],
+        concurrency = int(os.environ.get("REGISTRY_FETCH_CONCURRENCY", "8"))
+        cached_list = snapshot.get(DATASETS_LIST_URL)
+        conditional_headers = (
+            _get_conditional_headers(cached_list) if cached_list else {}
+        )
+        r = http_get(DATASETS_LIST_URL, headers=conditional_headers)
+        if cached_list and conditional_headers and r.status_code == 304:
+            logger.info("Registry datasets list has not changed since the last run")
+            datasets_list = cached_list
+        else:
+            r.raise_for_status()
+            json_data = r.json()
+            datasets_list = {
+                "etag": r.headers.get("ETag"),
+                "last_modified": r.headers.get("Last-Modified"),
+                "content": {
+                    dataset_id: record["api_url"]
+                    for dataset_id, record in json_data["records"].items()
+                },
             }
+        api_urls: dict[str, str] = datasets_list["content"]
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            records = dict(
+                zip(
+                    api_urls.values(),
+                    executor.map(
+                        lambda api_url: _fetch_registered_dataset(
+                            api_url, snapshot.get(api_url)
+                        ),
+                        api_urls.values(),
+                    ),
+                )
+            )
+        unchanged_count = sum(
+            1 for api_url, record in records.items() if record is snapshot.get(api_url)
+        )
+        logger.info(
+            f"Fetched {len(records) - unchanged_count} new or changed registry "
+            f"records, {unchanged_count} unchanged since the last run"
+        )
+        new_snapshot = {DATASETS_LIST_URL: datasets_list, **records}
+        registered_datasets = _get_snapshot_datasets(new_snapshot)
+        if _is_snapshot_enabled():
+            _save_snapshot(new_snapshot)
         registered_datasets_count = len(registered_datasets)
         logger.info(f"Fetched URLs for {registered_datasets_count} datasets")
     except Exception as e:
-        raise Exception("Failed to fetch datasets list from registry", e)
+        registered_datasets = _get_snapshot_datasets(snapshot)
+        if not registered_datasets:
+            raise Exception("Failed to fetch datasets list from registry", e)
+        logger.warning(
+            f"Failed to fetch datasets list from registry with error {e}, "
+            f"using the snapshot from the last run"
+        )
+        registered_datasets_count = len(registered_datasets)
     if registered_datasets_count < 1:
         raise Exception(
             "Zero datasets returned from registry, likely an upstream error"
@@ -42,7 +179,7 @@ def fetch_license_mappings() -> dict[str, dict[str, Optional[str]]]:
     logger.info("Fetching license mappings from registry")
     try:
         url = "https://opendataservices.github.io/oc4ids-registry/datatig/type/license/records_api.json"  # noqa: E501
-        r = requests.get(url)
+        r = http_get(url)
         r.raise_for_status()
         json_data = r.json()
         return {
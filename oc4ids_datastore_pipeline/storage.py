@@ -1,11 +1,20 @@
+import gzip
+import hashlib
+import itertools
 import logging
 import os
+import shutil
+import threading
 import zipfile
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Iterable, Iterator, Optional
 
 import boto3
 import botocore
+from boto3.s3.transfer import TransferConfig
+from s3transfer.utils import ChunksizeAdjuster
 
 logger = logging.getLogger(__name__)
 
@@ -15,32 +24,155 @@ BUCKET_NAME = os.environ.get("BUCKET_NAME")
 BUCKET_ACCESS_KEY_ID = os.environ.get("BUCKET_ACCESS_KEY_ID")
 BUCKET_ACCESS_KEY_SECRET = os.environ.get("BUCKET_ACCESS_KEY_SECRET")
 
+_client = None
+_client_lock = threading.Lock()
+
+
+def _get_default_pool_connections() -> int:
+    """
+    Returns enough connections for the three files of each dataset being processed
+    at once to be uploaded in parts of the maximum concurrency, so connections are
+    not discarded when the pool is full.
+    """
+    max_concurrency = int(os.environ.get("UPLOAD_MAX_CONCURRENCY", "10"))
+    workers = int(os.environ.get("PIPELINE_WORKERS", "1"))
+    return 3 * max_concurrency * max(workers, 1)
+
 
 def _get_client() -> Any:
-    session = boto3.session.Session()
-    return session.client(
-        "s3",
-        endpoint_url=f"https://{BUCKET_REGION}.digitaloceanspaces.com/",
-        config=botocore.config.Config(s3={"addressing_style": "virtual"}),
-        region_name=BUCKET_REGION,
-        aws_access_key_id=BUCKET_ACCESS_KEY_ID,
-        aws_secret_access_key=BUCKET_ACCESS_KEY_SECRET,
+    """
+    Returns a client shared by the whole process, so connections to the bucket are
+    reused. Clients, unlike sessions, are safe to share between threads.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            max_pool_connections = int(
+                os.environ.get(
+                    "BUCKET_MAX_POOL_CONNECTIONS", str(_get_default_pool_connections())
+                )
+            )
+            session = boto3.session.Session()
+            _client = session.client(
+                "s3",
+                endpoint_url=f"https://{BUCKET_REGION}.digitaloceanspaces.com/",
+                config=botocore.config.Config(
+                    s3={"addressing_style": "virtual"},
+                    max_pool_connections=max_pool_connections,
+                ),
+                region_name=BUCKET_REGION,
+                aws_access_key_id=BUCKET_ACCESS_KEY_ID,
+                aws_secret_access_key=BUCKET_ACCESS_KEY_SECRET,
+            )
+        return _client
+
+
+def _get_transfer_config() -> TransferConfig:
+    return TransferConfig(
+        multipart_threshold=int(
+            os.environ.get("UPLOAD_MULTIPART_THRESHOLD", str(8 * 1024 * 1024))
+        ),
+        multipart_chunksize=int(
+            os.environ.get("UPLOAD_MULTIPART_CHUNKSIZE", str(8 * 1024 * 1024))
+        ),
+        max_concurrency=int(os.environ.get("UPLOAD_MAX_CONCURRENCY", "10")),
+    )
+
+
+def _get_etag(local_path: str, transfer_config: TransferConfig) -> str:
+    """
+    Returns the ETag the bucket reports for the file when uploaded with the transfer
+    config: the MD5 digest of the file, or for multipart uploads the MD5 digest of
+    the parts' digests followed by the number of parts.
+    """
+    file_size = os.path.getsize(local_path)
+    if file_size < transfer_config.multipart_threshold:
+        digest = hashlib.md5(usedforsecurity=False)
+        with open(local_path, "rb") as file:
+            while chunk := file.read(1024 * 1024):
+                digest.update(chunk)
+        return f'"{digest.hexdigest()}"'
+    chunk_size = ChunksizeAdjuster().adjust_chunksize(
+        transfer_config.multipart_chunksize, file_size
+    )
+    part_digests = []
+    with open(local_path, "rb") as file:
+        while chunk := file.read(chunk_size):
+            part_digests.append(hashlib.md5(chunk, usedforsecurity=False).digest())
+    digest = hashlib.md5(b"".join(part_digests), usedforsecurity=False)
+    return f'"{digest.hexdigest()}-{len(part_digests)}"'
+
+
+def _has_headers(response: dict[str, Any], extra_args: dict[str, Any]) -> bool:
+    """
+    Returns whether the object has the headers it would be uploaded with, so that
+    changes to them are applied to unchanged files.
+    """
+    return all(
+        response.get(key) == extra_args.get(key)
+        for key in ("CacheControl", "ContentType", "ContentEncoding")
     )
 
 
-def _upload_file(local_path: str, bucket_path: str, content_type: str) -> Optional[str]:
+def _is_uploaded(
+    client: Any,
+    local_path: str,
+    bucket_path: str,
+    transfer_config: TransferConfig,
+    extra_args: dict[str, Any],
+) -> bool:
+    if not bool(int(os.environ.get("UPLOAD_SKIP_UNCHANGED", "1"))):
+        return False
+    try:
+        response = client.head_object(Bucket=BUCKET_NAME, Key=bucket_path)
+        return bool(
+            response["ETag"] == _get_etag(local_path, transfer_config)
+            and _has_headers(response, extra_args)
+        )
+    except Exception as e:
+        logger.debug(f"Could not compare {local_path} to {bucket_path}: {e}")
+        return False
+
+
+def _get_public_url(bucket_path: str) -> str:
+    return (
+        f"https://{BUCKET_NAME}.{BUCKET_REGION}.digitaloceanspaces.com/" + bucket_path
+    )
+
+
+def _get_extra_args(
+    content_type: str, content_encoding: Optional[str] = None
+) -> dict[str, str]:
+    extra_args = {"ACL": "public-read", "ContentType": content_type}
+    if content_encoding:
+        extra_args["ContentEncoding"] = content_encoding
+    cache_control = os.environ.get("UPLOAD_CACHE_CONTROL")
+    if cache_control:
+        extra_args["CacheControl"] = cache_control
+    return extra_args
+
+
+def _upload_file(
+    local_path: str,
+    bucket_path: str,
+    content_type: str,
+    content_encoding: Optional[str] = None,
+) -> Optional[str]:
     try:
-        logger.info(f"Uploading file {local_path}")
         client = _get_client()
+        transfer_config = _get_transfer_config()
+        public_url = _get_public_url(bucket_path)
+        extra_args = _get_extra_args(content_type, content_encoding)
+        if _is_uploaded(client, local_path, bucket_path, transfer_config, extra_args):
+            logger.info(f"File {local_path} is unchanged at {public_url}, skipping")
+            return public_url
+        logger.info(f"Uploading file {local_path}")
         client.upload_file(
             local_path,
             BUCKET_NAME,
             bucket_path,
-            ExtraArgs={"ACL": "public-read", "ContentType": content_type},
-        )
-        public_url = (
-            f"https://{BUCKET_NAME}.{BUCKET_REGION}.digitaloceanspaces.com/"
-            + bucket_path
+            ExtraArgs=extra_args,
+            Config=transfer_config,
         )
         logger.info(f"Uploaded to {public_url}")
         return public_url
@@ -49,29 +181,273 @@ def _upload_file(local_path: str, bucket_path: str, content_type: str) -> Option
         return None
 
 
+def _get_json_content_encoding() -> Optional[str]:
+    content_encoding = os.environ.get("UPLOAD_JSON_CONTENT_ENCODING")
+    if not content_encoding:
+        return None
+    if content_encoding not in ("gzip", "br"):
+        logger.warning(
+            f"Unsupported content encoding {content_encoding}, uploading uncompressed"
+        )
+        return None
+    if content_encoding == "br":
+        try:
+            import brotli  # noqa: F401
+        except ImportError:
+            logger.warning("brotli is not installed, uploading with gzip instead")
+            return "gzip"
+    return content_encoding
+
+
+def _compress_file(local_path: str, content_encoding: str) -> str:
+    """
+    Compresses the file next to itself and returns the path of the compressed file.
+    The output depends only on the contents, so unchanged files can still be skipped.
+    """
+    compressed_path = f"{local_path}.{'gz' if content_encoding == 'gzip' else 'br'}"
+    with open(local_path, "rb") as source, open(compressed_path, "wb") as destination:
+        if content_encoding == "gzip":
+            level = int(os.environ.get("UPLOAD_GZIP_LEVEL", "6"))
+            with gzip.GzipFile(
+                filename="",
+                mode="wb",
+                compresslevel=level,
+                fileobj=destination,
+                mtime=0,
+            ) as gzip_file:
+                shutil.copyfileobj(source, gzip_file)
+        else:
+            import brotli
+
+            quality = int(os.environ.get("UPLOAD_BROTLI_QUALITY", "9"))
+            compressor = brotli.Compressor(quality=quality)
+            while chunk := source.read(1024 * 1024):
+                destination.write(compressor.process(chunk))
+            destination.write(compressor.finish())
+    return compressed_path
+
+
 def _upload_json(dataset_id: str, json_path: str) -> Optional[str]:
-    return _upload_file(
-        local_path=json_path,
-        bucket_path=f"{dataset_id}/{dataset_id}.json",
-        content_type="application/json",
-    )
+    content_encoding = _get_json_content_encoding()
+    if not content_encoding:
+        return _upload_file(
+            local_path=json_path,
+            bucket_path=f"{dataset_id}/{dataset_id}.json",
+            content_type="application/json",
+        )
+    try:
+        compressed_path = _compress_file(json_path, content_encoding)
+    except Exception as e:
+        logger.warning(f"Failed to compress {json_path} with error {e}")
+        return None
+    try:
+        return _upload_file(
+            local_path=compressed_path,
+            bucket_path=f"{dataset_id}/{dataset_id}.json",
+            content_type="application/json",
+            content_encoding=content_encoding,
+        )
+    finally:
+        os.remove(compressed_path)
+
+
+class _StreamingUpload:
+    """
+    A file-like object that uploads what is written to it, without staging it on
+    disk. Content smaller than the multipart threshold is uploaded in one request
+    when closed; larger content is uploaded in parts of the multipart chunk size as
+    it is written, with up to the transfer config's maximum concurrency of parts in
+    flight at once.
+
+    Use as a context manager: the upload is completed on a clean exit and aborted if
+    an exception is raised.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        bucket_path: str,
+        extra_args: dict[str, Any],
+        transfer_config: TransferConfig,
+    ) -> None:
+        self._client = client
+        self._bucket_path = bucket_path
+        self._extra_args = extra_args
+        # Parts must be within the bucket's limits, which upload_file also ensures
+        self._chunk_size = ChunksizeAdjuster().adjust_chunksize(
+            transfer_config.multipart_chunksize
+        )
+        self._threshold = max(transfer_config.multipart_threshold, self._chunk_size)
+        self._max_pending_parts = transfer_config.max_request_concurrency
+        self._executor = ThreadPoolExecutor(max_workers=self._max_pending_parts)
+        self._buffer = bytearray()
+        self._upload_id: Optional[str] = None
+        self._parts: list[dict[str, Any]] = []
+        self._pending: deque[tuple[int, Future[Any]]] = deque()
+
+    def __enter__(self) -> "_StreamingUpload":
+        return self
+
+    def __exit__(self, exc_type: Any, exc_value: Any, traceback: Any) -> None:
+        try:
+            if exc_type is not None:
+                self._abort()
+                return
+            try:
+                self._complete()
+            except Exception:
+                self._abort()
+                raise
+        finally:
+            self._executor.shutdown(cancel_futures=True)
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        if self._upload_id is None and len(self._buffer) < self._threshold:
+            return len(data)
+        chunk_size = self._chunk_size
+        while len(self._buffer) >= chunk_size:
+            self._upload_part(bytes(self._buffer[:chunk_size]))
+            del self._buffer[:chunk_size]
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def _upload_part(self, data: bytes) -> None:
+        if self._upload_id is None:
+            response = self._client.create_multipart_upload(
+                Bucket=BUCKET_NAME, Key=self._bucket_path, **self._extra_args
+            )
+            self._upload_id = response["UploadId"]
+        if len(self._pending) >= self._max_pending_parts:
+            self._wait_for_part()
+        part_number = len(self._parts) + len(self._pending) + 1
+        future = self._executor.submit(
+            self._client.upload_part,
+            Bucket=BUCKET_NAME,
+            Key=self._bucket_path,
+            UploadId=self._upload_id,
+            PartNumber=part_number,
+            Body=data,
+        )
+        self._pending.append((part_number, future))
+
+    def _wait_for_part(self) -> None:
+        part_number, future = self._pending.popleft()
+        self._parts.append({"ETag": future.result()["ETag"], "PartNumber": part_number})
+
+    def _complete(self) -> None:
+        if self._upload_id is None:
+            self._client.put_object(
+                Body=bytes(self._buffer),
+                Bucket=BUCKET_NAME,
+                Key=self._bucket_path,
+                **self._extra_args,
+            )
+            return
+        if self._buffer:
+            self._upload_part(bytes(self._buffer))
+            self._buffer.clear()
+        while self._pending:
+            self._wait_for_part()
+        self._client.complete_multipart_upload(
+            Bucket=BUCKET_NAME,
+            Key=self._bucket_path,
+            UploadId=self._upload_id,
+            MultipartUpload={"Parts": self._parts},
+        )
+
+    def _abort(self) -> None:
+        if self._upload_id is None:
+            return
+        # Wait for the parts in flight, as parts uploaded after aborting are kept
+        self._executor.shutdown(cancel_futures=True)
+        self._client.abort_multipart_upload(
+            Bucket=BUCKET_NAME, Key=self._bucket_path, UploadId=self._upload_id
+        )
+
+
+def _get_csv_fingerprint(
+    directory: Path, file_paths: list[Path], compress_level: int
+) -> str:
+    """
+    Returns a digest of the CSV files and the compression level, which is stored
+    with the archive, as the archive is streamed and its ETag is not known upfront.
+    """
+    fingerprint = hashlib.sha256(f"deflate-{compress_level}".encode())
+    for file_path in file_paths:
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as file:
+            while chunk := file.read(1024 * 1024):
+                digest.update(chunk)
+        fingerprint.update(f"\0{file_path.relative_to(directory)}\0".encode())
+        fingerprint.update(digest.digest())
+    return fingerprint.hexdigest()
+
+
+def _has_fingerprint(
+    client: Any, bucket_path: str, fingerprint: str, extra_args: dict[str, Any]
+) -> bool:
+    if not bool(int(os.environ.get("UPLOAD_SKIP_UNCHANGED", "1"))):
+        return False
+    try:
+        response = client.head_object(Bucket=BUCKET_NAME, Key=bucket_path)
+        return bool(
+            response["Metadata"].get("fingerprint") == fingerprint
+            and _has_headers(response, extra_args)
+        )
+    except Exception as e:
+        logger.debug(f"Could not compare fingerprint of {bucket_path}: {e}")
+        return False
 
 
 def _upload_csv(dataset_id: str, csv_path: str) -> Optional[str]:
+    """
+    Zips the CSV files straight into the bucket, compressing the archive as it is
+    uploaded rather than writing it to disk first.
+    """
+    bucket_path = f"{dataset_id}/{dataset_id}_csv.zip"
     try:
         directory = Path(csv_path)
-        zip_file_path = f"{csv_path}_csv.zip"
-        with zipfile.ZipFile(zip_file_path, mode="w") as archive:
-            for file_path in directory.rglob("*"):
-                archive.write(file_path, arcname=file_path.relative_to(directory))
+        if not directory.is_dir():
+            raise FileNotFoundError(f"No such directory: {csv_path}")
+        file_paths = sorted(path for path in directory.rglob("*") if path.is_file())
+        compress_level = int(os.environ.get("UPLOAD_CSV_COMPRESSION_LEVEL", "6"))
+        fingerprint = _get_csv_fingerprint(directory, file_paths, compress_level)
+        client = _get_client()
+        public_url = _get_public_url(bucket_path)
+        extra_args: dict[str, Any] = {
+            **_get_extra_args("application/zip"),
+            "Metadata": {"fingerprint": fingerprint},
+        }
+        if _has_fingerprint(client, bucket_path, fingerprint, extra_args):
+            logger.info(f"Files in {csv_path} are unchanged at {public_url}, skipping")
+            return public_url
+        logger.info(f"Zipping and uploading files in {csv_path}")
+        with _StreamingUpload(
+            client, bucket_path, extra_args, _get_transfer_config()
+        ) as upload, zipfile.ZipFile(
+            upload,
+            mode="w",
+            compression=zipfile.ZIP_DEFLATED,
+            compresslevel=compress_level,
+        ) as archive:
+            for file_path in file_paths:
+                # The stream can't be rewound, so ZIP64 must be chosen up front
+                force_zip64 = file_path.stat().st_size > zipfile.ZIP64_LIMIT
+                with open(file_path, "rb") as source, archive.open(
+                    str(file_path.relative_to(directory)), "w", force_zip64=force_zip64
+                ) as destination:
+                    shutil.copyfileobj(source, destination, 1024 * 1024)
+        logger.info(f"Uploaded to {public_url}")
+        return public_url
     except Exception as e:
-        logger.warning(f"Failed to zip {csv_path} with error {e}")
+        logger.warning(f"Failed to zip and upload {csv_path} with error {e}")
         return None
-    return _upload_file(
-        local_path=zip_file_path,
-        bucket_path=f"{dataset_id}/{dataset_id}_csv.zip",
-        content_type="application/zip",
-    )
 
 
 def _upload_xlsx(dataset_id: str, xlsx_path: str) -> Optional[str]:
@@ -82,30 +458,73 @@ def _upload_xlsx(dataset_id: str, xlsx_path: str) -> Optional[str]:
     )
 
 
+def is_upload_enabled() -> bool:
+    return bool(int(os.environ.get("ENABLE_UPLOAD", "0")))
+
+
 def upload_files(
     dataset_id: str,
     json_path: Optional[str] = None,
     csv_path: Optional[str] = None,
     xlsx_path: Optional[str] = None,
 ) -> tuple[Optional[str], Optional[str], Optional[str]]:
-    if not bool(int(os.environ.get("ENABLE_UPLOAD", "0"))):
+    if not is_upload_enabled():
         logger.info("Upload is disabled, skipping")
         return None, None, None
-    json_public_url = _upload_json(dataset_id, json_path) if json_path else None
-    csv_public_url = _upload_csv(dataset_id, csv_path) if csv_path else None
-    xlsx_public_url = _upload_xlsx(dataset_id, xlsx_path) if xlsx_path else None
-    return json_public_url, csv_public_url, xlsx_public_url
+    # The files are independent, so upload them at the same time, which also
+    # overlaps zipping and compressing the files with the other uploads
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        json_future = (
+            executor.submit(_upload_json, dataset_id, json_path) if json_path else None
+        )
+        csv_future = (
+            executor.submit(_upload_csv, dataset_id, csv_path) if csv_path else None
+        )
+        xlsx_future = (
+            executor.submit(_upload_xlsx, dataset_id, xlsx_path) if xlsx_path else None
+        )
+    return (
+        json_future.result() if json_future else None,
+        csv_future.result() if csv_future else None,
+        xlsx_future.result() if xlsx_future else None,
+    )
 
 
-def delete_files_for_dataset(dataset_id: str) -> None:
-    logger.info(f"Deleting files for dataset {dataset_id}")
+def _list_keys(client: Any, prefix: str) -> Iterator[str]:
+    kwargs = {"Bucket": BUCKET_NAME, "Prefix": prefix}
+    while True:
+        response = client.list_objects_v2(**kwargs)
+        for obj in response.get("Contents", []):
+            yield obj["Key"]
+        if not response.get("IsTruncated"):
+            return
+        kwargs["ContinuationToken"] = response["NextContinuationToken"]
+
+
+def delete_files_for_datasets(dataset_ids: Iterable[str]) -> None:
+    """
+    Deletes the files of all the datasets, listing each dataset's files page by page
+    and deleting them across datasets in batches of the most keys one request takes.
+    """
     try:
         client = _get_client()
-        response = client.list_objects_v2(Bucket=BUCKET_NAME, Prefix=dataset_id)
-        if "Contents" in response:
-            objects_to_delete = [{"Key": obj["Key"]} for obj in response["Contents"]]
-            client.delete_objects(
-                Bucket=BUCKET_NAME, Delete={"Objects": objects_to_delete}
+        keys = itertools.chain.from_iterable(
+            _list_keys(client, f"{dataset_id}/") for dataset_id in dataset_ids
+        )
+        for batch in itertools.batched(keys, 1000):
+            logger.info(f"Deleting {len(batch)} files")
+            response = client.delete_objects(
+                Bucket=BUCKET_NAME,
+                Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True},
             )
+            for error in response.get("Errors", []):
+                logger.warning(
+                    f"Failed to delete {error['Key']} with error {error['Message']}"
+                )
     except Exception as e:
         logger.warning(f"Failed to delete files with error {e}")
+
+
+def delete_files_for_dataset(dataset_id: str) -> None:
+    logger.info(f"Deleting files for dataset {dataset_id}")
+    delete_files_for_datasets([dataset_id])
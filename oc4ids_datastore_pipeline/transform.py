@@ -0,0 +1,140 @@
+import csv
+import itertools
+import json
+import logging
+import os
+import shutil
+import tempfile
+from collections import deque
+from concurrent.futures import Executor, Future
+from typing import Iterator
+
+import flattentool
+import ijson
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.workbook.workbook import Workbook
+
+logger = logging.getLogger(__name__)
+
+
+def _write_batches(json_path: str, batch_dir: str, batch_size: int) -> Iterator[str]:
+    """
+    Streams the projects from the package into files of up to `batch_size` projects.
+    Only the projects are flattened, so the rest of the package is not copied.
+    """
+    with open(json_path, "rb") as file:
+        projects = ijson.items(file, "projects.item", use_float=True)
+        for index, batch in enumerate(itertools.batched(projects, batch_size)):
+            batch_path = os.path.join(batch_dir, f"batch_{index}.json")
+            with open(batch_path, "w") as batch_file:
+                json.dump({"projects": list(batch)}, batch_file)
+            yield batch_path
+
+
+def _flatten_batch(batch_path: str) -> str:
+    output_name = batch_path.removesuffix(".json")
+    flattentool.flatten(
+        batch_path,
+        output_name=output_name,
+        output_format="csv",
+        root_list_path="projects",
+        main_sheet_name="projects",
+    )  # type: ignore[no-untyped-call]
+    os.remove(batch_path)
+    return output_name
+
+
+def _get_sheet_headers(batch_dirs: list[str]) -> dict[str, list[str]]:
+    """
+    Returns the union of the headers of each sheet across the batches, in the order
+    the sheets and columns first appear, with the main sheet first.
+    """
+    headers: dict[str, list[str]] = {"projects": []}
+    for batch_dir in batch_dirs:
+        for file_name in sorted(os.listdir(batch_dir)):
+            sheet_name = file_name.removesuffix(".csv")
+            sheet_header = headers.setdefault(sheet_name, [])
+            with open(
+                os.path.join(batch_dir, file_name), newline="", encoding="utf-8"
+            ) as file:
+                for column in next(csv.reader(file), []):
+                    if column not in sheet_header:
+                        sheet_header.append(column)
+    return headers
+
+
+def _merge_csv_batches(
+    batch_dirs: list[str], headers: dict[str, list[str]], csv_path: str
+) -> None:
+    shutil.rmtree(csv_path, ignore_errors=True)
+    os.makedirs(csv_path)
+    for sheet_name, sheet_header in headers.items():
+        with open(
+            os.path.join(csv_path, f"{sheet_name}.csv"),
+            "w",
+            newline="",
+            encoding="utf-8",
+        ) as file:
+            writer = csv.DictWriter(file, sheet_header, lineterminator="\r\n")
+            writer.writeheader()
+            for batch_dir in batch_dirs:
+                batch_sheet_path = os.path.join(batch_dir, f"{sheet_name}.csv")
+                if not os.path.exists(batch_sheet_path):
+                    continue
+                with open(batch_sheet_path, newline="", encoding="utf-8") as batch_file:
+                    writer.writerows(csv.DictReader(batch_file))
+
+
+def _write_xlsx(csv_path: str, sheet_names: list[str], xlsx_path: str) -> None:
+    workbook = Workbook(write_only=True)  # type: ignore[no-untyped-call]
+    for sheet_name in sheet_names:
+        worksheet = workbook.create_sheet(
+            title=sheet_name[:31]
+        )  # type: ignore[no-untyped-call]
+        with open(
+            os.path.join(csv_path, f"{sheet_name}.csv"), newline="", encoding="utf-8"
+        ) as file:
+            for row in csv.reader(file):
+                worksheet.append(
+                    [ILLEGAL_CHARACTERS_RE.sub("", value) or None for value in row]
+                )
+    workbook.save(xlsx_path)  # type: ignore[no-untyped-call]
+
+
+def flatten_in_batches(
+    json_path: str,
+    csv_path: str,
+    xlsx_path: str,
+    batch_size: int,
+    executor: Executor,
+    max_pending_batches: int,
+) -> None:
+    """
+    Flattens the projects in the package in batches of `batch_size` projects using
+    the executor, then merges the sheets into CSV files at `csv_path` and an XLSX
+    file at `xlsx_path`.
+
+    At most `max_pending_batches` batches are written to disk ahead of the
+    executor, and at no point is the whole package loaded into memory. As the sheets
+    are merged from CSV, all cells in the XLSX file are text.
+    """
+    with tempfile.TemporaryDirectory(
+        dir=os.path.dirname(csv_path), ignore_cleanup_errors=True
+    ) as batch_dir:
+        pending: deque[Future[str]] = deque()
+        batch_dirs = []
+        try:
+            for batch_path in _write_batches(json_path, batch_dir, batch_size):
+                if len(pending) >= max_pending_batches:
+                    batch_dirs.append(pending.popleft().result())
+                pending.append(executor.submit(_flatten_batch, batch_path))
+            while pending:
+                batch_dirs.append(pending.popleft().result())
+        except Exception:
+            for future in pending:
+                future.cancel()
+            raise
+        logger.info(f"Flattened {len(batch_dirs)} batches, merging sheets")
+        headers = _get_sheet_headers(batch_dirs)
+        _merge_csv_batches(batch_dirs, headers, csv_path)
+        _write_xlsx(csv_path, list(headers), xlsx_path)
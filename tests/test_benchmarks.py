@@ -0,0 +1,55 @@
+import json
+import os
+import tempfile
+
+from benchmarks.generate import generate_projects, write_package
+from benchmarks.run import LocalBucket
+
+
+def test_write_package_is_seeded() -> None:
+    with tempfile.TemporaryDirectory() as dir:
+        path = os.path.join(dir, "package.json")
+        other_path = os.path.join(dir, "other_package.json")
+
+        size = write_package(path, 20, seed=1)
+        write_package(other_path, 20, seed=1)
+
+        assert size == os.path.getsize(path)
+        with open(path) as file, open(other_path) as other_file:
+            package = json.load(file)
+            assert package == json.load(other_file)
+    assert len(package["projects"]) == 20
+    assert package["projects"] == list(generate_projects(20, seed=1))
+    assert package["projects"] != list(generate_projects(20, seed=2))
+    assert package["version"] == "0.9"
+
+
+def test_local_bucket_multipart_upload() -> None:
+    with tempfile.TemporaryDirectory() as dir:
+        bucket = LocalBucket(dir)
+        upload_id = bucket.create_multipart_upload(Bucket=None, Key="a/b.zip")[
+            "UploadId"
+        ]
+        parts = [
+            {
+                "ETag": bucket.upload_part(
+                    Bucket=None,
+                    Key="a/b.zip",
+                    UploadId=upload_id,
+                    PartNumber=number,
+                    Body=body,
+                )["ETag"],
+                "PartNumber": number,
+            }
+            for number, body in [(2, b"world"), (1, b"hello ")]
+        ]
+
+        bucket.complete_multipart_upload(
+            Bucket=None,
+            Key="a/b.zip",
+            UploadId=upload_id,
+            MultipartUpload={"Parts": sorted(parts, key=lambda p: p["PartNumber"])},
+        )
+
+        with open(os.path.join(dir, "a", "b.zip"), "rb") as file:
+            assert file.read() == b"hello world"
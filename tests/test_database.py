@@ -3,14 +3,30 @@ from typing import Any, Generator
 
 import pytest
 from pytest_mock import MockerFixture
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
 
 from oc4ids_datastore_pipeline.database import (
     Base,
     Dataset,
+    DatasetBatchWriter,
+    PipelineRun,
+    PipelineRunDataset,
+    RegistryResponse,
+    ValidationResult,
     delete_dataset,
+    delete_datasets,
+    finish_pipeline_run,
+    get_dataset,
     get_dataset_ids,
+    get_registry_responses,
+    get_validation_result,
+    prune_validation_results,
     save_dataset,
+    save_registry_responses,
+    save_validation_result,
+    start_pipeline_run,
+    upsert_datasets,
 )
 
 
@@ -20,7 +36,7 @@ def before_and_after_each(mocker: MockerFixture) -> Generator[Any, Any, Any]:
     patch_get_engine = mocker.patch("oc4ids_datastore_pipeline.database.get_engine")
     patch_get_engine.return_value = engine
     Base.metadata.create_all(engine)
-    yield
+    yield engine
     engine.dispose()
 
 
@@ -37,6 +53,24 @@ def test_save_dataset() -> None:
     assert get_dataset_ids() == ["test_dataset"]
 
 
+def test_get_dataset() -> None:
+    dataset = Dataset(
+        dataset_id="test_dataset",
+        source_url="https://test_dataset.json",
+        publisher_name="test_publisher",
+        json_url="data/test_dataset.json",
+        http_etag='"etag"',
+        updated_at=datetime.datetime.now(datetime.UTC),
+    )
+    save_dataset(dataset)
+
+    saved_dataset = get_dataset("test_dataset")
+
+    assert saved_dataset is not None
+    assert saved_dataset.http_etag == '"etag"'
+    assert get_dataset("missing_dataset") is None
+
+
 def test_delete_dataset() -> None:
     dataset = Dataset(
         dataset_id="test_dataset",
@@ -52,3 +86,205 @@ def test_delete_dataset() -> None:
     delete_dataset("test_dataset")
 
     assert get_dataset_ids() == []
+
+
+def test_delete_datasets() -> None:
+    for dataset_id in ["dataset_a", "dataset_b", "dataset_c"]:
+        save_dataset(
+            Dataset(
+                dataset_id=dataset_id,
+                source_url=f"https://{dataset_id}.json",
+                publisher_name="test_publisher",
+                json_url=f"data/{dataset_id}.json",
+                updated_at=datetime.datetime.now(datetime.UTC),
+            )
+        )
+
+    delete_datasets(["dataset_a", "dataset_c"])
+
+    assert get_dataset_ids() == ["dataset_b"]
+
+
+def make_dataset(dataset_id: str, **kwargs: Any) -> Dataset:
+    return Dataset(
+        dataset_id=dataset_id,
+        source_url=f"https://{dataset_id}.json",
+        publisher_name="test_publisher",
+        updated_at=datetime.datetime.now(datetime.UTC),
+        **kwargs,
+    )
+
+
+def test_upsert_datasets() -> None:
+    save_dataset(make_dataset("existing_dataset", http_etag='"etag"'))
+
+    upsert_datasets(
+        [
+            make_dataset("existing_dataset", json_url="data/existing_dataset.json"),
+            make_dataset("new_dataset", json_url="data/new_dataset.json"),
+        ]
+    )
+
+    assert sorted(get_dataset_ids()) == ["existing_dataset", "new_dataset"]
+    existing_dataset = get_dataset("existing_dataset")
+    assert existing_dataset is not None
+    assert existing_dataset.json_url == "data/existing_dataset.json"
+    # Columns that were not assigned are kept, as with merge
+    assert existing_dataset.http_etag == '"etag"'
+
+
+def test_dataset_batch_writer_writes_full_batches(mocker: MockerFixture) -> None:
+    patch_upsert_datasets = mocker.patch(
+        "oc4ids_datastore_pipeline.database.upsert_datasets"
+    )
+    writer = DatasetBatchWriter(batch_size=2)
+
+    writer.add(make_dataset("dataset_a"))
+    patch_upsert_datasets.assert_not_called()
+    writer.add(make_dataset("dataset_b"))
+    patch_upsert_datasets.assert_called_once()
+    writer.add(make_dataset("dataset_c"))
+    writer.flush()
+
+    assert [
+        [dataset.dataset_id for dataset in call.args[0]]
+        for call in patch_upsert_datasets.call_args_list
+    ] == [["dataset_a", "dataset_b"], ["dataset_c"]]
+    assert writer.errors == {}
+
+
+def test_dataset_batch_writer_saves_failed_batch_one_by_one(
+    mocker: MockerFixture,
+) -> None:
+    patch_upsert_datasets = mocker.patch(
+        "oc4ids_datastore_pipeline.database.upsert_datasets"
+    )
+    patch_upsert_datasets.side_effect = Exception("Mock exception")
+    writer = DatasetBatchWriter(batch_size=10)
+
+    writer.add(make_dataset("dataset_a"))
+    # Missing the required publisher_name
+    writer.add(Dataset(dataset_id="dataset_b", source_url="https://dataset_b.json"))
+    writer.flush()
+
+    assert get_dataset_ids() == ["dataset_a"]
+    assert list(writer.errors) == ["dataset_b"]
+
+
+def test_save_validation_result() -> None:
+    save_validation_result(
+        ValidationResult(
+            content_hash="abc123",
+            validator_version="libcoveoc4ids==0.9.0",
+            errors_count=1,
+            errors=[['{"message": "Error"}', [{"path": "projects/0"}]]],
+            created_at=datetime.datetime.now(datetime.UTC),
+        )
+    )
+
+    validation_result = get_validation_result("abc123", "libcoveoc4ids==0.9.0")
+
+    assert validation_result is not None
+    assert validation_result.errors_count == 1
+    assert validation_result.errors == [
+        ['{"message": "Error"}', [{"path": "projects/0"}]]
+    ]
+    assert get_validation_result("abc123", "libcoveoc4ids==1.0.0") is None
+
+
+def test_prune_validation_results() -> None:
+    now = datetime.datetime.now(datetime.UTC)
+    dataset = Dataset(
+        dataset_id="test_dataset",
+        source_url="https://test_dataset.json",
+        publisher_name="test_publisher",
+        updated_at=now,
+        content_hash="stored",
+    )
+    save_dataset(dataset)
+    for content_hash, created_at in [
+        ("stored", now - datetime.timedelta(days=60)),
+        ("old", now - datetime.timedelta(days=60)),
+        ("recent", now),
+    ]:
+        save_validation_result(
+            ValidationResult(
+                content_hash=content_hash,
+                validator_version="libcoveoc4ids==0.9.0",
+                errors_count=0,
+                errors=[],
+                created_at=created_at,
+            )
+        )
+
+    deleted_count = prune_validation_results(now - datetime.timedelta(days=30))
+
+    assert deleted_count == 1
+    assert get_validation_result("stored", "libcoveoc4ids==0.9.0") is not None
+    assert get_validation_result("old", "libcoveoc4ids==0.9.0") is None
+    assert get_validation_result("recent", "libcoveoc4ids==0.9.0") is not None
+
+
+def test_start_and_finish_pipeline_run(before_and_after_each: Any) -> None:
+    started_at = datetime.datetime(2026, 1, 1, tzinfo=datetime.UTC)
+    finished_at = datetime.datetime(2026, 1, 1, 1, tzinfo=datetime.UTC)
+
+    run_id = start_pipeline_run(started_at)
+    finish_pipeline_run(
+        run_id,
+        finished_at,
+        error_count=1,
+        run_datasets=[
+            PipelineRunDataset(
+                run_id=run_id,
+                dataset_id="dataset_a",
+                started_at=started_at,
+                outcome="processed",
+                downloaded_bytes=5_000_000_000,
+                download_seconds=1.5,
+            ),
+            PipelineRunDataset(
+                run_id=run_id,
+                dataset_id="dataset_b",
+                started_at=started_at,
+                outcome="failed",
+                error_message="Mock exception",
+            ),
+        ],
+    )
+
+    with Session(before_and_after_each) as session:
+        pipeline_run = session.get_one(PipelineRun, run_id)
+        assert pipeline_run.dataset_count == 2
+        assert pipeline_run.error_count == 1
+        run_datasets = session.scalars(
+            select(PipelineRunDataset).order_by(PipelineRunDataset.dataset_id)
+        ).all()
+        assert [run_dataset.outcome for run_dataset in run_datasets] == [
+            "processed",
+            "failed",
+        ]
+        assert run_datasets[0].downloaded_bytes == 5_000_000_000
+
+
+def test_save_registry_responses_replaces_saved_responses() -> None:
+    save_registry_responses(
+        [
+            RegistryResponse(url="https://a.example.com", content={"a": 1}),
+            RegistryResponse(url="https://b.example.com", content={"b": 1}),
+        ]
+    )
+
+    save_registry_responses(
+        [
+            RegistryResponse(
+                url="https://b.example.com", http_etag='"etag"', content={"b": 2}
+            )
+        ]
+    )
+
+    registry_responses = get_registry_responses()
+    assert [
+        (response.url, response.http_etag, response.content)
+        for response in registry_responses
+    ] == [("https://b.example.com", '"etag"', {"b": 2})]
@@ -0,0 +1,131 @@
+import io
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator
+
+import pytest
+import requests
+from pytest_mock import MockerFixture
+
+from oc4ids_datastore_pipeline import http_client
+from oc4ids_datastore_pipeline.http_client import http_get, http_request
+
+
+@pytest.fixture(autouse=True)
+def reset_http_client(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(http_client, "_session", None)
+    monkeypatch.setattr(http_client, "_host_limiters", {})
+
+
+@pytest.fixture
+def flaky_server() -> Iterator[tuple[str, list[str]]]:
+    requests_received: list[str] = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            requests_received.append(self.path)
+            status = 503 if len(requests_received) < 3 else 200
+            self.send_response(status)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, *args: object) -> None:
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}", requests_received
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_http_request_uses_shared_session_with_timeouts(
+    mocker: MockerFixture, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("HTTP_CONNECT_TIMEOUT", "5")
+    monkeypatch.setenv("HTTP_READ_TIMEOUT", "30")
+    patch_request = mocker.patch("requests.Session.request")
+
+    http_get("https://example.com/a.json", stream=True)
+    http_request("HEAD", "https://example.com/b.json", timeout=1)
+
+    assert patch_request.call_args_list == [
+        mocker.call(
+            "GET", "https://example.com/a.json", stream=True, timeout=(5.0, 30.0)
+        ),
+        mocker.call("HEAD", "https://example.com/b.json", timeout=1),
+    ]
+    assert http_client.get_session() is http_client.get_session()
+
+
+def test_http_request_retries_transient_errors(
+    monkeypatch: pytest.MonkeyPatch, flaky_server: tuple[str, list[str]]
+) -> None:
+    monkeypatch.setenv("HTTP_BACKOFF_FACTOR", "0")
+    url, requests_received = flaky_server
+
+    response = http_get(f"{url}/dataset.json")
+
+    assert response.status_code == 200
+    assert requests_received == ["/dataset.json"] * 3
+
+
+def test_http_request_returns_last_response_when_retries_exhausted(
+    monkeypatch: pytest.MonkeyPatch, flaky_server: tuple[str, list[str]]
+) -> None:
+    monkeypatch.setenv("HTTP_RETRIES", "1")
+    monkeypatch.setenv("HTTP_BACKOFF_FACTOR", "0")
+    url, requests_received = flaky_server
+
+    response = http_get(f"{url}/dataset.json")
+
+    assert response.status_code == 503
+    assert len(requests_received) == 2
+
+
+def _response(*args: object, **kwargs: object) -> requests.Response:
+    response = requests.Response()
+    response.raw = io.BytesIO(b"{}")
+    return response
+
+
+def test_http_request_holds_host_slot_until_streamed_response_closed(
+    mocker: MockerFixture, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("HTTP_MAX_CONNECTIONS_PER_HOST", "1")
+    mocker.patch("requests.Session.request", side_effect=_response)
+    other_host_response = http_get("https://other.example.com/a.json", stream=True)
+    response = http_get("https://example.com/a.json", stream=True)
+    second_request_sent = threading.Event()
+
+    def send_second_request() -> None:
+        http_get("https://example.com/b.json")
+        second_request_sent.set()
+
+    thread = threading.Thread(target=send_second_request, daemon=True)
+    thread.start()
+
+    assert not second_request_sent.wait(0.2)
+    with response:
+        pass
+    assert second_request_sent.wait(5)
+    thread.join(5)
+    # Closing again does not release the slot twice
+    response.close()
+    other_host_response.close()
+
+
+def test_host_limiter_limits_request_rate() -> None:
+    limiter = http_client._HostLimiter(10, 20)
+
+    start = time.monotonic()
+    for _ in range(3):
+        limiter.acquire()
+        limiter.release()
+
+    assert time.monotonic() - start >= 0.09
@@ -0,0 +1,73 @@
+import os
+import time
+
+import pytest
+
+from oc4ids_datastore_pipeline.isolation import (
+    IsolatedProcessError,
+    ResourceLimitExceeded,
+    get_tree_rss,
+    run_isolated,
+)
+
+
+def _add(a: int, b: int) -> int:
+    return a + b
+
+
+def _fail() -> None:
+    raise Exception("Mock exception")
+
+
+def _exit() -> None:
+    os._exit(3)
+
+
+def _sleep() -> None:
+    time.sleep(60)
+
+
+def _allocate() -> None:
+    data = b"x" * 256 * 1024 * 1024
+    time.sleep(60)
+    del data
+
+
+def test_run_isolated_returns_result() -> None:
+    assert run_isolated(_add, 1, 2) == 3
+
+
+def test_run_isolated_raises_error() -> None:
+    with pytest.raises(IsolatedProcessError, match="Mock exception"):
+        run_isolated(_fail)
+
+
+def test_run_isolated_raises_error_if_process_dies() -> None:
+    with pytest.raises(IsolatedProcessError, match="exited with code 3"):
+        run_isolated(_exit, poll_interval=0.1)
+
+
+def test_run_isolated_kills_process_after_timeout() -> None:
+    start = time.monotonic()
+
+    with pytest.raises(ResourceLimitExceeded, match="Exceeded time limit of 1.0s"):
+        run_isolated(_sleep, timeout=1.0, poll_interval=0.1)
+
+    assert time.monotonic() - start < 10
+
+
+def test_run_isolated_kills_process_over_memory_limit() -> None:
+    start = time.monotonic()
+
+    with pytest.raises(
+        ResourceLimitExceeded, match="Exceeded memory limit of 134217728 bytes"
+    ):
+        run_isolated(_allocate, max_rss_bytes=128 * 1024 * 1024, poll_interval=0.1)
+
+    assert time.monotonic() - start < 30
+
+
+def test_get_tree_rss() -> None:
+    rss = get_tree_rss(os.getpid())
+
+    assert rss is not None and rss > 0
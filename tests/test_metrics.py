@@ -0,0 +1,91 @@
+import os
+import tempfile
+
+import pytest
+
+from oc4ids_datastore_pipeline.metrics import (
+    StageMeasurement,
+    format_prometheus_metrics,
+    get_measurements,
+    measure_stage,
+    reset_measurements,
+    write_prometheus_textfile,
+)
+
+
+@pytest.fixture(autouse=True)
+def before_and_after_each() -> None:
+    reset_measurements()
+
+
+def test_measure_stage() -> None:
+    with measure_stage("test_dataset", "download") as measurement:
+        measurement.bytes = 100
+
+    [measurement] = get_measurements()
+    assert measurement.dataset_id == "test_dataset"
+    assert measurement.stage == "download"
+    assert measurement.bytes == 100
+    assert measurement.seconds >= 0
+    assert measurement.succeeded
+
+
+def test_measure_stage_records_failure() -> None:
+    with pytest.raises(Exception, match="Mock exception"):
+        with measure_stage("test_dataset", "validate"):
+            raise Exception("Mock exception")
+
+    [measurement] = get_measurements()
+    assert measurement.stage == "validate"
+    assert not measurement.succeeded
+
+
+def test_format_prometheus_metrics() -> None:
+    measurements = [
+        StageMeasurement("test_dataset", "upload", 2.5, None, False),
+        StageMeasurement('dataset_"quoted"', "download", 1.5, 1024, True),
+    ]
+
+    content = format_prometheus_metrics(
+        measurements, run_seconds=10.0, run_errors=1, run_finished_at=1700000000.0
+    )
+
+    lines = content.splitlines()
+    assert (
+        'oc4ids_pipeline_stage_duration_seconds{dataset_id="dataset_\\"quoted\\"",'
+        'stage="download"} 1.5'
+    ) in lines
+    assert (
+        'oc4ids_pipeline_stage_duration_seconds{dataset_id="test_dataset",'
+        'stage="upload"} 2.5'
+    ) in lines
+    assert (
+        'oc4ids_pipeline_stage_bytes{dataset_id="dataset_\\"quoted\\"",'
+        'stage="download"} 1024'
+    ) in lines
+    assert not any(
+        line.startswith("oc4ids_pipeline_stage_bytes") and "upload" in line
+        for line in lines
+    )
+    assert (
+        'oc4ids_pipeline_stage_success{dataset_id="test_dataset",stage="upload"} 0'
+    ) in lines
+    assert "oc4ids_pipeline_run_duration_seconds 10.0" in lines
+    assert "oc4ids_pipeline_run_errors 1" in lines
+    assert content.endswith("\n")
+
+
+def test_write_prometheus_textfile() -> None:
+    with measure_stage("test_dataset", "write"):
+        pass
+
+    with tempfile.TemporaryDirectory() as dir:
+        path = os.path.join(dir, "metrics", "pipeline.prom")
+        write_prometheus_textfile(path, run_seconds=1.0, run_errors=0)
+
+        assert os.listdir(os.path.dirname(path)) == ["pipeline.prom"]
+        with open(path) as file:
+            content = file.read()
+
+    assert 'stage="write"' in content
+    assert "oc4ids_pipeline_run_errors 0" in content
@@ -1,24 +1,179 @@
+import datetime
+import hashlib
+import io
+import json
 import os
 import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from textwrap import dedent
+from typing import Any, Optional
+from unittest.mock import ANY, MagicMock
 
 import pytest
 from pytest_mock import MockerFixture
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
 
+from oc4ids_datastore_pipeline import pipeline
+from oc4ids_datastore_pipeline.database import (
+    Base,
+    Dataset,
+    PipelineRun,
+    PipelineRunDataset,
+    ValidationResult,
+)
+from oc4ids_datastore_pipeline.isolation import ResourceLimitExceeded
+from oc4ids_datastore_pipeline.metrics import (
+    get_measurements,
+    measure_stage,
+    reset_measurements,
+)
 from oc4ids_datastore_pipeline.pipeline import (
+    DownloadedJson,
     ProcessDatasetError,
+    build_costa_rica_url,
+    download_ecuador_packages,
     download_json,
     process_dataset,
     process_deleted_datasets,
     process_registry,
+    save_dataset_metadata,
     transform_to_csv_and_xlsx,
     validate_json,
     write_json_to_file,
 )
 
 
+def test_download_ecuador_packages_combines_yearly_archives(
+    mocker: MockerFixture,
+) -> None:
+    def zip_packages(packages: dict[str, Any]) -> bytes:
+        zip_data = io.BytesIO()
+        with zipfile.ZipFile(zip_data, "w") as archive:
+            for filename, package in packages.items():
+                archive.writestr(filename, json.dumps(package))
+        return zip_data.getvalue()
+
+    archives = {
+        "https://ecuador/2020.zip": zip_packages(
+            {
+                "a.json": {
+                    "version": "0.9",
+                    "publishedDate": "2020-12-31T00:00:00Z",
+                    "projects": [{"id": "1"}],
+                },
+                "b.json": {"version": "0.9", "projects": [{"id": "2"}]},
+            }
+        ),
+        "https://ecuador/2021.zip": zip_packages(
+            {
+                "c.json": {
+                    "uri": "https://ecuador/2021.json",
+                    "version": "0.9",
+                    "publishedDate": "2021-12-31T00:00:00Z",
+                    "projects": [{"id": "3"}],
+                }
+            }
+        ),
+    }
+
+    def get(url: str, **kwargs: Any) -> MagicMock:
+        response = MagicMock()
+        response.__enter__.return_value = response
+        response.status_code = 200 if url in archives else 404
+        response.iter_content.return_value = [archives.get(url, b"")]
+        return response
+
+    patch_get = mocker.patch("oc4ids_datastore_pipeline.pipeline.http_get")
+    patch_get.side_effect = get
+
+    result = download_ecuador_packages("https://ecuador/")
+
+    assert result.json_data["uri"] == "https://ecuador/2021.json"
+    assert result.json_data["version"] == "0.9"
+    assert result.json_data["publishedDate"] == "2021-12-31T00:00:00Z"
+    assert sorted(project["id"] for project in result.json_data["projects"]) == [
+        "1",
+        "2",
+        "3",
+    ]
+    assert result.content_hash is not None
+
+
+def test_download_ecuador_packages_raises_exception_when_no_packages(
+    mocker: MockerFixture,
+) -> None:
+    mock_response = MagicMock()
+    mock_response.__enter__.return_value = mock_response
+    mock_response.status_code = 404
+    patch_get = mocker.patch("oc4ids_datastore_pipeline.pipeline.http_get")
+    patch_get.return_value = mock_response
+
+    with pytest.raises(ProcessDatasetError) as exc_info:
+        download_ecuador_packages("https://ecuador/")
+
+    assert "No valid packages found at https://ecuador/" in str(exc_info.value)
+
+
+def test_build_costa_rica_url_only_probes_months_since_last_known_url(
+    mocker: MockerFixture,
+) -> None:
+    this_month = datetime.datetime.today()
+    latest_url = (
+        f"https://cr/{this_month.year}/{this_month.month:02d}/OC4IDSJSONCFIA.json"
+    )
+
+    def head(url: str, **kwargs: Any) -> MagicMock:
+        response = MagicMock()
+        response.status_code = 200
+        return response
+
+    patch_head = mocker.patch("oc4ids_datastore_pipeline.pipeline.http_head")
+    patch_head.side_effect = head
+
+    url = build_costa_rica_url("https://cr/", last_known_url=latest_url)
+
+    assert url == latest_url
+    patch_head.assert_called_once_with(latest_url, timeout=10.0)
+
+
+def test_build_costa_rica_url_scans_older_months_when_last_known_url_missing(
+    mocker: MockerFixture,
+) -> None:
+    this_month = datetime.datetime.today()
+    last_known_url = (
+        f"https://cr/{this_month.year}/{this_month.month:02d}/OC4IDSJSONCFIA.json"
+    )
+    earliest_url = "https://cr/2026/03/OC4IDSJSONCFIA.json"
+
+    def head(url: str, **kwargs: Any) -> MagicMock:
+        response = MagicMock()
+        response.status_code = 200 if url == earliest_url else 404
+        return response
+
+    patch_head = mocker.patch("oc4ids_datastore_pipeline.pipeline.http_head")
+    patch_head.side_effect = head
+
+    url = build_costa_rica_url("https://cr/", last_known_url=last_known_url)
+
+    assert url == earliest_url
+
+
+def test_build_costa_rica_url_raises_exception_when_not_found(
+    mocker: MockerFixture,
+) -> None:
+    patch_head = mocker.patch("oc4ids_datastore_pipeline.pipeline.http_head")
+    patch_head.side_effect = Exception("Mocked exception")
+
+    with pytest.raises(ProcessDatasetError) as exc_info:
+        build_costa_rica_url("https://cr/")
+
+    assert "Could not find a dataset URL" in str(exc_info.value)
+
+
 def test_download_json_raises_failure_exception(mocker: MockerFixture) -> None:
-    patch_get = mocker.patch("oc4ids_datastore_pipeline.pipeline.requests.get")
+    patch_get = mocker.patch("oc4ids_datastore_pipeline.pipeline.http_get")
     patch_get.side_effect = Exception("Mocked exception")
 
     with pytest.raises(ProcessDatasetError) as exc_info:
@@ -28,6 +183,126 @@ def test_download_json_raises_failure_exception(mocker: MockerFixture) -> None:
     assert "Mocked exception" in str(exc_info.value)
 
 
+def test_download_json_sends_conditional_headers(mocker: MockerFixture) -> None:
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    mock_response.headers = {
+        "ETag": '"new-etag"',
+        "Last-Modified": "Thu, 02 Jan 2025 00:00:00 GMT",
+    }
+    mock_response.__enter__.return_value = mock_response
+    mock_response.iter_content.return_value = [b'{"projects"', b": []}"]
+    patch_get = mocker.patch("oc4ids_datastore_pipeline.pipeline.http_get")
+    patch_get.return_value = mock_response
+
+    result = download_json(
+        dataset_id="test_dataset",
+        url="https://test_dataset.json",
+        etag='"old-etag"',
+        last_modified="Wed, 01 Jan 2025 00:00:00 GMT",
+    )
+
+    patch_get.assert_called_once_with(
+        "https://test_dataset.json",
+        headers={
+            "If-None-Match": '"old-etag"',
+            "If-Modified-Since": "Wed, 01 Jan 2025 00:00:00 GMT",
+        },
+        stream=True,
+    )
+    assert result is not None
+    assert result.json_data == {"projects": []}
+    assert result.etag == '"new-etag"'
+    assert result.last_modified == "Thu, 02 Jan 2025 00:00:00 GMT"
+    assert result.content_hash == hashlib.sha256(b'{"projects": []}').hexdigest()
+    assert result.size == 16
+    assert result.source_path is not None
+    with open(result.source_path, "rb") as file:
+        assert file.read() == b'{"projects": []}'
+    os.remove(result.source_path)
+
+
+def test_download_json_does_not_parse_unchanged_content(
+    mocker: MockerFixture,
+) -> None:
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    mock_response.headers = {"ETag": '"new-etag"'}
+    mock_response.__enter__.return_value = mock_response
+    mock_response.iter_content.return_value = [b'{"projects"', b": []}"]
+    mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.http_get", return_value=mock_response
+    )
+    patch_load = mocker.patch("oc4ids_datastore_pipeline.pipeline._load_json_file")
+    content_hash = hashlib.sha256(b'{"projects": []}').hexdigest()
+
+    result = download_json(
+        dataset_id="test_dataset",
+        url="https://test_dataset.json",
+        previous_content_hash=content_hash,
+    )
+
+    patch_load.assert_not_called()
+    assert result is not None
+    assert result.json_data is None
+    assert result.content_hash == content_hash
+    assert result.etag == '"new-etag"'
+    assert result.source_path is None
+
+
+def test_download_json_parses_large_files_incrementally(
+    mocker: MockerFixture, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("JSON_STREAM_PARSE_THRESHOLD", "10")
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    mock_response.__enter__.return_value = mock_response
+    mock_response.iter_content.return_value = [b'{"projects": [{"id": "1", "a": 1.5}]}']
+    patch_get = mocker.patch("oc4ids_datastore_pipeline.pipeline.http_get")
+    patch_get.return_value = mock_response
+    patch_json_load = mocker.patch("oc4ids_datastore_pipeline.pipeline.json.load")
+
+    result = download_json(dataset_id="test_dataset", url="https://test_dataset.json")
+
+    assert result is not None
+    assert result.json_data == {"projects": [{"id": "1", "a": 1.5}]}
+    patch_json_load.assert_not_called()
+    assert result.source_path is not None
+    os.remove(result.source_path)
+
+
+def test_download_json_raises_decode_failure_exception(mocker: MockerFixture) -> None:
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    mock_response.__enter__.return_value = mock_response
+    mock_response.iter_content.return_value = [b"<html>Not JSON</html>"]
+    patch_get = mocker.patch("oc4ids_datastore_pipeline.pipeline.http_get")
+    patch_get.return_value = mock_response
+    patch_remove = mocker.spy(os, "remove")
+
+    with pytest.raises(ProcessDatasetError) as exc_info:
+        download_json(dataset_id="test_dataset", url="https://test_dataset.json")
+
+    assert "JSON DECODE FAILED FOR: test_dataset" in str(exc_info.value)
+    assert "<html>Not JSON</html>" in str(exc_info.value)
+    patch_remove.assert_called_once()
+
+
+def test_download_json_returns_none_when_not_modified(mocker: MockerFixture) -> None:
+    mock_response = MagicMock()
+    mock_response.status_code = 304
+    mock_response.__enter__.return_value = mock_response
+    patch_get = mocker.patch("oc4ids_datastore_pipeline.pipeline.http_get")
+    patch_get.return_value = mock_response
+
+    result = download_json(
+        dataset_id="test_dataset", url="https://test_dataset.json", etag='"etag"'
+    )
+
+    assert result is None
+    mock_response.iter_content.assert_not_called()
+
+
 def test_validate_json_raises_failure_exception(mocker: MockerFixture) -> None:
     patch_oc4ids_json_output = mocker.patch(
         "oc4ids_datastore_pipeline.pipeline.oc4ids_json_output"
@@ -71,6 +346,156 @@ def test_validate_json_raises_validation_errors_exception(
     assert "Non-unique id values" in str(exc_info.value)
 
 
+def test_validate_json_uses_cached_validation_result(mocker: MockerFixture) -> None:
+    patch_get_validation_result = mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.get_validation_result"
+    )
+    patch_get_validation_result.return_value = ValidationResult(
+        content_hash="abc123",
+        validator_version="libcoveoc4ids==0.0.0",
+        errors_count=1,
+        errors=[['{"message": "Cached error"}', []]],
+        created_at=datetime.datetime.now(datetime.UTC),
+    )
+    patch_oc4ids_json_output = mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.oc4ids_json_output"
+    )
+
+    with pytest.raises(ProcessDatasetError) as exc_info:
+        validate_json(dataset_id="test_dataset", json_data={}, content_hash="abc123")
+
+    assert "Dataset has 1 validation errors" in str(exc_info.value)
+    assert "Cached error" in str(exc_info.value)
+    patch_oc4ids_json_output.assert_not_called()
+
+
+def test_validate_json_caches_trimmed_validation_result(
+    mocker: MockerFixture, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("VALIDATION_CACHE_MAX_ERRORS", "1")
+    patch_get_validation_result = mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.get_validation_result"
+    )
+    patch_get_validation_result.return_value = None
+    patch_save_validation_result = mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.save_validation_result"
+    )
+    patch_oc4ids_json_output = mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.oc4ids_json_output"
+    )
+    patch_oc4ids_json_output.return_value = {
+        "validation_errors_count": 3,
+        "validation_errors": [
+            [
+                '{"message": "Non-unique id values"}',
+                [
+                    {"path": "projects/22/parties", "value": "test_value"},
+                    {"path": "projects/30/parties", "value": "test_value"},
+                ],
+            ],
+            ['{"message": "Another error"}', [{"path": "projects/1"}]],
+        ],
+    }
+
+    with pytest.raises(ProcessDatasetError):
+        validate_json(dataset_id="test_dataset", json_data={}, content_hash="abc123")
+
+    cached_result = patch_save_validation_result.call_args[0][0]
+    assert cached_result.content_hash == "abc123"
+    assert cached_result.validator_version.startswith("libcoveoc4ids==")
+    assert cached_result.errors_count == 3
+    assert cached_result.errors == [
+        [
+            '{"message": "Non-unique id values"}',
+            [{"path": "projects/22/parties", "value": "test_value"}],
+        ]
+    ]
+
+
+def test_validate_json_validates_in_chunks(
+    mocker: MockerFixture, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("VALIDATION_CHUNK_SIZE", "2")
+    mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline._process_pool",
+        ThreadPoolExecutor(max_workers=2),
+    )
+
+    def oc4ids_json_output(json_data: dict[str, Any]) -> dict[str, Any]:
+        errors = [
+            [
+                '{"message": "Invalid project"}',
+                [{"path": f"projects/{i}/id", "value": project["id"]}],
+            ]
+            for i, project in enumerate(json_data["projects"])
+            if project["id"].startswith("invalid")
+        ]
+        return {"validation_errors_count": len(errors), "validation_errors": errors}
+
+    patch_oc4ids_json_output = mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.oc4ids_json_output"
+    )
+    patch_oc4ids_json_output.side_effect = oc4ids_json_output
+
+    with pytest.raises(ProcessDatasetError) as exc_info:
+        validate_json(
+            dataset_id="test_dataset",
+            json_data={
+                "version": "0.9",
+                "projects": [
+                    {"id": "valid_1"},
+                    {"id": "invalid_1"},
+                    {"id": "valid_2"},
+                    {"id": "invalid_2"},
+                    {"id": "valid_3"},
+                ],
+            },
+        )
+
+    assert patch_oc4ids_json_output.call_count == 3
+    for call in patch_oc4ids_json_output.call_args_list:
+        assert call.kwargs["json_data"]["version"] == "0.9"
+    assert "Dataset has 2 validation errors" in str(exc_info.value)
+    assert "projects/1/id" in str(exc_info.value)
+    assert "projects/3/id" in str(exc_info.value)
+
+
+def test_validate_json_caches_chunked_validation_separately(
+    mocker: MockerFixture, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("VALIDATION_CHUNK_SIZE", "2")
+    mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline._process_pool",
+        ThreadPoolExecutor(max_workers=2),
+    )
+    patch_get_validation_result = mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.get_validation_result", return_value=None
+    )
+    patch_save_validation_result = mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.save_validation_result"
+    )
+    mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.oc4ids_json_output",
+        return_value={"validation_errors_count": 0, "validation_errors": []},
+    )
+    json_data = {"projects": [{"id": "1"}, {"id": "2"}, {"id": "3"}]}
+
+    validate_json("test_dataset", json_data, content_hash="abc123")
+    monkeypatch.setenv("VALIDATION_CHUNK_SIZE", "0")
+    validate_json("test_dataset", json_data, content_hash="abc123")
+
+    chunked_version, whole_version = [
+        call.args[1] for call in patch_get_validation_result.call_args_list
+    ]
+    assert chunked_version.endswith(";chunk_size=2")
+    assert whole_version.startswith("libcoveoc4ids==")
+    assert ";" not in whole_version
+    assert [
+        call.args[0].validator_version
+        for call in patch_save_validation_result.call_args_list
+    ] == [chunked_version, whole_version]
+
+
 def test_write_json_to_file_writes_in_correct_format() -> None:
     with tempfile.TemporaryDirectory() as dir:
         file_name = os.path.join(dir, "test_dataset.json")
@@ -86,6 +511,57 @@ def test_write_json_to_file_writes_in_correct_format() -> None:
             assert file.read() == expected
 
 
+def test_write_json_to_file_writes_compact_format(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("JSON_OUTPUT_FORMAT", "compact")
+    with tempfile.TemporaryDirectory() as dir:
+        file_name = os.path.join(dir, "test_dataset.json")
+        write_json_to_file(file_name=file_name, json_data={"key": [1, 2]})
+
+        with open(file_name) as file:
+            assert file.read() == '{"key":[1,2]}'
+
+
+def test_write_json_to_file_copies_source_bytes(
+    mocker: MockerFixture, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("JSON_OUTPUT_FORMAT", "source")
+    patch_json_dump = mocker.patch("oc4ids_datastore_pipeline.pipeline.json.dump")
+    with tempfile.TemporaryDirectory() as dir:
+        source_path = os.path.join(dir, "download.json")
+        with open(source_path, "wb") as file:
+            file.write(b'{ "key" : "value" }')
+        file_name = os.path.join(dir, "test_dataset", "test_dataset.json")
+        write_json_to_file(
+            file_name=file_name, json_data={"key": "value"}, source_path=source_path
+        )
+
+        with open(file_name, "rb") as file:
+            assert file.read() == b'{ "key" : "value" }'
+        assert os.listdir(os.path.dirname(file_name)) == ["test_dataset.json"]
+    patch_json_dump.assert_not_called()
+
+
+def test_write_json_to_file_keeps_existing_file_on_failure(
+    mocker: MockerFixture,
+) -> None:
+    patch_json_dump = mocker.patch("oc4ids_datastore_pipeline.pipeline.json.dump")
+    patch_json_dump.side_effect = Exception("Mocked exception")
+
+    with tempfile.TemporaryDirectory() as dir:
+        file_name = os.path.join(dir, "test_dataset.json")
+        with open(file_name, "w") as file:
+            file.write("previous")
+
+        with pytest.raises(ProcessDatasetError):
+            write_json_to_file(file_name=file_name, json_data={"key": "value"})
+
+        with open(file_name) as file:
+            assert file.read() == "previous"
+        assert os.listdir(dir) == ["test_dataset.json"]
+
+
 def test_write_json_to_file_raises_failure_exception(mocker: MockerFixture) -> None:
     patch_json_dump = mocker.patch("oc4ids_datastore_pipeline.pipeline.json.dump")
     patch_json_dump.side_effect = Exception("Mocked exception")
@@ -109,6 +585,49 @@ def test_transform_to_csv_and_xlsx_returns_correct_paths(mocker: MockerFixture)
     assert xlsx_path == "dir/dataset/dataset.xlsx"
 
 
+def test_transform_to_csv_and_xlsx_transforms_large_files_in_batches(
+    mocker: MockerFixture, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("TRANSFORM_MAX_FILE_SIZE", "10")
+    monkeypatch.setenv("TRANSFORM_BATCH_SIZE", "100")
+    mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline._process_pool",
+        ThreadPoolExecutor(max_workers=2),
+    )
+    patch_flatten = mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.flattentool.flatten"
+    )
+    patch_flatten_in_batches = mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.flatten_in_batches"
+    )
+    mocker.patch("os.path.getsize", return_value=100)
+
+    csv_path, xlsx_path = transform_to_csv_and_xlsx("dir/dataset/dataset.json")
+
+    assert csv_path == "dir/dataset/dataset"
+    assert xlsx_path == "dir/dataset/dataset.xlsx"
+    patch_flatten.assert_not_called()
+    patch_flatten_in_batches.assert_called_once()
+    assert patch_flatten_in_batches.call_args.kwargs["batch_size"] == 100
+
+
+def test_transform_to_csv_and_xlsx_skips_large_files_when_batching_disabled(
+    mocker: MockerFixture, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("TRANSFORM_MAX_FILE_SIZE", "10")
+    monkeypatch.setenv("TRANSFORM_BATCH_SIZE", "0")
+    patch_flatten_in_batches = mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.flatten_in_batches"
+    )
+    mocker.patch("os.path.getsize", return_value=100)
+
+    csv_path, xlsx_path = transform_to_csv_and_xlsx("dir/dataset/dataset.json")
+
+    assert csv_path is None
+    assert xlsx_path is None
+    patch_flatten_in_batches.assert_not_called()
+
+
 def test_transform_to_csv_and_xlsx_catches_exception(mocker: MockerFixture) -> None:
     patch_flatten = mocker.patch(
         "oc4ids_datastore_pipeline.pipeline.flattentool.flatten"
@@ -126,12 +645,12 @@ def test_process_deleted_datasets(mocker: MockerFixture) -> None:
     patch_get_dataset_ids = mocker.patch(
         "oc4ids_datastore_pipeline.pipeline.get_dataset_ids"
     )
-    patch_get_dataset_ids.return_value = ["old_dataset", "test_dataset"]
-    patch_delete_dataset = mocker.patch(
-        "oc4ids_datastore_pipeline.pipeline.delete_dataset"
+    patch_get_dataset_ids.return_value = ["old_dataset", "test_dataset", "other"]
+    patch_delete_datasets = mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.delete_datasets"
     )
-    patch_delete_files_for_dataset = mocker.patch(
-        "oc4ids_datastore_pipeline.pipeline.delete_files_for_dataset"
+    patch_delete_files_for_datasets = mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.delete_files_for_datasets"
     )
 
     registered_datasets = {
@@ -139,11 +658,33 @@ def test_process_deleted_datasets(mocker: MockerFixture) -> None:
     }
     process_deleted_datasets(registered_datasets)
 
-    patch_delete_dataset.assert_called_once_with("old_dataset")
-    patch_delete_files_for_dataset.assert_called_once_with("old_dataset")
+    patch_delete_datasets.assert_called_once_with(["old_dataset", "other"])
+    patch_delete_files_for_datasets.assert_called_once_with(["old_dataset", "other"])
+
+
+def test_process_deleted_datasets_nothing_to_delete(mocker: MockerFixture) -> None:
+    patch_get_dataset_ids = mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.get_dataset_ids"
+    )
+    patch_get_dataset_ids.return_value = ["test_dataset"]
+    patch_delete_datasets = mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.delete_datasets"
+    )
+    patch_delete_files_for_datasets = mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.delete_files_for_datasets"
+    )
+
+    process_deleted_datasets(
+        {"test_dataset": {"source_url": "https://test_dataset.json", "country": "ab"}}
+    )
+
+    patch_delete_datasets.assert_not_called()
+    patch_delete_files_for_datasets.assert_not_called()
 
 
 def test_process_dataset_raises_failure_exception(mocker: MockerFixture) -> None:
+    patch_get_dataset = mocker.patch("oc4ids_datastore_pipeline.pipeline.get_dataset")
+    patch_get_dataset.return_value = None
     patch_download_json = mocker.patch(
         "oc4ids_datastore_pipeline.pipeline.download_json"
     )
@@ -157,6 +698,251 @@ def test_process_dataset_raises_failure_exception(mocker: MockerFixture) -> None
     assert "Download failed: Exception" in str(exc_info.value)
 
 
+def test_process_dataset_measures_stages(mocker: MockerFixture) -> None:
+    reset_measurements()
+    mocker.patch("oc4ids_datastore_pipeline.pipeline.get_dataset", return_value=None)
+    patch_download_json = mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.download_json"
+    )
+    patch_download_json.return_value = DownloadedJson(
+        json_data={"projects": []}, etag=None, last_modified=None, size=16
+    )
+    mocker.patch("oc4ids_datastore_pipeline.pipeline.validate_json")
+    mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.write_json_to_file",
+        return_value="data/test_dataset/test_dataset.json",
+    )
+    patch_transform = mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.transform_to_csv_and_xlsx"
+    )
+    patch_transform.side_effect = Exception("Mock exception")
+
+    with pytest.raises(Exception, match="Mock exception"):
+        process_dataset(
+            "test_dataset",
+            {
+                "source_url": "https://test_dataset.json",
+                "country": "ab",
+                "portal_title": "Portal",
+                "portal_url": "https://portal.example",
+            },
+        )
+
+    measurements = {m.stage: m for m in get_measurements()}
+    assert list(measurements) == ["download", "validate", "write", "transform"]
+    assert measurements["download"].bytes == 16
+    assert measurements["write"].succeeded
+    assert not measurements["transform"].succeeded
+
+
+@pytest.mark.parametrize(
+    "transformed,uploaded_urls,files_published",
+    [
+        (True, ("json_url", "csv_url", "xlsx_url"), True),
+        (True, ("json_url", None, "xlsx_url"), False),
+        (True, ("json_url", "csv_url", None), False),
+        (False, ("json_url", None, None), False),
+    ],
+)
+def test_process_dataset_keeps_validators_and_hash_only_when_files_published(
+    mocker: MockerFixture,
+    tmp_path: Any,
+    transformed: bool,
+    uploaded_urls: tuple[Optional[str], ...],
+    files_published: bool,
+) -> None:
+    json_path = tmp_path / "test_dataset.json"
+    json_path.write_text('{"projects": []}')
+    mocker.patch("oc4ids_datastore_pipeline.pipeline.get_dataset", return_value=None)
+    mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.download_json",
+        return_value=DownloadedJson(
+            json_data={"projects": []},
+            etag='"etag"',
+            last_modified="Thu, 01 Jan 2026 00:00:00 GMT",
+            content_hash="abc123",
+        ),
+    )
+    mocker.patch("oc4ids_datastore_pipeline.pipeline.validate_json")
+    mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.write_json_to_file",
+        return_value=str(json_path),
+    )
+    mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.transform_to_csv_and_xlsx",
+        return_value=(("csv_path", "xlsx_path") if transformed else (None, None)),
+    )
+    mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.upload_files", return_value=uploaded_urls
+    )
+    patch_save = mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.save_dataset_metadata"
+    )
+
+    process_dataset(
+        "test_dataset",
+        {
+            "source_url": "https://test_dataset.json",
+            "country": "ab",
+            "portal_title": "Portal",
+            "portal_url": "https://portal.example",
+        },
+    )
+
+    kwargs = patch_save.call_args.kwargs
+    assert kwargs["http_etag"] == ('"etag"' if files_published else None)
+    assert kwargs["http_last_modified"] == (
+        "Thu, 01 Jan 2026 00:00:00 GMT" if files_published else None
+    )
+    assert kwargs["content_hash"] == ("abc123" if files_published else None)
+
+
+def test_process_dataset_does_not_keep_validators_when_upload_disabled(
+    mocker: MockerFixture, monkeypatch: pytest.MonkeyPatch, tmp_path: Any
+) -> None:
+    monkeypatch.setenv("ENABLE_UPLOAD", "0")
+    json_path = tmp_path / "test_dataset.json"
+    json_path.write_text('{"projects": []}')
+    mocker.patch("oc4ids_datastore_pipeline.pipeline.get_dataset", return_value=None)
+    mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.download_json",
+        return_value=DownloadedJson(
+            json_data={"projects": []}, etag='"etag"', content_hash="abc123"
+        ),
+    )
+    mocker.patch("oc4ids_datastore_pipeline.pipeline.validate_json")
+    mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.write_json_to_file",
+        return_value=str(json_path),
+    )
+    mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.transform_to_csv_and_xlsx",
+        return_value=("csv_path", "xlsx_path"),
+    )
+    patch_save = mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.save_dataset_metadata"
+    )
+
+    process_dataset(
+        "test_dataset",
+        {
+            "source_url": "https://test_dataset.json",
+            "country": "ab",
+            "portal_title": "Portal",
+            "portal_url": "https://portal.example",
+        },
+    )
+
+    kwargs = patch_save.call_args.kwargs
+    assert kwargs["http_etag"] is None
+    assert kwargs["content_hash"] is None
+
+
+def test_process_registry_writes_metrics(
+    mocker: MockerFixture, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.fetch_registered_datasets",
+        return_value={},
+    )
+    mocker.patch("oc4ids_datastore_pipeline.pipeline.process_deleted_datasets")
+    with tempfile.TemporaryDirectory() as dir:
+        metrics_path = os.path.join(dir, "pipeline.prom")
+        monkeypatch.setenv("METRICS_TEXTFILE_PATH", metrics_path)
+
+        process_registry()
+
+        with open(metrics_path) as file:
+            assert "oc4ids_pipeline_run_errors 0" in file.read().splitlines()
+
+
+def test_process_dataset_skips_unchanged_dataset(mocker: MockerFixture) -> None:
+    previous_dataset = Dataset(
+        dataset_id="test_dataset",
+        source_url="https://test_dataset.json",
+        publisher_name="test_publisher",
+        publisher_country="ab",
+        http_etag='"etag"',
+        http_last_modified="Wed, 01 Jan 2025 00:00:00 GMT",
+        updated_at=datetime.datetime.now(datetime.UTC),
+    )
+    patch_get_dataset = mocker.patch("oc4ids_datastore_pipeline.pipeline.get_dataset")
+    patch_get_dataset.return_value = previous_dataset
+    patch_download_json = mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.download_json"
+    )
+    patch_download_json.return_value = None
+    patch_validate_json = mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.validate_json"
+    )
+    patch_save_dataset = mocker.patch("oc4ids_datastore_pipeline.pipeline.save_dataset")
+
+    process_dataset(
+        "test_dataset",
+        {
+            "source_url": "https://test_dataset.json",
+            "country": "cd",
+            "portal_title": "Our Portal",
+            "portal_url": "https://our.portal",
+        },
+    )
+
+    patch_download_json.assert_called_once_with(
+        "test_dataset",
+        "https://test_dataset.json",
+        etag='"etag"',
+        last_modified="Wed, 01 Jan 2025 00:00:00 GMT",
+        previous_download_url=None,
+        previous_content_hash=None,
+    )
+    patch_validate_json.assert_not_called()
+    patch_save_dataset.assert_called_once_with(previous_dataset)
+    assert previous_dataset.publisher_country == "cd"
+    assert previous_dataset.portal_title == "Our Portal"
+    assert previous_dataset.last_checked_at is not None
+
+
+def test_process_dataset_skips_dataset_with_unchanged_content_hash(
+    mocker: MockerFixture,
+) -> None:
+    previous_dataset = Dataset(
+        dataset_id="test_dataset",
+        source_url="https://test_dataset.json",
+        publisher_name="test_publisher",
+        content_hash="abc123",
+        updated_at=datetime.datetime.now(datetime.UTC),
+    )
+    patch_get_dataset = mocker.patch("oc4ids_datastore_pipeline.pipeline.get_dataset")
+    patch_get_dataset.return_value = previous_dataset
+    patch_download_json = mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.download_json"
+    )
+    patch_download_json.return_value = DownloadedJson(
+        json_data={"projects": []}, etag='"new-etag"', content_hash="abc123"
+    )
+    patch_validate_json = mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.validate_json"
+    )
+    patch_upload_files = mocker.patch("oc4ids_datastore_pipeline.pipeline.upload_files")
+    patch_save_dataset = mocker.patch("oc4ids_datastore_pipeline.pipeline.save_dataset")
+
+    process_dataset(
+        "test_dataset",
+        {
+            "source_url": "https://test_dataset.json",
+            "country": "ab",
+            "portal_title": "Our Portal",
+            "portal_url": "https://our.portal",
+        },
+    )
+
+    patch_validate_json.assert_not_called()
+    patch_upload_files.assert_not_called()
+    patch_save_dataset.assert_called_once_with(previous_dataset)
+    assert previous_dataset.http_etag == '"new-etag"'
+    assert previous_dataset.last_checked_at is not None
+
+
 def test_process_registry_catches_exception(mocker: MockerFixture) -> None:
     patch_fetch_registered_datasets = mocker.patch(
         "oc4ids_datastore_pipeline.pipeline.fetch_registered_datasets"
@@ -172,3 +958,326 @@ def test_process_registry_catches_exception(mocker: MockerFixture) -> None:
     mocker.patch("oc4ids_datastore_pipeline.pipeline.send_notification")
 
     process_registry()
+
+
+def test_process_registry_saves_metadata_in_batches(
+    mocker: MockerFixture, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("DATASET_WRITE_BATCH_SIZE", "10")
+    patch_fetch_registered_datasets = mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.fetch_registered_datasets"
+    )
+    patch_fetch_registered_datasets.return_value = {
+        dataset_id: {
+            "source_url": f"https://{dataset_id}.json",
+            "country": "ab",
+            "portal_title": "Portal",
+            "portal_url": "https://portal.example",
+        }
+        for dataset_id in ["dataset_a", "dataset_b"]
+    }
+    mocker.patch("oc4ids_datastore_pipeline.pipeline.process_deleted_datasets")
+    patch_save_dataset = mocker.patch("oc4ids_datastore_pipeline.pipeline.save_dataset")
+    patch_upsert_datasets = mocker.patch(
+        "oc4ids_datastore_pipeline.database.upsert_datasets"
+    )
+    patch_upsert_datasets.side_effect = Exception("Mock exception")
+    patch_database_save_dataset = mocker.patch(
+        "oc4ids_datastore_pipeline.database.save_dataset"
+    )
+    patch_database_save_dataset.side_effect = [None, Exception("Mock exception")]
+
+    def process_dataset(
+        dataset_id: str, registry_metadata: dict[str, str], **kwargs: Any
+    ) -> None:
+        save_dataset_metadata(
+            dataset_id=dataset_id,
+            source_url=registry_metadata["source_url"],
+            publisher_country=registry_metadata["country"],
+            json_data={},
+            json_url=None,
+            csv_url=None,
+            xlsx_url=None,
+            portal_title=registry_metadata["portal_title"],
+            portal_url=registry_metadata["portal_url"],
+        )
+
+    mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.process_dataset",
+        side_effect=process_dataset,
+    )
+    patch_send_notification = mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.send_notification"
+    )
+
+    process_registry()
+
+    patch_save_dataset.assert_not_called()
+    patch_upsert_datasets.assert_called_once()
+    assert [
+        dataset.dataset_id for dataset in patch_upsert_datasets.call_args.args[0]
+    ] == ["dataset_a", "dataset_b"]
+    patch_send_notification.assert_called_once_with(
+        [
+            {
+                "dataset_id": "dataset_b",
+                "source_url": "https://dataset_b.json",
+                "message": "Failed to update metadata for dataset: Mock exception",
+            }
+        ]
+    )
+
+
+def test_process_registry_concurrently_collects_errors(
+    mocker: MockerFixture, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("PIPELINE_WORKERS", "2")
+    patch_fetch_registered_datasets = mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.fetch_registered_datasets"
+    )
+    patch_fetch_registered_datasets.return_value = {
+        "test_dataset": {"source_url": "https://test_dataset.json", "country": "ab"},
+        "failing_dataset": {
+            "source_url": "https://failing_dataset.json",
+            "country": "ab",
+        },
+    }
+    mocker.patch("oc4ids_datastore_pipeline.pipeline.process_deleted_datasets")
+
+    def process_dataset(
+        dataset_id: str, registry_metadata: dict[str, str], **kwargs: Any
+    ) -> None:
+        if dataset_id == "failing_dataset":
+            raise Exception("Mocked exception")
+
+    patch_process_dataset = mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.process_dataset"
+    )
+    patch_process_dataset.side_effect = process_dataset
+    patch_send_notification = mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.send_notification"
+    )
+
+    process_registry()
+
+    assert patch_process_dataset.call_count == 2
+    patch_send_notification.assert_called_once_with(
+        [
+            {
+                "dataset_id": "failing_dataset",
+                "source_url": "https://failing_dataset.json",
+                "message": "Mocked exception",
+            }
+        ]
+    )
+
+
+def test_process_registry_records_run_history(mocker: MockerFixture) -> None:
+    engine = create_engine("sqlite:///:memory:")
+    mocker.patch("oc4ids_datastore_pipeline.database.get_engine", return_value=engine)
+    Base.metadata.create_all(engine)
+    mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.fetch_registered_datasets",
+        return_value={
+            "test_dataset": {"source_url": "https://test_dataset.json"},
+            "failing_dataset": {"source_url": "https://failing_dataset.json"},
+        },
+    )
+    mocker.patch("oc4ids_datastore_pipeline.pipeline.process_deleted_datasets")
+    mocker.patch("oc4ids_datastore_pipeline.pipeline.send_notification")
+
+    def process_dataset(
+        dataset_id: str,
+        registry_metadata: dict[str, str],
+        run_dataset: PipelineRunDataset,
+    ) -> None:
+        with measure_stage(dataset_id, "download"):
+            run_dataset.downloaded_bytes = 1024
+        if dataset_id == "failing_dataset":
+            raise Exception("Mocked exception")
+        run_dataset.project_count = 3
+        run_dataset.outcome = "processed"
+
+    mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.process_dataset",
+        side_effect=process_dataset,
+    )
+
+    process_registry()
+
+    with Session(engine) as session:
+        [pipeline_run] = session.scalars(select(PipelineRun)).all()
+        assert pipeline_run.finished_at is not None
+        assert pipeline_run.dataset_count == 2
+        assert pipeline_run.error_count == 1
+        run_datasets = {
+            run_dataset.dataset_id: run_dataset
+            for run_dataset in session.scalars(select(PipelineRunDataset))
+        }
+    assert run_datasets["test_dataset"].outcome == "processed"
+    assert run_datasets["test_dataset"].project_count == 3
+    assert run_datasets["test_dataset"].download_seconds is not None
+    assert run_datasets["test_dataset"].transform_seconds is None
+    assert run_datasets["failing_dataset"].outcome == "failed"
+    assert run_datasets["failing_dataset"].error_message == "Mocked exception"
+    assert run_datasets["failing_dataset"].downloaded_bytes == 1024
+
+
+def test_process_registry_isolates_datasets(
+    mocker: MockerFixture, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("DATASET_ISOLATION", "1")
+    monkeypatch.setenv("DATASET_MAX_RSS_BYTES", "1000000")
+    monkeypatch.setenv("DATASET_TIMEOUT_SECONDS", "60")
+    engine = create_engine("sqlite:///:memory:")
+    mocker.patch("oc4ids_datastore_pipeline.database.get_engine", return_value=engine)
+    Base.metadata.create_all(engine)
+    mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.fetch_registered_datasets",
+        return_value={
+            "test_dataset": {"source_url": "https://test_dataset.json"},
+            "huge_dataset": {"source_url": "https://huge_dataset.json"},
+        },
+    )
+    mocker.patch("oc4ids_datastore_pipeline.pipeline.process_deleted_datasets")
+    patch_send_notification = mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.send_notification"
+    )
+
+    def process_dataset(
+        dataset_id: str,
+        registry_metadata: dict[str, str],
+        run_dataset: PipelineRunDataset,
+    ) -> None:
+        with measure_stage(dataset_id, "download"):
+            run_dataset.downloaded_bytes = 1024
+        run_dataset.outcome = "processed"
+
+    mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.process_dataset",
+        side_effect=process_dataset,
+    )
+
+    def run_isolated(func: Any, dataset_id: str, *args: Any, **kwargs: Any) -> Any:
+        assert kwargs == {"max_rss_bytes": 1000000, "timeout": 60.0}
+        if dataset_id == "huge_dataset":
+            raise ResourceLimitExceeded("Exceeded memory limit of 1000000 bytes")
+        result = func(dataset_id, *args)
+        # Measurements taken in the child are not seen by the parent
+        reset_measurements()
+        return result
+
+    mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.run_isolated", side_effect=run_isolated
+    )
+
+    process_registry()
+
+    patch_send_notification.assert_called_once_with(
+        [
+            {
+                "dataset_id": "huge_dataset",
+                "source_url": "https://huge_dataset.json",
+                "message": "Exceeded memory limit of 1000000 bytes",
+            }
+        ]
+    )
+    with Session(engine) as session:
+        run_datasets = {
+            run_dataset.dataset_id: run_dataset
+            for run_dataset in session.scalars(select(PipelineRunDataset))
+        }
+    assert run_datasets["test_dataset"].outcome == "processed"
+    assert run_datasets["test_dataset"].downloaded_bytes == 1024
+    assert run_datasets["test_dataset"].download_seconds is not None
+    assert run_datasets["huge_dataset"].outcome == "failed"
+    assert run_datasets["huge_dataset"].error_message == (
+        "Exceeded memory limit of 1000000 bytes"
+    )
+
+
+def test_process_registry_does_not_start_run_when_registry_fetch_fails(
+    mocker: MockerFixture,
+) -> None:
+    mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.fetch_registered_datasets",
+        side_effect=Exception("Mocked exception"),
+    )
+    patch_start = mocker.patch("oc4ids_datastore_pipeline.pipeline.start_pipeline_run")
+
+    with pytest.raises(Exception, match="Mocked exception"):
+        process_registry()
+
+    patch_start.assert_not_called()
+
+
+def test_process_registry_finishes_run_when_processing_fails(
+    mocker: MockerFixture,
+) -> None:
+    mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.fetch_registered_datasets",
+        return_value={"test_dataset": {"source_url": "https://test_dataset.json"}},
+    )
+    mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.start_pipeline_run", return_value=1
+    )
+    patch_finish = mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.finish_pipeline_run"
+    )
+    mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.process_deleted_datasets",
+        side_effect=Exception("Mocked exception"),
+    )
+
+    with pytest.raises(Exception, match="Mocked exception"):
+        process_registry()
+
+    patch_finish.assert_called_once_with(1, ANY, 0, [])
+    assert pipeline._run_id is None
+
+
+def test_process_dataset_runs_cpu_bound_stages_inline_when_profiling(
+    mocker: MockerFixture, monkeypatch: pytest.MonkeyPatch, tmp_path: Any
+) -> None:
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("PROFILE_DATASETS", "test_dataset")
+    process_pool = MagicMock()
+    mocker.patch("oc4ids_datastore_pipeline.pipeline._process_pool", process_pool)
+    mocker.patch("oc4ids_datastore_pipeline.pipeline.get_dataset", return_value=None)
+    mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.download_json",
+        return_value=DownloadedJson(json_data={"projects": []}),
+    )
+    mocker.patch("oc4ids_datastore_pipeline.pipeline.validate_json")
+    mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.write_json_to_file",
+        return_value=str(tmp_path / "test_dataset.json"),
+    )
+    (tmp_path / "test_dataset.json").write_text('{"projects": []}')
+    patch_flatten = mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.flattentool.flatten"
+    )
+    mocker.patch(
+        "oc4ids_datastore_pipeline.pipeline.upload_files",
+        return_value=(None, None, None),
+    )
+    mocker.patch("oc4ids_datastore_pipeline.pipeline.save_dataset_metadata")
+
+    process_dataset(
+        "test_dataset",
+        {
+            "source_url": "https://test_dataset.json",
+            "country": "ab",
+            "portal_title": "Portal",
+            "portal_url": "https://portal.example",
+        },
+    )
+
+    patch_flatten.assert_called_once()
+    process_pool.submit.assert_not_called()
+    assert sorted(os.listdir(tmp_path / "data" / "test_dataset" / "profile")) == [
+        f"{stage}.{extension}"
+        for stage in ["download", "save_metadata", "transform", "upload", "validate"]
+        + ["write"]
+        for extension in ["prof", "txt"]
+    ]
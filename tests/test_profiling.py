@@ -0,0 +1,123 @@
+import os
+import threading
+import tracemalloc
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+
+from oc4ids_datastore_pipeline.profiling import (
+    InlineExecutor,
+    is_profiled,
+    is_profiling,
+    profile_stage,
+)
+
+
+def test_is_profiled(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.delenv("PROFILE_DATASETS", raising=False)
+    assert not is_profiled("test_dataset")
+
+    monkeypatch.setenv("PROFILE_DATASETS", "other_dataset, test_dataset")
+    assert is_profiled("test_dataset")
+    assert not is_profiled("third_dataset")
+
+    monkeypatch.setenv("PROFILE_DATASETS", "*")
+    assert is_profiled("third_dataset")
+
+
+def test_profile_stage_writes_profile(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("PROFILE_DATASETS", "test_dataset")
+    monkeypatch.setenv("PROFILE_TOP_N", "5")
+
+    with profile_stage("test_dataset", "validate"):
+        assert is_profiling()
+        data = [str(i) for i in range(10000)]
+    assert not is_profiling()
+
+    profile_dir = tmp_path / "data" / "test_dataset" / "profile"
+    assert sorted(os.listdir(profile_dir)) == ["validate.prof", "validate.txt"]
+    summary = (profile_dir / "validate.txt").read_text()
+    assert "# CPU: top 5 functions by cumulative time" in summary
+    assert "# Memory: top 5 lines by size allocated and not freed" in summary
+    assert "test_profiling.py" in summary
+    assert len(data) == 10000
+
+
+def test_profile_stage_writes_profile_when_stage_fails(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("PROFILE_DATASETS", "*")
+
+    with pytest.raises(Exception, match="Mock exception"):
+        with profile_stage("test_dataset", "transform"):
+            raise Exception("Mock exception")
+
+    assert (tmp_path / "data" / "test_dataset" / "profile" / "transform.prof").exists()
+
+
+def test_profile_stage_in_concurrent_threads(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("PROFILE_DATASETS", "*")
+    barrier = threading.Barrier(2, timeout=10)
+    errors: list[BaseException] = []
+
+    def run(dataset_id: str) -> None:
+        try:
+            with profile_stage(dataset_id, "validate"):
+                barrier.wait()
+                barrier.wait()
+        except BaseException as e:
+            errors.append(e)
+
+    threads = [
+        threading.Thread(target=run, args=(dataset_id,), daemon=True)
+        for dataset_id in ("dataset_a", "dataset_b")
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+
+    assert errors == []
+    assert not tracemalloc.is_tracing()
+    profiles = [
+        sorted(os.listdir(tmp_path / "data" / dataset_id / "profile"))
+        for dataset_id in ("dataset_a", "dataset_b")
+    ]
+    assert sorted(profiles) == [["validate.prof", "validate.txt"], ["validate.txt"]]
+
+    with profile_stage("dataset_a", "transform"):
+        pass
+
+    assert (tmp_path / "data" / "dataset_a" / "profile" / "transform.prof").exists()
+
+
+def test_profile_stage_does_nothing_when_disabled(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("PROFILE_DATASETS", "other_dataset")
+
+    with profile_stage("test_dataset", "validate"):
+        assert not is_profiling()
+
+    assert not (tmp_path / "data").exists()
+
+
+def test_inline_executor() -> None:
+    thread_ids = []
+    fail = MagicMock(side_effect=Exception("Mock exception"))
+
+    future = InlineExecutor().submit(lambda: thread_ids.append(threading.get_ident()))
+    failed_future = InlineExecutor().submit(fail)
+
+    assert future.done()
+    assert thread_ids == [threading.get_ident()]
+    assert str(failed_future.exception()) == "Mock exception"
@@ -1,9 +1,15 @@
+import hashlib
+import json
+from typing import Any, Generator, Optional
 from unittest.mock import MagicMock
 
 import pytest
 from pytest_mock import MockerFixture
+from sqlalchemy import Engine, create_engine
 
+from oc4ids_datastore_pipeline.database import Base, get_registry_responses
 from oc4ids_datastore_pipeline.registry import (
+    DATASETS_LIST_URL,
     fetch_license_mappings,
     fetch_registered_datasets,
     get_license_title_from_url,
@@ -33,7 +39,7 @@ def test_fetch_registered_datasets(mocker: MockerFixture) -> None:
             }
         },
     ]
-    patch_get = mocker.patch("oc4ids_datastore_pipeline.pipeline.requests.get")
+    patch_get = mocker.patch("oc4ids_datastore_pipeline.registry.http_get")
     patch_get.return_value = mock_response
 
     result = fetch_registered_datasets()
@@ -48,10 +54,203 @@ def test_fetch_registered_datasets(mocker: MockerFixture) -> None:
     }
 
 
+def test_fetch_registered_datasets_fetches_each_record(
+    mocker: MockerFixture,
+) -> None:
+    def get(url: str, **kwargs: Any) -> MagicMock:
+        response = MagicMock()
+        if url.endswith("records_api.json"):
+            response.json.return_value = {
+                "records": {
+                    dataset_id: {"api_url": f"https://{dataset_id}.example.com"}
+                    for dataset_id in ["dataset_1", "dataset_2", "dataset_3"]
+                }
+            }
+        else:
+            dataset_id = url.removeprefix("https://").split(".")[0]
+            response.json.return_value = {
+                "fields": {
+                    "url": {"value": f"https://{dataset_id}.json"},
+                    "country": {"value": "ab"},
+                    "portal_title": {"value": None},
+                    "portal_url": {"value": None},
+                }
+            }
+        return response
+
+    patch_get = mocker.patch("oc4ids_datastore_pipeline.registry.http_get")
+    patch_get.side_effect = get
+
+    result = fetch_registered_datasets()
+
+    assert patch_get.call_count == 4
+    assert {
+        dataset_id: metadata["source_url"] for dataset_id, metadata in result.items()
+    } == {
+        "dataset_1": "https://dataset_1.json",
+        "dataset_2": "https://dataset_2.json",
+        "dataset_3": "https://dataset_3.json",
+    }
+
+
+@pytest.fixture
+def snapshot_engine(
+    mocker: MockerFixture, monkeypatch: pytest.MonkeyPatch
+) -> Generator[Engine, Any, Any]:
+    monkeypatch.setenv("REGISTRY_SNAPSHOT_ENABLED", "1")
+    engine = create_engine("sqlite:///:memory:")
+    patch_get_engine = mocker.patch("oc4ids_datastore_pipeline.database.get_engine")
+    patch_get_engine.return_value = engine
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+def _mock_registry_get(
+    documents: dict[str, dict[str, Any]], list_status_code: int = 200
+) -> MagicMock:
+    """
+    Mocks the registry, serving a record with the given fields for each dataset,
+    with an ETag that changes when the fields change.
+    """
+
+    def get(url: str, headers: dict[str, str], **kwargs: Any) -> MagicMock:
+        response = MagicMock()
+        if url.endswith("records_api.json"):
+            response.status_code = list_status_code
+            response.headers = {"ETag": '"etag"', "Last-Modified": "Thu, 01 Jan 2026"}
+            response.json.return_value = {
+                "records": {
+                    dataset_id: {"api_url": f"https://{dataset_id}.example.com"}
+                    for dataset_id in documents
+                }
+            }
+            return response
+        dataset_id = url.removeprefix("https://").split(".")[0]
+        etag = (
+            f'"{hashlib.md5(json.dumps(documents[dataset_id]).encode()).hexdigest()}"'
+        )
+        response.headers = {"ETag": etag}
+        if headers.get("If-None-Match") == etag:
+            response.status_code = 304
+            return response
+        response.status_code = 200
+        response.json.return_value = {
+            "fields": {
+                "url": {"value": f"https://{dataset_id}.json"},
+                **{
+                    key: {"value": value}
+                    for key, value in documents[dataset_id].items()
+                },
+            }
+        }
+        return response
+
+    return MagicMock(side_effect=get)
+
+
+def _document(portal_title: Optional[str] = None) -> dict[str, Any]:
+    return {"country": "ab", "portal_title": portal_title, "portal_url": None}
+
+
+def test_fetch_registered_datasets_fetches_records_conditionally(
+    mocker: MockerFixture, snapshot_engine: Engine
+) -> None:
+    documents = {dataset_id: _document() for dataset_id in ["dataset_1", "dataset_2"]}
+    patch_get = mocker.patch(
+        "oc4ids_datastore_pipeline.registry.http_get", _mock_registry_get(documents)
+    )
+    fetch_registered_datasets()
+    assert patch_get.call_count == 3
+
+    documents["dataset_2"] = _document(portal_title="New Portal")
+    documents["dataset_3"] = _document()
+    patch_get = mocker.patch(
+        "oc4ids_datastore_pipeline.registry.http_get", _mock_registry_get(documents)
+    )
+
+    result = fetch_registered_datasets()
+
+    calls = {call.args[0]: call.kwargs for call in patch_get.call_args_list}
+    assert calls[
+        "https://opendataservices.github.io/oc4ids-registry/datatig/type/dataset/records_api.json"  # noqa: E501
+    ] == {
+        "headers": {
+            "If-None-Match": '"etag"',
+            "If-Modified-Since": "Thu, 01 Jan 2026",
+        }
+    }
+    assert "If-None-Match" in calls["https://dataset_1.example.com"]["headers"]
+    assert "If-None-Match" in calls["https://dataset_2.example.com"]["headers"]
+    assert calls["https://dataset_3.example.com"] == {"headers": {}}
+    assert {
+        dataset_id: metadata["portal_title"] for dataset_id, metadata in result.items()
+    } == {
+        "dataset_1": None,
+        "dataset_2": "New Portal",
+        "dataset_3": None,
+    }
+    assert result["dataset_1"]["source_url"] == "https://dataset_1.json"
+    registry_responses = {
+        registry_response.url: registry_response
+        for registry_response in get_registry_responses()
+    }
+    assert sorted(registry_responses) == [
+        "https://dataset_1.example.com",
+        "https://dataset_2.example.com",
+        "https://dataset_3.example.com",
+        "https://opendataservices.github.io/oc4ids-registry/datatig/type/dataset/records_api.json",  # noqa: E501
+    ]
+    assert registry_responses[DATASETS_LIST_URL].http_etag == '"etag"'
+    assert (
+        registry_responses["https://dataset_2.example.com"].content
+        == result["dataset_2"]
+    )
+
+
+def test_fetch_registered_datasets_fetches_changed_records_when_list_not_modified(
+    mocker: MockerFixture, snapshot_engine: Engine
+) -> None:
+    documents = {dataset_id: _document() for dataset_id in ["dataset_1", "dataset_2"]}
+    mocker.patch(
+        "oc4ids_datastore_pipeline.registry.http_get", _mock_registry_get(documents)
+    )
+    expected = fetch_registered_datasets()
+    documents["dataset_2"] = _document(portal_title="New Portal")
+    patch_get = mocker.patch(
+        "oc4ids_datastore_pipeline.registry.http_get",
+        _mock_registry_get(documents, list_status_code=304),
+    )
+
+    result = fetch_registered_datasets()
+
+    assert patch_get.call_count == 3
+    assert result["dataset_1"] == expected["dataset_1"]
+    assert result["dataset_2"]["portal_title"] == "New Portal"
+
+
+def test_fetch_registered_datasets_falls_back_to_snapshot(
+    mocker: MockerFixture, snapshot_engine: Engine
+) -> None:
+    mocker.patch(
+        "oc4ids_datastore_pipeline.registry.http_get",
+        _mock_registry_get({"dataset_1": _document()}),
+    )
+    expected = fetch_registered_datasets()
+    mocker.patch(
+        "oc4ids_datastore_pipeline.registry.http_get",
+        side_effect=Exception("Mocked exception"),
+    )
+
+    result = fetch_registered_datasets()
+
+    assert result == expected
+
+
 def test_fetch_registered_datasets_raises_failure_exception(
     mocker: MockerFixture,
 ) -> None:
-    patch_get = mocker.patch("oc4ids_datastore_pipeline.pipeline.requests.get")
+    patch_get = mocker.patch("oc4ids_datastore_pipeline.registry.http_get")
     patch_get.side_effect = Exception("Mocked exception")
 
     with pytest.raises(Exception) as exc_info:
@@ -66,7 +265,7 @@ def test_fetch_registered_datasets_raises_exception_when_no_datasets(
 ) -> None:
     mock_response = MagicMock()
     mock_response.json.return_value = {"records": {}}
-    patch_get = mocker.patch("oc4ids_datastore_pipeline.pipeline.requests.get")
+    patch_get = mocker.patch("oc4ids_datastore_pipeline.registry.http_get")
     patch_get.return_value = mock_response
 
     with pytest.raises(Exception) as exc_info:
@@ -118,7 +317,7 @@ def test_fetch_license_mappings(mocker: MockerFixture) -> None:
             },
         }
     }
-    patch_get = mocker.patch("oc4ids_datastore_pipeline.pipeline.requests.get")
+    patch_get = mocker.patch("oc4ids_datastore_pipeline.registry.http_get")
     patch_get.return_value = mock_response
 
     result = fetch_license_mappings()
@@ -142,7 +341,7 @@ def test_fetch_license_mappings(mocker: MockerFixture) -> None:
 def test_fetch_license_mappings_catches_exception(
     mocker: MockerFixture,
 ) -> None:
-    patch_get = mocker.patch("oc4ids_datastore_pipeline.pipeline.requests.get")
+    patch_get = mocker.patch("oc4ids_datastore_pipeline.registry.http_get")
     patch_get.side_effect = Exception("Mocked exception")
 
     result = fetch_license_mappings()
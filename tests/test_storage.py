@@ -1,17 +1,36 @@
+import gzip
+import hashlib
+import io
 import os
+import sys
 import tempfile
-from typing import Any
-from unittest.mock import MagicMock
+import threading
+import zipfile
+from typing import Any, Callable
+from unittest.mock import ANY, MagicMock
 
 import pytest
 from pytest_mock import MockerFixture
 
-from oc4ids_datastore_pipeline.storage import delete_files_for_dataset, upload_files
+from oc4ids_datastore_pipeline.storage import (
+    delete_files_for_dataset,
+    delete_files_for_datasets,
+    upload_files,
+)
+
+
+def fail_upload(bucket_path_suffix: str) -> Callable[..., None]:
+    def upload_file(local_path: str, bucket: str, bucket_path: str, **_: Any) -> None:
+        if bucket_path.endswith(bucket_path_suffix):
+            raise Exception("Mock exception")
+
+    return upload_file
 
 
 @pytest.fixture(autouse=True)
 def mock_client(mocker: MockerFixture) -> Any:
     os.environ["ENABLE_UPLOAD"] = "1"
+    mocker.patch("oc4ids_datastore_pipeline.storage._client", None)
     mock_boto3_client = MagicMock()
     patch_boto3_client = mocker.patch(
         "oc4ids_datastore_pipeline.storage.boto3.session.Session.client"
@@ -55,6 +74,7 @@ def test_upload_files_json(mock_client: MagicMock) -> None:
         "test-bucket",
         "test_dataset/test_dataset.json",
         ExtraArgs={"ACL": "public-read", "ContentType": "application/json"},
+        Config=ANY,
     )
     assert (
         json_public_url
@@ -64,8 +84,146 @@ def test_upload_files_json(mock_client: MagicMock) -> None:
     assert xlsx_public_url is None
 
 
+def read_upload(compressed: dict[str, bytes]) -> Callable[..., None]:
+    def upload_file(local_path: str, bucket: str, bucket_path: str, **_: Any) -> None:
+        with open(local_path, "rb") as file:
+            compressed[bucket_path] = file.read()
+
+    return upload_file
+
+
+def test_upload_files_json_gzip(
+    mock_client: MagicMock, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("UPLOAD_JSON_CONTENT_ENCODING", "gzip")
+    monkeypatch.setenv("UPLOAD_CACHE_CONTROL", "public, max-age=3600")
+    uploaded: dict[str, bytes] = {}
+    mock_client.upload_file.side_effect = read_upload(uploaded)
+    with tempfile.TemporaryDirectory() as dir:
+        json_path = os.path.join(dir, "test_dataset.json")
+        with open(json_path, "wb") as file:
+            file.write(b'{"projects": []}')
+
+        json_public_url, _, _ = upload_files("test_dataset", json_path=json_path)
+
+        assert os.listdir(dir) == ["test_dataset.json"]
+
+    mock_client.upload_file.assert_called_once_with(
+        f"{json_path}.gz",
+        "test-bucket",
+        "test_dataset/test_dataset.json",
+        ExtraArgs={
+            "ACL": "public-read",
+            "ContentType": "application/json",
+            "ContentEncoding": "gzip",
+            "CacheControl": "public, max-age=3600",
+        },
+        Config=ANY,
+    )
+    assert gzip.decompress(uploaded["test_dataset/test_dataset.json"]) == (
+        b'{"projects": []}'
+    )
+    assert (
+        json_public_url
+        == "https://test-bucket.test-region.digitaloceanspaces.com/test_dataset/test_dataset.json"  # noqa: E501
+    )
+
+
+def test_upload_files_json_gzip_is_deterministic(
+    mock_client: MagicMock, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("UPLOAD_JSON_CONTENT_ENCODING", "gzip")
+    uploaded: dict[str, bytes] = {}
+    mock_client.upload_file.side_effect = read_upload(uploaded)
+    with tempfile.TemporaryDirectory() as dir:
+        json_path = os.path.join(dir, "test_dataset.json")
+        with open(json_path, "wb") as file:
+            file.write(b'{"projects": []}')
+        upload_files("test_dataset", json_path=json_path)
+        etag = hashlib.md5(uploaded["test_dataset/test_dataset.json"]).hexdigest()
+        mock_client.head_object.return_value = {
+            "ETag": f'"{etag}"',
+            "ContentType": "application/json",
+            "ContentEncoding": "gzip",
+        }
+
+        upload_files("test_dataset", json_path=json_path)
+
+    mock_client.upload_file.assert_called_once()
+
+
+def test_upload_files_json_brotli(
+    mock_client: MagicMock, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    brotli = pytest.importorskip("brotli")
+    monkeypatch.setenv("UPLOAD_JSON_CONTENT_ENCODING", "br")
+    uploaded: dict[str, bytes] = {}
+    mock_client.upload_file.side_effect = read_upload(uploaded)
+    with tempfile.TemporaryDirectory() as dir:
+        json_path = os.path.join(dir, "test_dataset.json")
+        with open(json_path, "wb") as file:
+            file.write(b'{"projects": []}')
+
+        upload_files("test_dataset", json_path=json_path)
+
+    assert mock_client.upload_file.call_args.kwargs["ExtraArgs"] == {
+        "ACL": "public-read",
+        "ContentType": "application/json",
+        "ContentEncoding": "br",
+    }
+    assert brotli.decompress(uploaded["test_dataset/test_dataset.json"]) == (
+        b'{"projects": []}'
+    )
+
+
+def test_upload_files_json_brotli_falls_back_to_gzip(
+    mock_client: MagicMock, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("UPLOAD_JSON_CONTENT_ENCODING", "br")
+    monkeypatch.setitem(sys.modules, "brotli", None)
+    uploaded: dict[str, bytes] = {}
+    mock_client.upload_file.side_effect = read_upload(uploaded)
+    with tempfile.TemporaryDirectory() as dir:
+        json_path = os.path.join(dir, "test_dataset.json")
+        with open(json_path, "wb") as file:
+            file.write(b'{"projects": []}')
+
+        upload_files("test_dataset", json_path=json_path)
+
+    assert (
+        mock_client.upload_file.call_args.kwargs["ExtraArgs"]["ContentEncoding"]
+        == "gzip"
+    )
+    assert gzip.decompress(uploaded["test_dataset/test_dataset.json"]) == (
+        b'{"projects": []}'
+    )
+
+
+def test_upload_files_reuses_client_and_transfer_config(
+    mocker: MockerFixture, mock_client: MagicMock, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    patch_boto3_client = mocker.patch(
+        "oc4ids_datastore_pipeline.storage.boto3.session.Session.client"
+    )
+    patch_boto3_client.return_value = mock_client
+    monkeypatch.setenv("UPLOAD_MULTIPART_CHUNKSIZE", "16777216")
+    monkeypatch.setenv("UPLOAD_MAX_CONCURRENCY", "4")
+    monkeypatch.setenv("PIPELINE_WORKERS", "2")
+
+    upload_files("test_dataset", json_path="data/test_dataset/test_dataset.json")
+    upload_files("test_dataset", xlsx_path="data/test_dataset/test_dataset.xlsx")
+
+    patch_boto3_client.assert_called_once()
+    client_config = patch_boto3_client.call_args.kwargs["config"]
+    assert client_config.max_pool_connections == 3 * 4 * 2
+    assert mock_client.upload_file.call_count == 2
+    transfer_config = mock_client.upload_file.call_args.kwargs["Config"]
+    assert transfer_config.multipart_chunksize == 16777216
+    assert transfer_config.max_concurrency == 4
+
+
 def test_upload_files_json_catches_upload_exception(mock_client: MagicMock) -> None:
-    mock_client.upload_file.side_effect = [Exception("Mock exception"), None, None]
+    mock_client.upload_file.side_effect = fail_upload(".json")
 
     with tempfile.TemporaryDirectory() as csv_dir:
         json_public_url, csv_public_url, xlsx_public_url = upload_files(
@@ -85,18 +243,43 @@ def test_upload_files_json_catches_upload_exception(mock_client: MagicMock) -> N
         )
 
 
+def write_csv_files(csv_dir: str, contents: dict[str, bytes]) -> None:
+    for name, content in contents.items():
+        with open(os.path.join(csv_dir, name), "wb") as file:
+            file.write(content)
+
+
 def test_upload_files_csv(mock_client: MagicMock) -> None:
     with tempfile.TemporaryDirectory() as csv_dir:
+        write_csv_files(
+            csv_dir, {"projects.csv": b"id\r\n1\r\n", "parties.csv": b"id\r\n"}
+        )
         json_public_url, csv_public_url, xlsx_public_url = upload_files(
             "test_dataset", csv_path=csv_dir
         )
+        assert (
+            os.listdir(os.path.dirname(csv_dir)).count(
+                f"{os.path.basename(csv_dir)}_csv.zip"
+            )
+            == 0
+        )
 
-    mock_client.upload_file.assert_called_once_with(
-        f"{csv_dir}_csv.zip",
-        "test-bucket",
-        "test_dataset/test_dataset_csv.zip",
-        ExtraArgs={"ACL": "public-read", "ContentType": "application/zip"},
+    mock_client.upload_file.assert_not_called()
+    mock_client.put_object.assert_called_once_with(
+        Body=ANY,
+        Bucket="test-bucket",
+        Key="test_dataset/test_dataset_csv.zip",
+        ACL="public-read",
+        ContentType="application/zip",
+        Metadata={"fingerprint": ANY},
     )
+    body = mock_client.put_object.call_args.kwargs["Body"]
+    with zipfile.ZipFile(io.BytesIO(body)) as archive:
+        assert archive.namelist() == ["parties.csv", "projects.csv"]
+        assert archive.read("projects.csv") == b"id\r\n1\r\n"
+        assert all(
+            info.compress_type == zipfile.ZIP_DEFLATED for info in archive.infolist()
+        )
     assert json_public_url is None
     assert (
         csv_public_url
@@ -105,6 +288,112 @@ def test_upload_files_csv(mock_client: MagicMock) -> None:
     assert xlsx_public_url is None
 
 
+def test_upload_files_csv_multipart(
+    mock_client: MagicMock, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("UPLOAD_MULTIPART_THRESHOLD", "5242880")
+    monkeypatch.setenv("UPLOAD_MULTIPART_CHUNKSIZE", "5242880")
+    monkeypatch.setenv("UPLOAD_MAX_CONCURRENCY", "2")
+    content = os.urandom(12 * 1024 * 1024)
+    mock_client.create_multipart_upload.return_value = {"UploadId": "upload-id"}
+    mock_client.upload_part.side_effect = lambda **kwargs: {
+        "ETag": f"etag-{kwargs['PartNumber']}"
+    }
+
+    with tempfile.TemporaryDirectory() as csv_dir:
+        write_csv_files(csv_dir, {"projects.csv": content})
+        _, csv_public_url, _ = upload_files("test_dataset", csv_path=csv_dir)
+
+    mock_client.put_object.assert_not_called()
+    parts = sorted(
+        (call.kwargs for call in mock_client.upload_part.call_args_list),
+        key=lambda part: part["PartNumber"],
+    )
+    assert [part["PartNumber"] for part in parts] == [1, 2, 3]
+    assert all(len(part["Body"]) == 5242880 for part in parts[:-1])
+    mock_client.complete_multipart_upload.assert_called_once_with(
+        Bucket="test-bucket",
+        Key="test_dataset/test_dataset_csv.zip",
+        UploadId="upload-id",
+        MultipartUpload={
+            "Parts": [
+                {"ETag": "etag-1", "PartNumber": 1},
+                {"ETag": "etag-2", "PartNumber": 2},
+                {"ETag": "etag-3", "PartNumber": 3},
+            ]
+        },
+    )
+    body = b"".join(part["Body"] for part in parts)
+    with zipfile.ZipFile(io.BytesIO(body)) as archive:
+        assert archive.read("projects.csv") == content
+    assert csv_public_url is not None
+
+
+def test_upload_files_csv_multipart_uses_minimum_part_size(
+    mock_client: MagicMock, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("UPLOAD_MULTIPART_THRESHOLD", "1024")
+    monkeypatch.setenv("UPLOAD_MULTIPART_CHUNKSIZE", "1024")
+    mock_client.create_multipart_upload.return_value = {"UploadId": "upload-id"}
+    mock_client.upload_part.side_effect = lambda **kwargs: {
+        "ETag": f"etag-{kwargs['PartNumber']}"
+    }
+
+    with tempfile.TemporaryDirectory() as csv_dir:
+        write_csv_files(csv_dir, {"projects.csv": os.urandom(6 * 1024 * 1024)})
+        upload_files("test_dataset", csv_path=csv_dir)
+
+    parts = sorted(
+        (call.kwargs for call in mock_client.upload_part.call_args_list),
+        key=lambda part: part["PartNumber"],
+    )
+    assert [len(part["Body"]) for part in parts][:-1] == [5 * 1024 * 1024]
+
+
+def test_upload_files_csv_aborts_failed_multipart_upload(
+    mock_client: MagicMock, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("UPLOAD_MULTIPART_THRESHOLD", "5242880")
+    monkeypatch.setenv("UPLOAD_MULTIPART_CHUNKSIZE", "5242880")
+    mock_client.create_multipart_upload.return_value = {"UploadId": "upload-id"}
+    mock_client.upload_part.side_effect = Exception("Mock exception")
+
+    with tempfile.TemporaryDirectory() as csv_dir:
+        write_csv_files(csv_dir, {"projects.csv": os.urandom(12 * 1024 * 1024)})
+        _, csv_public_url, _ = upload_files("test_dataset", csv_path=csv_dir)
+
+    mock_client.complete_multipart_upload.assert_not_called()
+    mock_client.abort_multipart_upload.assert_called_once_with(
+        Bucket="test-bucket",
+        Key="test_dataset/test_dataset_csv.zip",
+        UploadId="upload-id",
+    )
+    assert csv_public_url is None
+
+
+def test_upload_files_csv_skips_unchanged_files(mock_client: MagicMock) -> None:
+    with tempfile.TemporaryDirectory() as csv_dir:
+        write_csv_files(csv_dir, {"projects.csv": b"id\r\n1\r\n"})
+        upload_files("test_dataset", csv_path=csv_dir)
+        metadata = mock_client.put_object.call_args.kwargs["Metadata"]
+        mock_client.head_object.return_value = {
+            "Metadata": metadata,
+            "ContentType": "application/zip",
+        }
+
+        _, csv_public_url, _ = upload_files("test_dataset", csv_path=csv_dir)
+        mock_client.put_object.assert_called_once()
+
+        write_csv_files(csv_dir, {"projects.csv": b"id\r\n2\r\n"})
+        upload_files("test_dataset", csv_path=csv_dir)
+
+    assert mock_client.put_object.call_count == 2
+    assert (
+        csv_public_url
+        == "https://test-bucket.test-region.digitaloceanspaces.com/test_dataset/test_dataset_csv.zip"  # noqa: E501
+    )
+
+
 def test_upload_files_csv_catches_zip_exception() -> None:
     json_public_url, csv_public_url, xlsx_public_url = upload_files(
         "test_dataset",
@@ -124,7 +413,7 @@ def test_upload_files_csv_catches_zip_exception() -> None:
 
 
 def test_upload_files_csv_catches_upload_exception(mock_client: MagicMock) -> None:
-    mock_client.upload_file.side_effect = [None, Exception("Mock exception"), None]
+    mock_client.put_object.side_effect = Exception("Mock exception")
 
     with tempfile.TemporaryDirectory() as csv_dir:
         json_public_url, csv_public_url, xlsx_public_url = upload_files(
@@ -157,6 +446,7 @@ def test_upload_files_xlsx(mock_client: MagicMock) -> None:
             "ACL": "public-read",
             "ContentType": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",  # noqa: E501
         },
+        Config=ANY,
     )
     assert json_public_url is None
     assert csv_public_url is None
@@ -167,7 +457,7 @@ def test_upload_files_xlsx(mock_client: MagicMock) -> None:
 
 
 def test_upload_files_xlsx_catches_upload_exception(mock_client: MagicMock) -> None:
-    mock_client.upload_file.side_effect = [None, None, Exception("Mock exception")]
+    mock_client.upload_file.side_effect = fail_upload(".xlsx")
 
     with tempfile.TemporaryDirectory() as csv_dir:
         json_public_url, csv_public_url, xlsx_public_url = upload_files(
@@ -187,6 +477,105 @@ def test_upload_files_xlsx_catches_upload_exception(mock_client: MagicMock) -> N
         assert xlsx_public_url is None
 
 
+def test_upload_files_uploads_concurrently(mock_client: MagicMock) -> None:
+    barrier = threading.Barrier(3, timeout=5)
+
+    def upload_file(*args: Any, **kwargs: Any) -> None:
+        # Fails unless all three uploads are in progress at the same time
+        barrier.wait()
+
+    mock_client.upload_file.side_effect = upload_file
+    mock_client.put_object.side_effect = upload_file
+
+    with tempfile.TemporaryDirectory() as csv_dir:
+        json_public_url, csv_public_url, xlsx_public_url = upload_files(
+            "test_dataset",
+            json_path="data/test_dataset/test_dataset.json",
+            csv_path=csv_dir,
+            xlsx_path="data/test_dataset/test_dataset.xlsx",
+        )
+
+    assert json_public_url is not None
+    assert csv_public_url is not None
+    assert xlsx_public_url is not None
+
+
+def test_upload_files_skips_unchanged_file(mock_client: MagicMock) -> None:
+    with tempfile.TemporaryDirectory() as dir:
+        json_path = os.path.join(dir, "test_dataset.json")
+        with open(json_path, "wb") as file:
+            file.write(b'{"projects": []}')
+        etag = hashlib.md5(b'{"projects": []}').hexdigest()
+        mock_client.head_object.return_value = {
+            "ETag": f'"{etag}"',
+            "ContentType": "application/json",
+        }
+
+        json_public_url, _, _ = upload_files("test_dataset", json_path=json_path)
+
+    mock_client.head_object.assert_called_once_with(
+        Bucket="test-bucket", Key="test_dataset/test_dataset.json"
+    )
+    mock_client.upload_file.assert_not_called()
+    assert (
+        json_public_url
+        == "https://test-bucket.test-region.digitaloceanspaces.com/test_dataset/test_dataset.json"  # noqa: E501
+    )
+
+
+def test_upload_files_uploads_unchanged_file_with_changed_headers(
+    mock_client: MagicMock, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    with tempfile.TemporaryDirectory() as dir:
+        json_path = os.path.join(dir, "test_dataset.json")
+        with open(json_path, "wb") as file:
+            file.write(b'{"projects": []}')
+        etag = hashlib.md5(b'{"projects": []}').hexdigest()
+        mock_client.head_object.return_value = {
+            "ETag": f'"{etag}"',
+            "ContentType": "application/json",
+        }
+        monkeypatch.setenv("UPLOAD_CACHE_CONTROL", "public, max-age=3600")
+
+        upload_files("test_dataset", json_path=json_path)
+
+    mock_client.upload_file.assert_called_once()
+    assert mock_client.upload_file.call_args.kwargs["ExtraArgs"]["CacheControl"] == (
+        "public, max-age=3600"
+    )
+
+
+def test_upload_files_uploads_changed_multipart_file(
+    mock_client: MagicMock, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("UPLOAD_MULTIPART_THRESHOLD", "5242880")
+    monkeypatch.setenv("UPLOAD_MULTIPART_CHUNKSIZE", "5242880")
+    content = b"x" * (5242880 + 1)
+    with tempfile.TemporaryDirectory() as dir:
+        xlsx_path = os.path.join(dir, "test_dataset.xlsx")
+        with open(xlsx_path, "wb") as file:
+            file.write(content)
+        part_digests = [
+            hashlib.md5(content[:5242880]).digest(),
+            hashlib.md5(content[5242880:]).digest(),
+        ]
+        multipart_etag = f'"{hashlib.md5(b"".join(part_digests)).hexdigest()}-2"'
+
+        mock_client.head_object.return_value = {
+            "ETag": multipart_etag,
+            "ContentType": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",  # noqa: E501
+        }
+        upload_files("test_dataset", xlsx_path=xlsx_path)
+        mock_client.upload_file.assert_not_called()
+
+        mock_client.head_object.return_value = {
+            "ETag": '"different"',
+            "ContentType": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",  # noqa: E501
+        }
+        upload_files("test_dataset", xlsx_path=xlsx_path)
+        mock_client.upload_file.assert_called_once()
+
+
 def test_delete_files_for_dataset(mock_client: MagicMock) -> None:
     mock_client.list_objects_v2.return_value = {
         "Contents": [
@@ -198,6 +587,9 @@ def test_delete_files_for_dataset(mock_client: MagicMock) -> None:
 
     delete_files_for_dataset("test_dataset")
 
+    mock_client.list_objects_v2.assert_called_once_with(
+        Bucket="test-bucket", Prefix="test_dataset/"
+    )
     mock_client.delete_objects.assert_called_once_with(
         Bucket="test-bucket",
         Delete={
@@ -205,11 +597,52 @@ def test_delete_files_for_dataset(mock_client: MagicMock) -> None:
                 {"Key": "test_dataset/test_dataset.json"},
                 {"Key": "test_dataset/test_dataset_csv.zip"},
                 {"Key": "test_dataset/test_dataset.xlsx"},
-            ]
+            ],
+            "Quiet": True,
         },
     )
 
 
+def test_delete_files_for_datasets_paginates_and_batches(
+    mock_client: MagicMock,
+) -> None:
+    def list_objects_v2(
+        Bucket: str, Prefix: str, ContinuationToken: str = "0"
+    ) -> dict[str, Any]:
+        # Two pages of 600 keys per dataset
+        page = int(ContinuationToken)
+        return {
+            "Contents": [{"Key": f"{Prefix}{page}_{i}"} for i in range(600)],
+            "IsTruncated": page == 0,
+            "NextContinuationToken": "1",
+        }
+
+    mock_client.list_objects_v2.side_effect = list_objects_v2
+
+    delete_files_for_datasets(["dataset_a", "dataset_b"])
+
+    assert mock_client.list_objects_v2.call_count == 4
+    batches = [
+        call.kwargs["Delete"]["Objects"]
+        for call in mock_client.delete_objects.call_args_list
+    ]
+    assert [len(batch) for batch in batches] == [1000, 1000, 400]
+    keys = [obj["Key"] for batch in batches for obj in batch]
+    assert len(set(keys)) == 2400
+    assert keys[0] == "dataset_a/0_0"
+    assert keys[-1] == "dataset_b/1_599"
+
+
+def test_delete_files_for_datasets_does_nothing_without_files(
+    mock_client: MagicMock,
+) -> None:
+    mock_client.list_objects_v2.return_value = {"KeyCount": 0}
+
+    delete_files_for_datasets(["dataset_a"])
+
+    mock_client.delete_objects.assert_not_called()
+
+
 def test_delete_files_for_dataset_catches_exception(mock_client: MagicMock) -> None:
     mock_client.list_objects_v2.side_effect = Exception("Mock exception")
 
@@ -0,0 +1,65 @@
+import csv
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from openpyxl.reader.excel import load_workbook
+
+from oc4ids_datastore_pipeline.transform import flatten_in_batches
+
+
+def test_flatten_in_batches_merges_sheets() -> None:
+    with tempfile.TemporaryDirectory() as dir:
+        json_path = os.path.join(dir, "test_dataset.json")
+        with open(json_path, "w") as file:
+            json.dump(
+                {
+                    "version": "0.9",
+                    "projects": [
+                        {"id": "1", "title": "Project 1"},
+                        {"id": "2", "parties": [{"id": "party_1", "name": "Party"}]},
+                        {"id": "3", "status": "completed"},
+                    ],
+                },
+                file,
+            )
+        csv_path = os.path.join(dir, "test_dataset")
+        xlsx_path = os.path.join(dir, "test_dataset.xlsx")
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            flatten_in_batches(
+                json_path,
+                csv_path=csv_path,
+                xlsx_path=xlsx_path,
+                batch_size=1,
+                executor=executor,
+                max_pending_batches=1,
+            )
+
+        assert sorted(os.listdir(csv_path)) == ["parties.csv", "projects.csv"]
+        with open(os.path.join(csv_path, "projects.csv"), newline="") as file:
+            assert list(csv.reader(file)) == [
+                ["id", "title", "status"],
+                ["1", "Project 1", ""],
+                ["2", "", ""],
+                ["3", "", "completed"],
+            ]
+        with open(os.path.join(csv_path, "parties.csv"), newline="") as file:
+            assert list(csv.reader(file)) == [
+                ["id", "parties/0/id", "parties/0/name"],
+                ["2", "party_1", "Party"],
+            ]
+        workbook = load_workbook(
+            xlsx_path, read_only=True
+        )  # type: ignore[no-untyped-call]
+        assert workbook.sheetnames == ["projects", "parties"]
+        rows = list(workbook["projects"].values)
+        assert len(rows) == 4
+        assert rows[0] == ("id", "title", "status")
+        assert rows[3] == ("3", None, "completed")
+        assert sorted(os.listdir(dir)) == [
+            "test_dataset",
+            "test_dataset.json",
+            "test_dataset.xlsx",
+        ]